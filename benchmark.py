@@ -2,16 +2,175 @@ import requests
 import time
 import json
 import concurrent.futures
+import threading
 import pandas as pd
 import datetime
 import matplotlib.pyplot as plt
-import boto3
+import argparse
+import random
+import asyncio
+import multiprocessing
+import resource
+from collections import Counter
+import aiohttp
+import numpy as np
+from cloudwatch import METRICS, MetricCollector
+from results_store import ResultStore
+from workload import Workload, load_query_log
+from utils.cluster import SAMPLER_PORT_OFFSET
 
-def send_request(url, query, is_write=False):
+MODES = ["RANDOM", "CUSTOMIZED", "DIRECT_HIT"]
+
+READ_QUERY = "SELECT * FROM actor LIMIT 1;"
+WRITE_QUERY = "INSERT INTO actor (first_name, last_name) VALUES (%s, %s);"
+WRITE_PARAMS = ["Test", "User"]
+
+def gatekeeper_url(gatekeeper_ip, path):
+    # "host" on an EC2 deployment, "host:port" on the local cluster harness
+    if ":" not in gatekeeper_ip:
+        gatekeeper_ip = f"{gatekeeper_ip}:5000"
+    return f"http://{gatekeeper_ip}{path}"
+
+def sampler_url(address, since):
+    # Every service's resource sampler listens on its port + SAMPLER_PORT_OFFSET
+    host, _, port = address.partition(":")
+    return f"http://{host}:{int(port or 5000) + SAMPLER_PORT_OFFSET}/samples?since={since}"
+
+class SpanCollector:
+    """
+    Collects the Server-Timing breakdowns returned by the gatekeeper and
+    aggregates them into per-hop latency percentiles.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}  # "<service>-<span>[<desc>]" -> durations in ms
+
+    def add(self, server_timing):
+        parsed = []
+        for entry in server_timing.split(","):
+            parts = [part.strip() for part in entry.split(";")]
+            name, duration, desc = parts[0], None, None
+            for part in parts[1:]:
+                if part.startswith("dur="):
+                    duration = float(part[4:])
+                elif part.startswith("desc="):
+                    desc = part[5:].strip('"')
+            if name and duration is not None:
+                parsed.append((f"{name}[{desc}]" if desc else name, duration))
+        with self.lock:
+            for name, duration in parsed:
+                self.spans.setdefault(name, []).append(duration)
+
+    def merge(self, spans):
+        """Add the spans collected by another process (its `spans` dict)."""
+        with self.lock:
+            for name, durations in spans.items():
+                self.spans.setdefault(name, []).extend(durations)
+
+    def summary(self):
+        with self.lock:
+            spans = {name: list(durations) for name, durations in self.spans.items()}
+        summary = {}
+        for name, durations in sorted(spans.items()):
+            series = pd.Series(durations)
+            summary[name] = {
+                "count": len(durations),
+                "p50_ms": series.quantile(0.5),
+                "p90_ms": series.quantile(0.9),
+                "p99_ms": series.quantile(0.99),
+                "max_ms": series.max(),
+            }
+        return summary
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of latencies in microseconds.
+
+    Values keep SUB_BUCKET_BITS significant bits (about 0.1% precision) at
+    any magnitude, so tails are exact enough without storing every sample.
+    Histograms can be merged and serialized to combine several runs.
+    """
+
+    SUB_BUCKET_BITS = 11
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}  # bucket key -> count
+        self.total = 0
+        self.max_us = 0
+
+    def _key(self, value_us):
+        shift = max(0, value_us.bit_length() - self.SUB_BUCKET_BITS)
+        return (shift << self.SUB_BUCKET_BITS) | (value_us >> shift)
+
+    def _highest_equivalent(self, key):
+        shift = key >> self.SUB_BUCKET_BITS
+        mantissa = key & ((1 << self.SUB_BUCKET_BITS) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        value_us = max(0, int(seconds * 1_000_000))
+        key = self._key(value_us)
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.total += 1
+            self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += other.total
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, percent):
+        """Latency in ms at or below which percent of the recorded values fall."""
+        if not self.total:
+            return None
+        threshold = max(1, int(round(self.total * percent / 100)))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= threshold:
+                return min(self._highest_equivalent(key), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "p99.9_ms": self.percentile(99.9),
+            "max_ms": self.max_us / 1000 if self.total else None,
+        }
+
+    def buckets_ms(self):
+        """Sorted (bucket values in ms, counts) arrays, each value the top of its bucket."""
+        keys = sorted(self.counts)
+        values = np.array([min(self._highest_equivalent(key), self.max_us) for key in keys]) / 1000
+        return values, np.array([self.counts[key] for key in keys])
+
+    def to_dict(self):
+        return {"counts": {str(k): v for k, v in self.counts.items()}, "max_us": self.max_us}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = {int(k): v for k, v in data["counts"].items()}
+        histogram.total = sum(histogram.counts.values())
+        histogram.max_us = data["max_us"]
+        return histogram
+
+def send_request(url, query, is_write=False, params=None, span_collector=None):
    try:
+       headers = {"X-Request-Timing": "1"} if span_collector else None
        start_time = time.time()
-       response = requests.post(url, json={"query": query})
+       response = requests.post(url, json={"query": query, "params": params or []}, headers=headers)
        end_time = time.time()
+
+       if span_collector and "Server-Timing" in response.headers:
+           span_collector.add(response.headers["Server-Timing"])
        
        return {
            "success": response.status_code == 200,
@@ -21,41 +180,161 @@ def send_request(url, query, is_write=False):
    except Exception as e:
        return {
            "success": False,
-           "time": 0,
+           "time": time.time() - start_time,
            "error": str(e),
            "type": "write" if is_write else "read"
        }
 
-def get_cpu_utilization(instance_id, start_time, end_time):
-  cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
-  response = cloudwatch.get_metric_statistics(
-      Namespace='AWS/EC2',
-      MetricName='CPUUtilization',
-      Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-      StartTime=start_time - datetime.timedelta(minutes=1),
-      EndTime=end_time + datetime.timedelta(minutes=2),
-      Period=20,  # Période de 20 secondes
-      Statistics=['Average']
-  )
-  return response['Datapoints']
-
-def run_benchmark(gatekeeper_ip, num_requests=1000):
-   url = f"http://{gatekeeper_ip}:5000/query"
+class ResourceMonitor:
+    """
+    Polls the resource sampler of every node while a run is in progress and
+    keeps their sub-second samples per role. Sample timestamps are wall clock
+    seconds, the same clock as the latency timeline of the open-loop runs.
+    """
+
+    def __init__(self, nodes, poll_interval=1.0):
+        self.nodes = nodes  # role -> address, as in public_ips.json
+        self.poll_interval = poll_interval
+        self.samples = {role: [] for role in nodes}
+        self.failed_polls = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.start_time = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.end_time = time.time()
+        self._poll()  # samples taken since the last poll
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self._poll()
+
+    def _poll(self):
+        for role, address in self.nodes.items():
+            samples = self.samples[role]
+            since = samples[-1]["ts"] if samples else self.start_time
+            try:
+                response = requests.get(sampler_url(address, since), timeout=5)
+                response.raise_for_status()
+                samples.extend(response.json())
+            except (requests.exceptions.RequestException, ValueError):
+                self.failed_polls[role] += 1
+
+    def summary(self):
+        summary = {}
+        for role, samples in self.samples.items():
+            if not samples:
+                summary[role] = {"samples": 0, "failed_polls": self.failed_polls[role]}
+                continue
+            first, last = samples[0], samples[-1]
+            span = max(last["ts"] - first["ts"], 1e-9)
+            cpu = pd.Series([sample["cpu_percent"] for sample in samples])
+            summary[role] = {
+                "samples": len(samples),
+                "failed_polls": self.failed_polls[role],
+                "cpu_percent_mean": cpu.mean(),
+                "cpu_percent_p99": cpu.quantile(0.99),
+                "cpu_percent_max": cpu.max(),
+                "process_cpu_percent_max": max(sample["process_cpu_percent"] for sample in samples),
+                "rss_bytes_max": max(sample.get("rss_bytes", 0) for sample in samples),
+                "ctx_switches_per_s": (
+                    last.get("ctx_switches_voluntary", 0) + last.get("ctx_switches_involuntary", 0)
+                    - first.get("ctx_switches_voluntary", 0) - first.get("ctx_switches_involuntary", 0)
+                ) / span,
+                "net_rx_bytes_per_s": (last["net_rx_bytes"] - first["net_rx_bytes"]) / span,
+                "net_tx_bytes_per_s": (last["net_tx_bytes"] - first["net_tx_bytes"]) / span,
+            }
+            mysql = [sample["mysql"] for sample in samples if "error" not in sample.get("mysql", {"error": None})]
+            if mysql:
+                # Threads_* are gauges, every other status counter is cumulative
+                summary[role]["mysql"] = {
+                    name: max(status[name] for status in mysql) if name.startswith("Threads_")
+                    else (mysql[-1][name] - mysql[0][name]) / span
+                    for name in mysql[-1]
+                }
+        return summary
+
+    def report(self):
+        return {
+            "start": self.start_time,
+            "end": self.end_time,
+            "summary": self.summary(),
+            "samples": self.samples,
+        }
+
+def plot_node_cpu(ax, samples):
+    for role, role_samples in samples.items():
+        if role_samples:
+            times = [datetime.datetime.fromtimestamp(sample["ts"]) for sample in role_samples]
+            ax.plot(times, [sample["cpu_percent"] for sample in role_samples], label=role)
+    ax.set_ylabel("CPU Utilization (%)")
+    ax.grid(True)
+    ax.legend()
+
+def plot_timeline(report, filename):
+    """Per-second p50/p99 latency of an open-loop run above the CPU of every node."""
+    plt.switch_backend('Agg')
+    fig, (latency_ax, cpu_ax) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+    answered = [second for second in report["timeline"] if second["ok"]]
+    times = [datetime.datetime.fromtimestamp(second["ts"]) for second in answered]
+    for name in ("p50_ms", "p99_ms"):
+        latency_ax.plot(times, [second[name] for second in answered], label=name)
+    latency_ax.set_ylabel("Latency (ms)")
+    latency_ax.grid(True)
+    latency_ax.legend()
+    plot_node_cpu(cpu_ax, report["resources"]["samples"])
+    cpu_ax.set_xlabel("Time")
+    fig.savefig(filename)
+    plt.close(fig)
+
+def plot_cloudwatch(series, filename):
+    """One panel per CloudWatch metric, one line per instance."""
+    plt.switch_backend('Agg')
+    fig, axes = plt.subplots(len(METRICS), 1, figsize=(12, 3 * len(METRICS)), sharex=True)
+    for ax, metric in zip(axes, METRICS):
+        for name, metrics in sorted(series.items()):
+            if metrics[metric]:
+                times, values = zip(*metrics[metric])
+                ax.plot(times, values, label=name)
+        ax.set_ylabel(metric)
+        ax.grid(True)
+    axes[0].legend()
+    axes[-1].set_xlabel("Time")
+    fig.savefig(filename)
+    plt.close(fig)
+
+def run_benchmark(gatekeeper_ip, num_requests=1000, trace=False):
+   url = gatekeeper_url(gatekeeper_ip, "/query")
    
-   read_query = "SELECT * FROM actor LIMIT 1;"
-   write_query = "INSERT INTO actor (first_name, last_name) VALUES ('Test', 'User');"
+   read_query = READ_QUERY
+   write_query = WRITE_QUERY
+   write_params = WRITE_PARAMS
    
    results = []
+   span_collector = SpanCollector() if trace else None
    time.sleep(1) #temps d'attente entre les tests
    
    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
        read_futures = [
-           executor.submit(send_request, url, read_query, False)
+           executor.submit(send_request, url, read_query, False, None, span_collector)
            for _ in range(num_requests)
        ]
        
        write_futures = [
-           executor.submit(send_request, url, write_query, True)
+           executor.submit(send_request, url, write_query, True, write_params, span_collector)
            for _ in range(num_requests)
        ]
        
@@ -74,85 +353,864 @@ def run_benchmark(gatekeeper_ip, num_requests=1000):
            "success_rate": (df[df["type"] == "write"]["success"].sum() / num_requests) * 100
         }
     }
+   if span_collector:
+       analysis["spans"] = span_collector.summary()
    return analysis
 
-def run_benchmark_with_monitoring(gatekeeper_ip, instances, mode):
+def classify_error(response=None, exception=None):
+    if exception is not None:
+        if isinstance(exception, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(exception, requests.exceptions.ConnectionError):
+            return "connection"
+        return type(exception).__name__
+    return f"http_{response.status_code}"
+
+def drive_open_loop(gatekeeper_ip, schedule, max_in_flight=1000, timeout=30, span_collector=None):
+    """
+    Send every (offset seconds, kind, query, params) of schedule at its
+    intended time, regardless of how fast the cluster answers, measuring each
+    latency from the intended send time so queueing delay is not hidden
+    (coordinated omission). Returns per-kind stats, the run start time and
+    a per-second timeline keyed by wall clock second: latencies and errors by
+    second of the intended send, completed requests by second of completion.
+    With a span_collector, every request asks for its Server-Timing breakdown.
+    """
+    url = gatekeeper_url(gatekeeper_ip, "/query")
+    headers = {"X-Request-Timing": "1"} if span_collector else None
+    stats = {
+        kind: {"histogram": LatencyHistogram(), "errors": Counter(), "sent": 0}
+        for kind in ("read", "write")
+    }
+    errors_lock = threading.Lock()
+    timeline = {}
+
+    def timeline_bucket(second):
+        # Called with errors_lock held
+        if second not in timeline:
+            timeline[second] = {"histogram": LatencyHistogram(), "errors": 0, "completed": 0}
+        return timeline[second]
+
+    def issue(kind, query, params, intended_time, second):
+        error = None
+        try:
+            response = requests.post(url, json={"query": query, "params": params}, headers=headers,
+                                     timeout=timeout)
+            if response.status_code != 200:
+                error = classify_error(response=response)
+            elif span_collector and "Server-Timing" in response.headers:
+                span_collector.add(response.headers["Server-Timing"])
+        except Exception as e:
+            error = classify_error(exception=e)
+
+        latency = time.perf_counter() - intended_time
+        with errors_lock:
+            bucket = timeline_bucket(second)
+            if error is None:
+                timeline_bucket(int(time.time()))["completed"] += 1
+            else:
+                stats[kind]["errors"][error] += 1
+                bucket["errors"] += 1
+        if error is None:
+            stats[kind]["histogram"].record(latency)
+            bucket["histogram"].record(latency)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        start = time.perf_counter()
+        wall_start = time.time()
+        for offset, kind, query, params in schedule:
+            intended_time = start + offset
+            delay = intended_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            stats[kind]["sent"] += 1
+            executor.submit(issue, kind, query, params, intended_time, int(wall_start + offset))
+    return stats, start, timeline
+
+def timeline_report(timeline):
+    report = []
+    for second, bucket in sorted(timeline.items()):
+        latency = bucket["histogram"].summary()
+        report.append({
+            "ts": second,
+            "ok": latency["count"],
+            "errors": bucket["errors"],
+            "completed": bucket["completed"],
+            "p50_ms": latency["p50_ms"],
+            "p99_ms": latency["p99_ms"],
+            "max_ms": latency["max_ms"],
+        })
+    return report
+
+def open_loop_report(stats, elapsed, **fields):
+    report = dict(fields, elapsed=elapsed)
+    for kind, kind_stats in stats.items():
+        histogram = kind_stats["histogram"]
+        report[kind] = {
+            "sent": kind_stats["sent"],
+            "throughput": histogram.total / elapsed,
+            "errors": dict(kind_stats["errors"]),
+            "latency": histogram.summary(),
+            "histogram": histogram.to_dict(),
+        }
+    return report
+
+def run_open_loop(gatekeeper_ip, rate, duration, read_ratio=0.5, arrival="uniform",
+                  max_in_flight=1000, timeout=30, seed=None, workload=None, trace=False):
+    """Open-loop run at a fixed (or Poisson) arrival rate over a workload's queries."""
+    rng = random.Random(seed)
+    workload = workload or Workload.default(read_ratio)
+
+    def schedule():
+        offset = 0
+        sent = 0
+        while offset < duration:
+            kind, _, query, params = workload.next_query(rng)
+            yield offset, kind, query, params
+            sent += 1
+            # Uniform offsets are computed, not summed, so rounding never adds a request
+            offset = offset + rng.expovariate(rate) if arrival == "poisson" else sent / rate
+
+    span_collector = SpanCollector() if trace else None
+    stats, start, timeline = drive_open_loop(gatekeeper_ip, schedule(), max_in_flight, timeout, span_collector)
+    # The last request is sent up to one interval before the end of the run
+    elapsed = max(time.perf_counter() - start, duration)
+    report = open_loop_report(
+        stats, elapsed, offered_rate=rate, duration=duration, workload=workload.name,
+        timeline=timeline_report(timeline),
+    )
+    if span_collector:
+        report["spans"] = span_collector.summary()
+    return report
+
+def run_replay(gatekeeper_ip, log_path, speed=1.0, max_in_flight=1000, timeout=30, trace=False):
+    """Replay a recorded query log, keeping its original timing divided by speed."""
+    entries = load_query_log(log_path)
+    schedule = ((offset / speed, kind, query, params) for offset, kind, query, params in entries)
+    span_collector = SpanCollector() if trace else None
+    stats, start, timeline = drive_open_loop(gatekeeper_ip, schedule, max_in_flight, timeout, span_collector)
+
+    duration = entries[-1][0] / speed if entries else 0
+    elapsed = max(time.perf_counter() - start, duration, 1e-9)
+    report = open_loop_report(
+        stats, elapsed, offered_rate=len(entries) / duration if duration else 0,
+        duration=duration, log=log_path, speed=speed, timeline=timeline_report(timeline),
+    )
+    if span_collector:
+        report["spans"] = span_collector.summary()
+    return report
+
+def print_spans(report):
+    for name, span in report.get("spans", {}).items():
+        print(f"  {name:32s} n={span['count']} p50={span['p50_ms']:.2f} p99={span['p99_ms']:.2f} "
+              f"max={span['max_ms']:.2f} ms")
+
+def print_open_loop_report(report):
+    print(f"Offered {report['offered_rate']:.0f} req/s for {report['duration']}s "
+          f"(drained in {report['elapsed']:.1f}s)")
+    for kind in ("read", "write"):
+        latency = report[kind]["latency"]
+        print(f"  {kind:5s} sent={report[kind]['sent']} ok={latency['count']} "
+              f"throughput={report[kind]['throughput']:.1f}/s errors={report[kind]['errors']}")
+        if latency["count"]:
+            print("        " + " ".join(
+                f"{name}={latency[name]:.2f}" for name in ("p50_ms", "p90_ms", "p99_ms", "p99.9_ms", "max_ms")
+            ))
+    print_spans(report)
+
+def run_saturation_search(gatekeeper_ip, start_rate=10, step=10, max_rate=2000, step_duration=30,
+                          slo_p99_ms=50, error_budget=0.01, read_ratio=0.5, workload=None):
+    """
+    Raise the offered load step by step until the p99 latency SLO or the
+    error budget is violated, or the cluster stops keeping up with the
+    offered rate. Returns the latency-vs-load curve and the highest
+    throughput that met the SLO.
+    """
+    curve = []
+    max_sustainable = None
+    rate = start_rate
+    while rate <= max_rate:
+        report = run_open_loop(gatekeeper_ip, rate, step_duration, read_ratio=read_ratio, workload=workload)
+
+        histogram = LatencyHistogram()
+        errors = 0
+        sent = 0
+        for kind in ("read", "write"):
+            histogram.merge(LatencyHistogram.from_dict(report[kind]["histogram"]))
+            errors += sum(report[kind]["errors"].values())
+            sent += report[kind]["sent"]
+
+        throughput = histogram.total / report["elapsed"]
+        p99 = histogram.percentile(99)
+        point = {
+            "offered_rate": rate,
+            "throughput": throughput,
+            "p50_ms": histogram.percentile(50),
+            "p99_ms": p99,
+            "p99.9_ms": histogram.percentile(99.9),
+            "error_rate": errors / sent if sent else 0.0,
+        }
+        violations = []
+        if p99 is None or p99 > slo_p99_ms:
+            violations.append("latency")
+        if point["error_rate"] > error_budget:
+            violations.append("errors")
+        if throughput < 0.95 * rate:
+            violations.append("throughput")
+        point["violations"] = violations
+        curve.append(point)
+        print(f"  offered={rate:.0f}/s throughput={throughput:.1f}/s p99={p99}ms "
+              f"errors={point['error_rate']:.2%} {'VIOLATED ' + ','.join(violations) if violations else 'ok'}")
+
+        if violations:
+            break
+        max_sustainable = throughput
+        rate += step
+
+    return {
+        "slo_p99_ms": slo_p99_ms,
+        "error_budget": error_budget,
+        "max_sustainable_throughput": max_sustainable,
+        "curve": curve,
+    }
+
+def plot_latency_vs_load(results, filename="latency_vs_load.png"):
+    plt.switch_backend('Agg')
+    plt.figure(figsize=(12, 6))
+    for mode, result in results.items():
+        curve = [point for point in result["curve"] if point["p99_ms"] is not None]
+        plt.plot([point["throughput"] for point in curve], [point["p99_ms"] for point in curve],
+                 marker="o", label=mode)
+    slo = next(iter(results.values()))["slo_p99_ms"]
+    plt.axhline(slo, color="red", linestyle="--", label=f"SLO p99 < {slo} ms")
+    plt.title('p99 latency vs throughput')
+    plt.xlabel('Throughput (req/s)')
+    plt.ylabel('p99 latency (ms)')
+    plt.grid(True)
+    plt.legend()
+    plt.savefig(filename)
+    plt.close()
+
+def plot_scaling(table, filename="scaling.png"):
+    """Each metric of the scaling table against the worker count, one line per mode."""
     plt.switch_backend('Agg')
-    
-    # Commencer à mesurer avant le benchmark
-    start_time = datetime.datetime.utcnow()
-    time.sleep(60)  
-    
-    # Exécuter le benchmark avec plus de requêtes
-    results = run_benchmark(gatekeeper_ip, num_requests=1000)
-    time.sleep(180)  # attendre pour cloudwatch
-    
-    end_time = datetime.datetime.utcnow()
-
-    cpu_data = {}
-    for instance in instances:
-        data = get_cpu_utilization(
-            instance.instance.id, 
-            start_time, 
-            end_time
-        )
-        # Garder uniquement les données pendant le benchmark
-        cpu_data[instance.name] = sorted(data, key=lambda x: x['Timestamp'])
-        print(f"Retrieved {len(data)} datapoints for {instance.name}")
-
-    # Créer le graphique uniquement s'il y a des données
-    if any(len(data) > 0 for data in cpu_data.values()):
-        plt.figure(figsize=(12, 6))
-        for instance_name, data in cpu_data.items():
-            if data:  # Vérifier si nous avons des données pour cette instance
-                times = [d['Timestamp'] for d in data]
-                cpu = [d['Average'] for d in data]
-                plt.plot(times, cpu, label=instance_name)
-        
-        plt.title(f'CPU Utilization - {mode} Mode')
-        plt.xlabel('Time')
-        plt.ylabel('CPU Utilization (%)')
-        plt.grid(True)
-        plt.legend()
-        plt.savefig(f'cpu_utilization_{mode}.png')
-        plt.close()
+    metrics = [column for column in ("throughput", "p99_ms") if column in table]
+    fig, axes = plt.subplots(len(metrics), 1, figsize=(12, 4 * len(metrics)), sharex=True, squeeze=False)
+    for ax, metric in zip(axes[:, 0], metrics):
+        for mode, rows in table.groupby("mode"):
+            ax.plot(rows["workers"], rows[metric], marker="o", label=mode)
+        ax.set_ylabel(metric)
+        ax.grid(True)
+        ax.legend()
+    axes[-1, 0].set_xlabel("Workers")
+    fig.savefig(filename)
+    plt.close(fig)
+
+def raise_open_files_limit():
+    # Every virtual user holds a socket, lift the soft fd limit as far as allowed
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+async def virtual_user(session, url, stats, workload, think_time, measure_from, stop_at, rng,
+                       span_collector=None):
+    headers = {"X-Request-Timing": "1"} if span_collector else None
+    while time.perf_counter() < stop_at:
+        kind, _, query, params = workload.next_query(rng)
+        start = time.perf_counter()
+        error = None
+        try:
+            async with session.post(url, json={"query": query, "params": params}, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    error = f"http_{response.status}"
+                elif span_collector and start >= measure_from and "Server-Timing" in response.headers:
+                    span_collector.add(response.headers["Server-Timing"])
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except aiohttp.ClientConnectionError:
+            error = "connection"
+        except Exception as e:
+            error = type(e).__name__
+        end = time.perf_counter()
+
+        # Only the steady-state phase is measured, ramp-up is warm-up
+        if start >= measure_from:
+            if error is None:
+                stats[kind]["histogram"].record(end - start)
+            else:
+                stats[kind]["errors"][error] += 1
+
+        if think_time:
+            await asyncio.sleep(rng.expovariate(1 / think_time))
+
+async def async_driver(gatekeeper_ip, users, ramp_up, steady_state, workload_spec, think_time, timeout, seed,
+                       trace=False):
+    url = gatekeeper_url(gatekeeper_ip, "/query")
+    span_collector = SpanCollector() if trace else None
+    rng = random.Random(seed)
+    workload = Workload(workload_spec)
+    stats = {
+        kind: {"histogram": LatencyHistogram(), "errors": Counter()}
+        for kind in ("read", "write")
+    }
+    # One keep-alive pool per driver, shared by all its virtual users
+    connector = aiohttp.TCPConnector(limit=users, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        start = time.perf_counter()
+        measure_from = start + ramp_up
+        stop_at = measure_from + steady_state
+        tasks = []
+        for i in range(users):
+            # Users join evenly over the ramp-up phase
+            delay = start + ramp_up * i / users - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(virtual_user(
+                session, url, stats, workload, think_time, measure_from, stop_at,
+                random.Random(rng.random()), span_collector,
+            )))
+        await asyncio.gather(*tasks)
+
+    result = {
+        kind: {
+            "histogram": kind_stats["histogram"].to_dict(),
+            "errors": dict(kind_stats["errors"]),
+        }
+        for kind, kind_stats in stats.items()
+    }
+    # Raw durations, the parent merges the drivers before taking percentiles
+    if span_collector:
+        result["spans"] = span_collector.spans
+    return result
+
+def _run_async_driver(driver_args):
+    raise_open_files_limit()
+    return asyncio.run(async_driver(*driver_args))
+
+def run_async_benchmark(gatekeeper_ip, users, processes=1, ramp_up=10, steady_state=60,
+                        read_ratio=0.5, think_time=None, timeout=30, workload=None, trace=False):
+    """
+    Drive the cluster with `users` concurrent virtual users spread over
+    `processes` asyncio driver processes, then merge their histograms.
+    think_time=None takes the workload's think time, if it sets one.
+    """
+    workload = workload or Workload.default(read_ratio)
+    if think_time is None:
+        think_time = workload.think_time or 0
+    driver_args = []
+    for i in range(processes):
+        driver_users = users // processes + (1 if i < users % processes else 0)
+        driver_args.append((
+            gatekeeper_ip, driver_users, ramp_up, steady_state, workload.spec, think_time, timeout, i, trace,
+        ))
+
+    with multiprocessing.Pool(processes) as pool:
+        driver_results = pool.map(_run_async_driver, driver_args)
+
+    report = {
+        "users": users, "processes": processes, "ramp_up": ramp_up, "steady_state": steady_state,
+        "workload": workload.name, "think_time": think_time,
+    }
+    for kind in ("read", "write"):
+        histogram = LatencyHistogram()
+        errors = Counter()
+        for result in driver_results:
+            histogram.merge(LatencyHistogram.from_dict(result[kind]["histogram"]))
+            errors.update(result[kind]["errors"])
+        report[kind] = {
+            "throughput": histogram.total / steady_state,
+            "errors": dict(errors),
+            "latency": histogram.summary(),
+            "histogram": histogram.to_dict(),
+        }
+    if trace:
+        span_collector = SpanCollector()
+        for result in driver_results:
+            span_collector.merge(result["spans"])
+        report["spans"] = span_collector.summary()
+    return report
+
+def print_async_report(report):
+    print(f"{report['users']} virtual users on {report['processes']} driver process(es), "
+          f"{report['steady_state']}s steady state, {report['think_time']}s mean think time")
+    for kind in ("read", "write"):
+        latency = report[kind]["latency"]
+        print(f"  {kind:5s} ok={latency['count']} throughput={report[kind]['throughput']:.1f}/s "
+              f"errors={report[kind]['errors']}")
+        if latency["count"]:
+            print("        " + " ".join(
+                f"{name}={latency[name]:.2f}" for name in ("p50_ms", "p90_ms", "p99_ms", "p99.9_ms", "max_ms")
+            ))
+    print_spans(report)
+
+def bootstrap_percentile(histogram, percent, resamples, rng):
+    """Percentile of `resamples` multinomial resamples of a histogram's buckets."""
+    values, counts = histogram.buckets_ms()
+    draws = rng.multinomial(histogram.total, counts / histogram.total, size=resamples)
+    threshold = max(1, int(round(histogram.total * percent / 100)))
+    return values[(draws.cumsum(axis=1) < threshold).sum(axis=1)]
+
+def bootstrap_mean(series, resamples, rng):
+    return rng.choice(series, size=(resamples, len(series))).mean(axis=1)
+
+# Recorded options that do not change the load a run puts on the cluster
+UNCOMPARED_CONFIG = {"store", "output", "modes", "monitor"}
+
+def config_differences(runs, baseline, candidate):
+    """
+    {option: (baseline value, candidate value)} of the command and recorded
+    options two runs differ in. Options only one of the runs recorded (added
+    since) are left out.
+    """
+    settings = {}
+    for run_id in (baseline, candidate):
+        row = runs[runs["run_id"] == run_id].iloc[0]
+        settings[run_id] = dict(json.loads(row["config"]), command=row["command"])
+    shared = (settings[baseline].keys() & settings[candidate].keys()) - UNCOMPARED_CONFIG
+    return {
+        key: (settings[baseline][key], settings[candidate][key])
+        for key in sorted(shared) if settings[baseline][key] != settings[candidate][key]
+    }
+
+def compare_runs(store, baseline, candidate, modes=None, alpha=0.05, min_change=0.05,
+                 resamples=2000, seed=0, allow_mismatch=False):
+    """
+    Compare the throughput and p50/p99 latencies of two stored runs mode by
+    mode. The difference of each metric is bootstrapped (latency from the
+    histogram buckets, throughput from the per-second timeline of open-loop
+    runs): a change is significant when its 1 - alpha confidence interval
+    excludes zero, and a regression when it is also worse by more than
+    min_change.
+
+    Runs of a different command or settings (workload, rate, users, ...) are
+    rejected with a ValueError unless allow_mismatch, and so are modes
+    missing from either run.
+    """
+    rng = np.random.default_rng(seed)
+    runs = store.runs()
+    baseline_modes = set(runs[runs["run_id"] == baseline]["mode"])
+    candidate_modes = set(runs[runs["run_id"] == candidate]["mode"])
+    for run_id, run_modes in ((baseline, baseline_modes), (candidate, candidate_modes)):
+        if not run_modes:
+            raise KeyError(f"No run {run_id} in {store.root}")
+    differences = config_differences(runs, baseline, candidate)
+    if differences and not allow_mismatch:
+        raise ValueError("Runs are not comparable, they differ in " + ", ".join(
+            f"{key} ({base!r} -> {cand!r})" for key, (base, cand) in differences.items()
+        ))
+    missing = set(modes or ()) - (baseline_modes & candidate_modes)
+    if missing:
+        raise ValueError(f"Modes {', '.join(sorted(missing))} are not in both runs")
+
+    findings = []
+
+    def add(mode, metric, base_value, candidate_value, differences, higher_is_worse):
+        change = (candidate_value - base_value) / base_value if base_value else None
+        finding = {
+            "mode": mode, "metric": metric, "baseline": base_value, "candidate": candidate_value,
+            "change": change, "ci_low": None, "ci_high": None, "significant": None, "regression": False,
+        }
+        if differences is not None:
+            low, high = np.quantile(differences, [alpha / 2, 1 - alpha / 2])
+            finding.update(ci_low=float(low), ci_high=float(high), significant=bool(low > 0 or high < 0))
+            worse = low > 0 if higher_is_worse else high < 0
+            finding["regression"] = bool(
+                worse and change is not None and abs(change) > min_change
+            )
+        findings.append(finding)
+
+    for mode in sorted(modes or (baseline_modes & candidate_modes)):
+        histograms = {
+            run_id: store.load("histograms", run_id, mode) for run_id in (baseline, candidate)
+        }
+        for kind in ("read", "write"):
+            rows = {run_id: frame[frame["kind"] == kind] for run_id, frame in histograms.items()}
+            if any(frame.empty for frame in rows.values()):
+                continue
+            base_hist, candidate_hist = (
+                LatencyHistogram.from_dict({
+                    "counts": dict(zip(frame["bucket"], frame["count"])),
+                    "max_us": int(frame["max_us"].max()),
+                })
+                for frame in (rows[baseline], rows[candidate])
+            )
+            for percent in (50, 99):
+                differences = (
+                    bootstrap_percentile(candidate_hist, percent, resamples, rng)
+                    - bootstrap_percentile(base_hist, percent, resamples, rng)
+                )
+                add(mode, f"{kind}_p{percent}_ms", base_hist.percentile(percent),
+                    candidate_hist.percentile(percent), differences, higher_is_worse=True)
+
+        # Per-second completions, without the partial first and last seconds
+        per_second = {}
+        for run_id in (baseline, candidate):
+            timeline = store.load("timeline", run_id, mode)
+            if "completed" in timeline:
+                per_second[run_id] = timeline.sort_values("ts")["completed"].to_numpy()[1:-1]
+            else:
+                per_second[run_id] = np.array([])
+        if all(len(series) >= 2 for series in per_second.values()):
+            differences = (
+                bootstrap_mean(per_second[candidate], resamples, rng)
+                - bootstrap_mean(per_second[baseline], resamples, rng)
+            )
+            add(mode, "throughput", float(per_second[baseline].mean()),
+                float(per_second[candidate].mean()), differences, higher_is_worse=False)
+        else:
+            # No timeline (async, legacy runs): report the change, no significance
+            rows = runs[runs["mode"] == mode].set_index("run_id")
+            if "read_throughput" in rows:
+                totals = {
+                    run_id: rows.loc[run_id, "read_throughput"] + rows.loc[run_id, "write_throughput"]
+                    for run_id in (baseline, candidate)
+                }
+                if not any(pd.isna(total) for total in totals.values()):
+                    add(mode, "throughput", totals[baseline], totals[candidate], None, higher_is_worse=False)
+
+    return findings
+
+def print_comparison(baseline, candidate, findings):
+    print(f"Baseline {baseline} -> candidate {candidate}")
+    for finding in findings:
+        change = f"{finding['change']:+.1%}" if finding["change"] is not None else "n/a"
+        if finding["significant"] is None:
+            verdict = "no significance test"
+        else:
+            verdict = (f"CI [{finding['ci_low']:+.2f}, {finding['ci_high']:+.2f}] "
+                       f"{'significant' if finding['significant'] else 'not significant'}")
+        flag = "REGRESSION " if finding["regression"] else ""
+        print(f"  {flag}{finding['mode']:10s} {finding['metric']:14s} "
+              f"{finding['baseline']:.2f} -> {finding['candidate']:.2f} ({change}) {verdict}")
+
+def set_mode(gatekeeper_ip, mode):
+    requests.post(gatekeeper_url(gatekeeper_ip, "/mode"), json={"mode": mode})
+
+def run_benchmark_with_monitoring(gatekeeper_ip, nodes, mode):
+    plt.switch_backend('Agg')
+
+    # The samplers stream sub-second samples, no need to wait for CloudWatch
+    with ResourceMonitor(nodes, poll_interval=0.5) as monitor:
+        results = run_benchmark(gatekeeper_ip, num_requests=1000, trace=True)
+    results["resources"] = monitor.summary()
+
+    for role, samples in monitor.samples.items():
+        print(f"Retrieved {len(samples)} samples for {role}")
+
+    if any(monitor.samples.values()):
+        fig, ax = plt.subplots(figsize=(12, 6))
+        plot_node_cpu(ax, monitor.samples)
+        ax.set_title(f'CPU Utilization - {mode} Mode')
+        ax.set_xlabel('Time')
+        fig.savefig(f'cpu_utilization_{mode}.png')
+        plt.close(fig)
 
     return results
 
-def test_all_modes(gatekeeper_ip, sql_instances):
-   modes = ["RANDOM","CUSTOMIZED", "DIRECT_HIT"]
+def test_all_modes(gatekeeper_ip, nodes):
+   modes = MODES
    results = {}
    
    for mode in modes:
        print(f"\nTesting {mode} mode...")
        # Set mode
-       requests.post(f"http://{gatekeeper_ip}:5000/mode", json={"mode": mode})
+       set_mode(gatekeeper_ip, mode)
        
        # Run benchmark
-       results[mode] = run_benchmark_with_monitoring(gatekeeper_ip, sql_instances, mode)
+       results[mode] = run_benchmark_with_monitoring(gatekeeper_ip, nodes, mode)
        print(f"Read requests: {results[mode]['read']}")
        print(f"Write requests: {results[mode]['write']}")
        
    
    return results
 
+def parse_args():
+   parser = argparse.ArgumentParser(description="Benchmark the DB cluster through the gatekeeper")
+   parser.add_argument("--store", default="benchmark_store", help="directory of the Parquet result store")
+   subparsers = parser.add_subparsers(dest="command")
+
+   open_loop = subparsers.add_parser("open-loop", help="fixed arrival rate, percentile latencies")
+   open_loop.add_argument("--rate", type=float, default=100, help="requests per second")
+   open_loop.add_argument("--duration", type=float, default=60, help="seconds of load")
+   open_loop.add_argument("--read-ratio", type=float, default=0.5)
+   open_loop.add_argument("--workload", help="JSON workload file, default is the actor select/insert pair")
+   open_loop.add_argument("--arrival", choices=["uniform", "poisson"], default="uniform")
+   open_loop.add_argument("--max-in-flight", type=int, default=1000)
+   open_loop.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+   open_loop.add_argument("--trace", action="store_true", help="collect the per-hop Server-Timing breakdown of every request")
+   open_loop.add_argument("--monitor", action="store_true", help="sample CPU, memory, network and MySQL on every node")
+   open_loop.add_argument("--output", default="benchmark_open_loop_results.json")
+
+   saturation = subparsers.add_parser("saturation", help="step the load up until the SLO breaks")
+   saturation.add_argument("--start-rate", type=float, default=10)
+   saturation.add_argument("--step", type=float, default=10, help="rate increase per step")
+   saturation.add_argument("--max-rate", type=float, default=2000)
+   saturation.add_argument("--step-duration", type=float, default=30, help="seconds per step")
+   saturation.add_argument("--slo-p99-ms", type=float, default=50)
+   saturation.add_argument("--error-budget", type=float, default=0.01, help="max error ratio")
+   saturation.add_argument("--read-ratio", type=float, default=0.5)
+   saturation.add_argument("--workload", help="JSON workload file, default is the actor select/insert pair")
+   saturation.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+   saturation.add_argument("--monitor", action="store_true", help="sample CPU, memory, network and MySQL on every node")
+   saturation.add_argument("--output", default="benchmark_saturation_results.json")
+
+   async_load = subparsers.add_parser("async", help="asyncio virtual users across driver processes")
+   async_load.add_argument("--users", type=int, default=1000, help="concurrent virtual users")
+   async_load.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+   async_load.add_argument("--ramp-up", type=float, default=10, help="seconds to start all users")
+   async_load.add_argument("--steady-state", type=float, default=60, help="seconds measured")
+   async_load.add_argument("--think-time", type=float,
+                           help="mean pause between requests, overrides the workload's (default 0)")
+   async_load.add_argument("--read-ratio", type=float, default=0.5)
+   async_load.add_argument("--workload", help="JSON workload file, default is the actor select/insert pair")
+   async_load.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+   async_load.add_argument("--trace", action="store_true", help="collect the per-hop Server-Timing breakdown of every request")
+   async_load.add_argument("--monitor", action="store_true", help="sample CPU, memory, network and MySQL on every node")
+   async_load.add_argument("--output", default="benchmark_async_results.json")
+
+   replay = subparsers.add_parser("replay", help="replay a JSON lines query log")
+   replay.add_argument("log", help="one {\"ts\", \"query\", \"params\"} object per line")
+   replay.add_argument("--speed", type=float, default=1.0, help="2 replays twice as fast")
+   replay.add_argument("--max-in-flight", type=int, default=1000)
+   replay.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+   replay.add_argument("--trace", action="store_true", help="collect the per-hop Server-Timing breakdown of every request")
+   replay.add_argument("--monitor", action="store_true", help="sample CPU, memory, network and MySQL on every node")
+   replay.add_argument("--output", default="benchmark_replay_results.json")
+
+   cloudwatch = subparsers.add_parser("cloudwatch", help="plot CloudWatch CPU, network and disk metrics of every instance")
+   cloudwatch.add_argument("--run", help="run id of the store whose time window to plot, default is the last --minutes")
+   cloudwatch.add_argument("--minutes", type=float, default=60)
+   cloudwatch.add_argument("--period", type=int, default=60, help="seconds per datapoint")
+   cloudwatch.add_argument("--instances", default="instance_info.json", help="instance ids written by main.py")
+   cloudwatch.add_argument("--cache", default="cloudwatch_cache", help="directory of the metric cache")
+   cloudwatch.add_argument("--output", default="cloudwatch_metrics.png")
+
+   scaling = subparsers.add_parser("scaling", help="how each mode scales with the worker count, across stored runs")
+   scaling.add_argument("--command", dest="scaling_command", default="saturation",
+                        help="runs of this command are compared (saturation: max sustainable throughput)")
+   scaling.add_argument("--output", default="scaling.png")
+
+   subparsers.add_parser("runs", help="list the runs of the result store")
+
+   compare = subparsers.add_parser("compare", help="flag regressions of a run against a baseline run")
+   compare.add_argument("baseline", help="run id of the baseline")
+   compare.add_argument("candidate", help="run id of the run to check")
+   compare.add_argument("--modes", nargs="+", choices=MODES, help="default is the modes both runs have")
+   compare.add_argument("--alpha", type=float, default=0.05, help="1 - confidence level of the intervals")
+   compare.add_argument("--min-change", type=float, default=0.05,
+                        help="smallest relative change reported as a regression")
+   compare.add_argument("--resamples", type=int, default=2000, help="bootstrap resamples")
+   compare.add_argument("--allow-mismatch", action="store_true",
+                        help="compare runs of a different command or settings, with a warning")
+
+   return parser.parse_args()
+
+def record_results(args, results, ips):
+   # The worker and proxy counts are part of the config, "scaling" compares runs by them
+   config = dict(
+       vars(args),
+       workers=sum(1 for role in ips if role.startswith("worker")),
+       proxies=sum(1 for role in ips if role.startswith("proxy")),
+   )
+   run_id = ResultStore(args.store).record_run(args.command or "all-modes", config, results)
+   print(f"Recorded run {run_id} in {args.store}")
+
+def load_workload(args):
+   return Workload.load(args.workload) if args.workload else None
+
+def monitored(ips, args, run):
+   """Run a benchmark, attaching the resource samples of every node with --monitor."""
+   if not args.monitor:
+       return run()
+   with ResourceMonitor(ips) as monitor:
+       report = run()
+   report["resources"] = monitor.report()
+   return report
+
+def open_loop_command(ips, args):
+   results = {}
+   for mode in args.modes:
+       print(f"\nOpen-loop run in {mode} mode...")
+       set_mode(ips["gatekeeper"], mode)
+       results[mode] = monitored(ips, args, lambda: run_open_loop(
+           ips["gatekeeper"], args.rate, args.duration, read_ratio=args.read_ratio,
+           arrival=args.arrival, max_in_flight=args.max_in_flight, workload=load_workload(args),
+           trace=args.trace,
+       ))
+       print_open_loop_report(results[mode])
+       if args.monitor:
+           plot_timeline(results[mode], f"timeline_{mode}.png")
+
+   with open(args.output, "w") as f:
+       json.dump(results, f, indent=4)
+   record_results(args, results, ips)
+
+def saturation_command(ips, args):
+   results = {}
+   for mode in args.modes:
+       print(f"\nSaturation search in {mode} mode...")
+       set_mode(ips["gatekeeper"], mode)
+       results[mode] = monitored(ips, args, lambda: run_saturation_search(
+           ips["gatekeeper"], start_rate=args.start_rate, step=args.step, max_rate=args.max_rate,
+           step_duration=args.step_duration, slo_p99_ms=args.slo_p99_ms,
+           error_budget=args.error_budget, read_ratio=args.read_ratio, workload=load_workload(args),
+       ))
+       print(f"Max sustainable throughput: {results[mode]['max_sustainable_throughput']}")
+
+   plot_latency_vs_load(results)
+   with open(args.output, "w") as f:
+       json.dump(results, f, indent=4)
+   record_results(args, results, ips)
+
+def async_command(ips, args):
+   results = {}
+   for mode in args.modes:
+       print(f"\nAsync run in {mode} mode...")
+       set_mode(ips["gatekeeper"], mode)
+       results[mode] = monitored(ips, args, lambda: run_async_benchmark(
+           ips["gatekeeper"], args.users, processes=args.processes, ramp_up=args.ramp_up,
+           steady_state=args.steady_state, read_ratio=args.read_ratio, think_time=args.think_time,
+           workload=load_workload(args), trace=args.trace,
+       ))
+       print_async_report(results[mode])
+
+   with open(args.output, "w") as f:
+       json.dump(results, f, indent=4)
+   record_results(args, results, ips)
+
+def replay_command(ips, args):
+   results = {}
+   for mode in args.modes:
+       print(f"\nReplaying {args.log} at {args.speed}x in {mode} mode...")
+       set_mode(ips["gatekeeper"], mode)
+       results[mode] = monitored(ips, args, lambda: run_replay(
+           ips["gatekeeper"], args.log, speed=args.speed, max_in_flight=args.max_in_flight,
+           trace=args.trace,
+       ))
+       print_open_loop_report(results[mode])
+       if args.monitor:
+           plot_timeline(results[mode], f"timeline_{mode}.png")
+
+   with open(args.output, "w") as f:
+       json.dump(results, f, indent=4)
+   record_results(args, results, ips)
+
+def all_modes_command(ips, args):
+   results = test_all_modes(ips["gatekeeper"], ips)
+   
+   with open("benchmark_results.json", "w") as f:
+       json.dump(results, f, indent=4)
+   record_results(args, results, ips)
+
+def run_window(store, run_id):
+   """First and last second of a stored run, from its timeline or resource samples."""
+   for table in ("timeline", "resources"):
+       rows = store.load(table, run_id)
+       if not rows.empty:
+           return (datetime.datetime.fromtimestamp(rows["ts"].min(), datetime.timezone.utc),
+                   datetime.datetime.fromtimestamp(rows["ts"].max(), datetime.timezone.utc))
+   raise SystemExit(f"Run {run_id} has no timeline or resource samples to take its time window from")
+
+def cloudwatch_command(args):
+   with open(args.instances, "r") as f:
+       instances = {name: info["instance_id"] for name, info in json.load(f).items()}
+   if args.run:
+       start, end = run_window(ResultStore(args.store), args.run)
+   else:
+       end = datetime.datetime.now(datetime.timezone.utc)
+       start = end - datetime.timedelta(minutes=args.minutes)
+
+   series = MetricCollector(cache_dir=args.cache).collect(instances, start, end, period=args.period)
+   for name, metrics in sorted(series.items()):
+       print(f"Retrieved {sum(len(points) for points in metrics.values())} datapoints for {name}")
+   plot_cloudwatch(series, args.output)
+
+def scaling_table(runs, command):
+   """
+   Latest run of each mode and worker count for one command: max sustainable
+   throughput for saturation runs, read + write throughput and the worse
+   p99 of the two otherwise.
+   """
+   runs = runs[runs["command"] == command].copy()
+   if runs.empty:
+       return pd.DataFrame()
+   runs["workers"] = runs["config"].map(lambda config: json.loads(config).get("workers"))
+   runs = runs.dropna(subset=["workers"])  # recorded before the worker count was
+   if command == "saturation":
+       runs["throughput"] = runs["summary"].map(
+           lambda summary: json.loads(summary).get("max_sustainable_throughput"))
+   else:
+       runs["throughput"] = runs["read_throughput"] + runs["write_throughput"]
+       runs["p99_ms"] = runs[["read_p99_ms", "write_p99_ms"]].max(axis=1)
+   columns = [column for column in ("mode", "workers", "throughput", "p99_ms", "run_id") if column in runs]
+   latest = runs.groupby(["mode", "workers"]).tail(1)  # runs are oldest first
+   return latest[columns].astype({"workers": int}).sort_values(["mode", "workers"])
+
+def scaling_command(args):
+   table = scaling_table(ResultStore(args.store).runs(), args.scaling_command)
+   if table.empty:
+       print(f"No {args.scaling_command} runs with a worker count in {args.store}")
+       return
+   print(table.to_string(index=False))
+   plot_scaling(table, args.output)
+
+def runs_command(args):
+   runs = ResultStore(args.store).runs()
+   if runs.empty:
+       print(f"No runs in {args.store}")
+       return
+   columns = [column for column in (
+       "run_id", "recorded_at", "command", "mode", "git_revision",
+       "read_throughput", "read_p99_ms", "write_throughput", "write_p99_ms",
+   ) if column in runs]
+   runs = runs[columns].assign(git_revision=runs["git_revision"].str[:10])
+   print(runs.to_string(index=False))
+
+def compare_command(args):
+   store = ResultStore(args.store)
+   try:
+       findings = compare_runs(
+           store, args.baseline, args.candidate, modes=args.modes, alpha=args.alpha,
+           min_change=args.min_change, resamples=args.resamples, allow_mismatch=args.allow_mismatch,
+       )
+   except ValueError as e:
+       # 2, not 1: a CI job gating on regressions must not read this as one
+       print(e)
+       return 2
+   for key, (base, cand) in config_differences(store.runs(), args.baseline, args.candidate).items():
+       print(f"Warning: runs differ in {key}: {base!r} -> {cand!r}")
+   print_comparison(args.baseline, args.candidate, findings)
+   # Non-zero exit status on regressions, so a CI job can gate on it
+   return 1 if any(finding["regression"] for finding in findings) else 0
+
 if __name__ == "__main__":
+   args = parse_args()
+
+   if args.command == "runs":
+       runs_command(args)
+       raise SystemExit(0)
+   if args.command == "compare":
+       raise SystemExit(compare_command(args))
+   if args.command == "scaling":
+       scaling_command(args)
+       raise SystemExit(0)
+   if args.command == "cloudwatch":
+       cloudwatch_command(args)
+       raise SystemExit(0)
+
    with open("public_ips.json", "r") as f:
        ips = json.load(f)
-   
-   with open("instance_info.json", "r") as f:
-       instance_info = json.load(f)
-   
-   from collections import namedtuple
-   Instance = namedtuple('Instance', ['name', 'instance'])
-   InstanceData = namedtuple('InstanceData', ['id'])
-   
-   sql_instances = []
-   for name in ['manager', 'worker1', 'worker2']:
-       instance_data = InstanceData(id=instance_info[name]['instance_id'])
-       sql_instances.append(Instance(name=name, instance=instance_data))
-   
-   results = test_all_modes(ips["gatekeeper"], sql_instances)
-   
-   with open("benchmark_results.json", "w") as f:
-       json.dump(results, f, indent=4)
\ No newline at end of file
+
+   if args.command == "open-loop":
+       open_loop_command(ips, args)
+   elif args.command == "saturation":
+       saturation_command(ips, args)
+   elif args.command == "async":
+       async_command(ips, args)
+   elif args.command == "replay":
+       replay_command(ips, args)
+   else:
+       all_modes_command(ips, args)
@@ -0,0 +1,90 @@
+import shlex
+
+from bundle import bundle_name, install_commands
+from utils.cluster import PRIVATE_ADDRESSES_FILE
+
+# Every node serves its bootstrap progress here, from the first seconds of boot:
+#   GET /ready   200 once the node's service answers, 404 before
+#   GET /failed  200 with the name of the step that failed, 404 otherwise
+#   GET /step    the step running now
+READINESS_PORT = 8000
+STATUS_DIR = "/var/lib/cluster-node"
+
+# Run as root on the manager and workers while they boot
+MYSQL_SETUP = [
+    "apt-get update",
+    "DEBIAN_FRONTEND=noninteractive apt-get install -y mysql-server sysbench",
+    "sed -i 's/bind-address.*/bind-address = 0.0.0.0/' /etc/mysql/mysql.conf.d/mysqld.cnf",
+    'mysql -e \'ALTER USER "root"@"localhost" IDENTIFIED WITH mysql_native_password BY "root_password";\'',
+    "systemctl restart mysql",
+    "systemctl enable mysql",
+    'mysql -u root -p"root_password" -e \'CREATE USER IF NOT EXISTS "root"@"%" IDENTIFIED BY "root_password";\'',
+    'mysql -u root -p"root_password" -e "GRANT ALL PRIVILEGES ON *.* TO \'root\'@\'%\';"',
+    'mysql -u root -p"root_password" -e "FLUSH PRIVILEGES;"',
+    'echo "MYSQL_USER=root" >> /etc/environment',
+    'echo "MYSQL_PASSWORD=root_password" >> /etc/environment',
+    'echo "MYSQL_DB=sakila" >> /etc/environment',
+    'echo "MYSQL_HOST=localhost" >> /etc/environment',
+]
+
+# Run as root once the bundle is installed in the home directory
+SAKILA_LOAD = [
+    'mysql -u root -p"root_password" -e "CREATE DATABASE IF NOT EXISTS sakila;"',
+    'mysql -u root -p"root_password" sakila -e "source sakila-db/sakila-schema.sql"',
+    'mysql -u root -p"root_password" sakila -e "source sakila-db/sakila-data.sql"',
+]
+
+
+def user_data_script(role, bundle_path, needs_addresses, port=5000, home="/home/ubuntu"):
+    """
+    The cloud-init user-data a node of this role configures itself with
+    while it boots: system packages first (MySQL on the database roles),
+    then, once the deployment has pushed them, the offline bundle and
+    private_ips.json, then the service itself. Progress is served on
+    READINESS_PORT, so the deployment only has to poll it.
+    """
+    name = bundle_name(bundle_path)
+    version = name.rsplit("-", 1)[1]
+    database = role in ("manager", "worker")
+
+    lines = [
+        "#!/bin/bash",
+        f"# {role} node bootstrap, generated by main.py",
+        "set -eo pipefail",
+        f"mkdir -p {STATUS_DIR}",
+        f"(cd {STATUS_DIR} && nohup python3 -m http.server {READINESS_PORT} > /dev/null 2>&1 &)",
+        f'step() {{ echo "$1" > {STATUS_DIR}/step; }}',
+        f"trap 'cp {STATUS_DIR}/step {STATUS_DIR}/failed' ERR",
+        f"cd {home}",
+    ]
+    if database:
+        lines.append("step mysql")
+        lines += MYSQL_SETUP
+
+    # The archive name carries the start of its SHA-256, a partial upload never matches it
+    lines += [
+        "step wait_for_bundle",
+        f'until [ -f {name}.tar.gz ] && [ "$(sha256sum {name}.tar.gz | cut -c1-12)" = {version} ]; do sleep 2; done',
+    ]
+    if needs_addresses:
+        lines.append(f"until [ -s {PRIVATE_ADDRESSES_FILE} ]; do sleep 2; done")
+
+    lines.append("step install")
+    lines += [f"sudo -u ubuntu -H bash -c {shlex.quote(command)}" for command in install_commands(bundle_path)]
+    if database:
+        lines.append("step sakila")
+        lines.append(f"tar -xzf {name}/sakila-db.tar.gz")
+        lines += SAKILA_LOAD
+
+    service = f"{role}.py"
+    lines += [
+        "step start",
+        f"sudo -u ubuntu -H bash -c {shlex.quote(f'cd {home} && nohup python3 {service} > {role}_output.log 2>&1 &')}",
+        # A service that does not come up within a minute fails the start step
+        f"for attempt in $(seq 60); do curl -sf http://localhost:{port}/ > /dev/null && break; sleep 1; done",
+        f"curl -sf http://localhost:{port}/ > /dev/null",
+        "step ready",
+        f"touch {STATUS_DIR}/ready",
+    ]
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import tempfile
+import urllib.request
+
+# Packages the services import, resolved for the nodes rather than this machine:
+# Ubuntu 20.04 AMIs run CPython 3.8 on x86_64 with glibc 2.31
+NODE_PACKAGES = ["flask", "mysql-connector-python", "requests"]
+NODE_PYTHON_VERSION = "3.8"
+NODE_PLATFORMS = ["manylinux_2_28_x86_64", "manylinux2014_x86_64"]
+
+SAKILA_URL = "https://downloads.mysql.com/docs/sakila-db.tar.gz"
+
+BUILD_DIR = "build"
+
+
+def _project(name):
+    # Package or wheel file name -> project name normalized as in PEP 503,
+    # "Flask-3.0.3-py3-none-any.whl" -> "flask"
+    if name.endswith(".whl"):
+        name = name.split("-", 1)[0]
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def download_wheels(wheelhouse, packages=NODE_PACKAGES):
+    """Wheels of the packages and their dependencies for the nodes' interpreter."""
+    os.makedirs(wheelhouse, exist_ok=True)
+    command = [
+        sys.executable, "-m", "pip", "download",
+        "--only-binary=:all:",
+        "--implementation", "cp",
+        "--python-version", NODE_PYTHON_VERSION,
+    ]
+    for platform in NODE_PLATFORMS:
+        command += ["--platform", platform]
+    # Resolved into an empty directory, so what it holds afterwards is exactly
+    # this resolution, whatever pip prints. pip's cache spares the downloads
+    with tempfile.TemporaryDirectory(dir=wheelhouse) as fresh:
+        subprocess.run(command + ["--dest", fresh] + packages, check=True, capture_output=True, text=True)
+        names = sorted(name for name in os.listdir(fresh) if name.endswith(".whl"))
+        missing = sorted({_project(package) for package in packages} - {_project(name) for name in names})
+        if missing:
+            raise RuntimeError(f"pip resolved no wheel for {', '.join(missing)}")
+        for name in names:
+            os.replace(os.path.join(fresh, name), os.path.join(wheelhouse, name))
+    return [os.path.join(wheelhouse, name) for name in names]
+
+
+def download_sakila(cache_dir):
+    path = os.path.join(cache_dir, os.path.basename(SAKILA_URL))
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        with urllib.request.urlopen(SAKILA_URL, timeout=60) as response, open(path + ".tmp", "wb") as f:
+            f.write(response.read())
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def _add_bytes(archive, name, data):
+    # Fixed ownership and times, so identical contents make an identical archive
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    archive.addfile(info, io.BytesIO(data))
+
+
+def build_bundle(service_files, build_dir=BUILD_DIR):
+    """
+    Build the one artifact every node installs from, without network access:
+
+        wheelhouse/<wheel>.whl  the packages of NODE_PACKAGES and their dependencies
+        sakila-db.tar.gz        the sample database
+        app/<file>              the service code, under its base name
+        SHA256SUMS              checksums of every file above, in sha256sum format
+
+    The archive is reproducible and named after the hash of its content,
+    build/cluster-bundle-<version>.tar.gz, so rebuilding unchanged inputs
+    gives the same file and nodes that have it already are skipped.
+    Returns its path.
+    """
+    wheels = download_wheels(os.path.join(build_dir, "wheelhouse"))
+    sakila = download_sakila(os.path.join(build_dir, "cache"))
+
+    members = [(f"wheelhouse/{os.path.basename(path)}", path) for path in wheels]
+    members.append((os.path.basename(sakila), sakila))
+    members += [(f"app/{os.path.basename(path)}", path) for path in sorted(set(service_files))]
+
+    contents = {}
+    for name, path in members:
+        with open(path, "rb") as f:
+            contents[name] = f.read()
+    checksums = "".join(
+        f"{hashlib.sha256(data).hexdigest()}  {name}\n" for name, data in sorted(contents.items())
+    )
+
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as compressed:
+        with tarfile.open(fileobj=compressed, mode="w") as archive:
+            for name in sorted(contents):
+                _add_bytes(archive, name, contents[name])
+            _add_bytes(archive, "SHA256SUMS", checksums.encode())
+
+    data = buffer.getvalue()
+    version = hashlib.sha256(data).hexdigest()[:12]
+    path = os.path.join(build_dir, f"cluster-bundle-{version}.tar.gz")
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    print(f"Bundle {path}: {len(wheels)} wheels, {len(data) / 1e6:.1f} MB")
+    return path
+
+
+def bundle_name(bundle_path):
+    """cluster-bundle-<version>, the directory a node unpacks the bundle into."""
+    return os.path.basename(bundle_path)[: -len(".tar.gz")]
+
+
+def install_commands(bundle_path):
+    """
+    Shell commands unpacking a pushed bundle on a node, offline. Wheels are
+    zip archives laid out for site-packages, so extracting them into the
+    user site directory installs them for the services without pip; none of
+    the packages needs its console scripts. A node that already installed
+    this version does nothing.
+    """
+    name = bundle_name(bundle_path)
+    return [
+        f"test -f {name}/.installed || ("
+        f"rm -rf {name} && mkdir {name} && tar -xzf {name}.tar.gz -C {name}"
+        f" && (cd {name} && sha256sum --quiet -c SHA256SUMS)"
+        f" && site=$(python3 -m site --user-site) && mkdir -p $site"
+        f" && for wheel in {name}/wheelhouse/*.whl; do python3 -m zipfile -e $wheel $site || exit 1; done"
+        f" && cp {name}/app/* ."
+        f" && touch {name}/.installed)",
+    ]
+
@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+
+import boto3
+
+# EC2 metric -> statistic. t2 instances only have EBS volumes, which CloudWatch
+# reports under EBSReadBytes/EBSWriteBytes on Nitro types and not at all on Xen ones
+METRICS = {
+    "CPUUtilization": "Average",
+    "NetworkIn": "Sum",
+    "NetworkOut": "Sum",
+    "EBSReadBytes": "Sum",
+    "EBSWriteBytes": "Sum",
+}
+
+# get_metric_data accepts at most 500 queries per request
+MAX_QUERIES = 500
+
+
+def _epoch(moment):
+    return int(moment.timestamp())
+
+
+class MetricCollector:
+    """
+    CloudWatch metrics of many instances at once. Time is cut into windows
+    aligned on `window` seconds; for each window one paginated
+    get_metric_data request fetches every metric of every instance not
+    cached yet. Windows old enough for CloudWatch to have settled are
+    cached on disk, one file per instance and window:
+
+        <cache_dir>/<instance_id>/<window start>-<window end>-<period>.json
+    """
+
+    def __init__(self, cache_dir="cloudwatch_cache", region_name="us-east-1",
+                 window=3600, settle=900, client=None):
+        self.cache_dir = cache_dir
+        self.window = window
+        self.settle = settle  # seconds after which CloudWatch no longer revises datapoints
+        self.client = client or boto3.client("cloudwatch", region_name=region_name)
+
+    def _cache_path(self, instance_id, window_start, period):
+        return os.path.join(
+            self.cache_dir, instance_id, f"{window_start}-{window_start + self.window}-{period}.json"
+        )
+
+    def _fetch(self, instance_ids, window_start, period):
+        """{instance id: {metric: [[epoch, value], ...]}} of one window, in one paginated request."""
+        queries = {}
+        for instance_id in instance_ids:
+            for metric, statistic in METRICS.items():
+                queries[f"m{len(queries)}"] = (instance_id, metric, {
+                    "Id": f"m{len(queries)}",
+                    "MetricStat": {
+                        "Metric": {
+                            "Namespace": "AWS/EC2",
+                            "MetricName": metric,
+                            "Dimensions": [{"Name": "InstanceId", "Value": instance_id}],
+                        },
+                        "Period": period,
+                        "Stat": statistic,
+                    },
+                })
+
+        series = {instance_id: {metric: [] for metric in METRICS} for instance_id in instance_ids}
+        ids = list(queries)
+        paginator = self.client.get_paginator("get_metric_data")
+        for chunk in range(0, len(ids), MAX_QUERIES):
+            pages = paginator.paginate(
+                MetricDataQueries=[queries[query_id][2] for query_id in ids[chunk:chunk + MAX_QUERIES]],
+                StartTime=datetime.datetime.fromtimestamp(window_start, datetime.timezone.utc),
+                EndTime=datetime.datetime.fromtimestamp(window_start + self.window, datetime.timezone.utc),
+                ScanBy="TimestampAscending",
+            )
+            for page in pages:
+                for result in page["MetricDataResults"]:
+                    instance_id, metric, _ = queries[result["Id"]]
+                    series[instance_id][metric] += [
+                        [_epoch(timestamp), value]
+                        for timestamp, value in zip(result["Timestamps"], result["Values"])
+                    ]
+        for metrics in series.values():
+            for points in metrics.values():
+                points.sort()
+        return series
+
+    def collect(self, instances, start, end, period=60):
+        """
+        {name: {metric: [(datetime, value), ...]}} between start and end
+        for instances given as {name: instance id}.
+        """
+        first = _epoch(start) // self.window * self.window
+        settled = _epoch(datetime.datetime.now(datetime.timezone.utc)) - self.settle
+        collected = {instance_id: {metric: [] for metric in METRICS} for instance_id in instances.values()}
+
+        for window_start in range(first, _epoch(end), self.window):
+            cached, missing = {}, []
+            for instance_id in instances.values():
+                path = self._cache_path(instance_id, window_start, period)
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        cached[instance_id] = json.load(f)
+                else:
+                    missing.append(instance_id)
+
+            if missing:
+                fetched = self._fetch(missing, window_start, period)
+                if window_start + self.window <= settled:
+                    for instance_id, metrics in fetched.items():
+                        path = self._cache_path(instance_id, window_start, period)
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        with open(path, "w") as f:
+                            json.dump(metrics, f)
+                cached.update(fetched)
+
+            for instance_id, metrics in cached.items():
+                for metric, points in metrics.items():
+                    collected[instance_id][metric] += [
+                        (datetime.datetime.fromtimestamp(ts, datetime.timezone.utc), value)
+                        for ts, value in points
+                        if _epoch(start) <= ts <= _epoch(end)
+                    ]
+
+        return {name: collected[instance_id] for name, instance_id in instances.items()}
@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+import requests
+
+UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils")
+BENCHMARK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.py")
+
+# Subset of the sakila schema, with the column names of the real database
+SAKILA_SUBSET_SCHEMA = """
+CREATE TABLE actor (
+    actor_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE category (
+    category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE film (
+    film_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT,
+    release_year INTEGER,
+    language_id INTEGER NOT NULL,
+    rental_duration INTEGER NOT NULL DEFAULT 3,
+    rental_rate REAL NOT NULL DEFAULT 4.99,
+    length INTEGER,
+    replacement_cost REAL NOT NULL DEFAULT 19.99,
+    rating TEXT DEFAULT 'G',
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE film_actor (
+    actor_id INTEGER NOT NULL,
+    film_id INTEGER NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (actor_id, film_id)
+);
+CREATE TABLE film_category (
+    film_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (film_id, category_id)
+);
+CREATE TABLE customer (
+    customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    store_id INTEGER NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT,
+    address_id INTEGER NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    create_date TEXT NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE inventory (
+    inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    film_id INTEGER NOT NULL,
+    store_id INTEGER NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE rental (
+    rental_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rental_date TEXT NOT NULL,
+    inventory_id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    return_date TEXT,
+    staff_id INTEGER NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE payment (
+    payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    staff_id INTEGER NOT NULL,
+    rental_id INTEGER,
+    amount REAL NOT NULL,
+    payment_date TEXT NOT NULL,
+    last_update TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_fk_film_id ON inventory (film_id);
+CREATE INDEX idx_fk_customer_id ON rental (customer_id);
+CREATE INDEX idx_fk_inventory_id ON rental (inventory_id);
+CREATE INDEX idx_fk_payment_customer_id ON payment (customer_id);
+CREATE INDEX idx_title ON film (title);
+CREATE INDEX idx_actor_last_name ON actor (last_name);
+"""
+
+FIRST_NAMES = ["PENELOPE", "NICK", "ED", "JENNIFER", "JOHNNY", "BETTE", "GRACE", "MATTHEW", "JOE", "CHRISTIAN"]
+LAST_NAMES = ["GUINESS", "WAHLBERG", "CHASE", "DAVIS", "LOLLOBRIGIDA", "NICHOLSON", "MOSTEL", "JOHANSSON", "SWANK", "GABLE"]
+TITLE_WORDS = ["ACADEMY", "DINOSAUR", "ACE", "GOLDFINGER", "ADAPTATION", "HOLES", "AFFAIR", "PREJUDICE", "AGENT", "TRUMAN"]
+CATEGORIES = ["Action", "Animation", "Children", "Classics", "Comedy", "Documentary", "Drama", "Family",
+              "Foreign", "Games", "Horror", "Music", "New", "Sci-Fi", "Sports", "Travel"]
+RATINGS = ["G", "PG", "PG-13", "R", "NC-17"]
+
+
+def generate_sakila_subset(actors=200, films=1000, customers=599, inventory=2000, rentals=5000, seed=42):
+    """Deterministic rows for every table of SAKILA_SUBSET_SCHEMA."""
+    rng = random.Random(seed)
+    tables = {}
+    tables["actor"] = [
+        (i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)) for i in range(1, actors + 1)
+    ]
+    tables["category"] = [(i, name) for i, name in enumerate(CATEGORIES, 1)]
+    tables["film"] = [
+        (
+            i,
+            f"{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} {i}",
+            "A generated film description",
+            rng.randint(2000, 2006),
+            1,
+            rng.randint(3, 7),
+            rng.choice([0.99, 2.99, 4.99]),
+            rng.randint(46, 185),
+            rng.choice([9.99, 14.99, 19.99, 24.99, 29.99]),
+            rng.choice(RATINGS),
+        )
+        for i in range(1, films + 1)
+    ]
+    tables["film_actor"] = sorted({
+        (rng.randint(1, actors), film_id)
+        for film_id in range(1, films + 1)
+        for _ in range(rng.randint(1, 8))
+    })
+    tables["film_category"] = [
+        (film_id, rng.randint(1, len(CATEGORIES))) for film_id in range(1, films + 1)
+    ]
+    tables["customer"] = [
+        (
+            i,
+            rng.randint(1, 2),
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES),
+            f"customer{i}@sakilacustomer.org",
+            i,
+            1,
+            "2006-02-14 22:04:36",
+        )
+        for i in range(1, customers + 1)
+    ]
+    tables["inventory"] = [
+        (i, rng.randint(1, films), rng.randint(1, 2)) for i in range(1, inventory + 1)
+    ]
+    tables["rental"] = []
+    tables["payment"] = []
+    for i in range(1, rentals + 1):
+        rental_date = f"2005-{rng.randint(5, 8):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00"
+        customer_id = rng.randint(1, customers)
+        tables["rental"].append((i, rental_date, rng.randint(1, inventory), customer_id, rental_date, 1))
+        tables["payment"].append((i, customer_id, 1, i, rng.choice([0.99, 2.99, 4.99, 5.99]), rental_date))
+    return tables
+
+
+TABLE_COLUMNS = {
+    "actor": "actor_id, first_name, last_name",
+    "category": "category_id, name",
+    "film": "film_id, title, description, release_year, language_id, rental_duration, "
+            "rental_rate, length, replacement_cost, rating",
+    "film_actor": "actor_id, film_id",
+    "film_category": "film_id, category_id",
+    "customer": "customer_id, store_id, first_name, last_name, email, address_id, active, create_date",
+    "inventory": "inventory_id, film_id, store_id",
+    "rental": "rental_id, rental_date, inventory_id, customer_id, return_date, staff_id",
+    "payment": "payment_id, customer_id, staff_id, rental_id, amount, payment_date",
+}
+
+
+def create_sqlite_database(path, tables):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SAKILA_SUBSET_SCHEMA)
+    for table, rows in tables.items():
+        columns = TABLE_COLUMNS[table]
+        placeholders = ", ".join("?" for _ in columns.split(","))
+        conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+    conn.commit()
+    conn.close()
+
+
+def clone_mysql_database(source, target):
+    """
+    Recreate database target as a copy of the tables and rows of source, on
+    the MySQL server the services connect to (same MYSQL_* variables).
+    """
+    import mysql.connector
+
+    conn = mysql.connector.connect(
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", "root_password"),
+        host=os.getenv("MYSQL_HOST", "localhost"),
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = %s AND table_type = 'BASE TABLE'",
+            (source,),
+        )
+        tables = [table for (table,) in cursor.fetchall()]
+        if not tables:
+            raise RuntimeError(f"MySQL database {source} has no tables to copy, load sakila into it first")
+        cursor.execute(f"DROP DATABASE IF EXISTS `{target}`")
+        cursor.execute(f"CREATE DATABASE `{target}`")
+        for table in tables:
+            cursor.execute(f"CREATE TABLE `{target}`.`{table}` LIKE `{source}`.`{table}`")
+            cursor.execute(f"INSERT INTO `{target}`.`{table}` SELECT * FROM `{source}`.`{table}`")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class LocalCluster:
+    """
+    Gatekeeper, trusted host, P proxies, manager and N workers as local processes,
+    one port each, wired together through a generated public_ips.json.
+    """
+
+    def __init__(self, workdir, workers=2, base_port=5100, db="sqlite", mysql_db_prefix="sakila", proxies=1):
+        self.workdir = os.path.abspath(workdir)
+        self.workers = workers
+        self.proxies = proxies
+        self.base_port = base_port
+        self.db = db
+        self.mysql_db_prefix = mysql_db_prefix
+        self.processes = {}
+
+        # Named as on EC2: a lone proxy has no number
+        proxy_roles = ["proxy"] if proxies == 1 else [f"proxy{i + 1}" for i in range(proxies)]
+        roles = ["gatekeeper", "trusted_host"] + proxy_roles + ["manager"]
+        roles += [f"worker{i + 1}" for i in range(workers)]
+        self.ports = {role: base_port + i for i, role in enumerate(roles)}
+
+    def service_script(self, role):
+        name = role.rstrip("0123456789")
+        return os.path.join(UTILS_DIR, f"{name}.py")
+
+    def prepare(self):
+        os.makedirs(self.workdir, exist_ok=True)
+        public_ips = {role: f"127.0.0.1:{port}" for role, port in self.ports.items()}
+        with open(os.path.join(self.workdir, "public_ips.json"), "w") as f:
+            json.dump(public_ips, f, indent=4)
+
+        tables = generate_sakila_subset() if self.db == "sqlite" else None
+        for role in self.ports:
+            if role == "manager" or role.startswith("worker"):
+                if self.db == "sqlite":
+                    create_sqlite_database(os.path.join(self.workdir, f"{role}.db"), tables)
+                else:
+                    # Fresh copy of the <prefix> database, as every node starts with the same data
+                    clone_mysql_database(self.mysql_db_prefix, f"{self.mysql_db_prefix}_{role}")
+
+    def environment(self, role):
+        env = dict(os.environ, PORT=str(self.ports[role]), PYTHONUNBUFFERED="1")
+        if role == "manager" or role.startswith("worker"):
+            if self.db == "sqlite":
+                env["DB_BACKEND"] = "sqlite"
+                env["SQLITE_PATH"] = os.path.join(self.workdir, f"{role}.db")
+            else:
+                # Replication happens in the manager, so every node needs its own database
+                env["MYSQL_DB"] = f"{self.mysql_db_prefix}_{role}"
+        return env
+
+    def start(self, timeout=30):
+        self.prepare()
+        for role in self.ports:
+            log = open(os.path.join(self.workdir, f"{role}_output.log"), "w")
+            self.processes[role] = subprocess.Popen(
+                [sys.executable, self.service_script(role)],
+                cwd=self.workdir,
+                env=self.environment(role),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,  # the Flask reloader forks, stop the whole group
+            )
+        self.wait_until_ready(timeout)
+
+    def wait_until_ready(self, timeout):
+        deadline = time.time() + timeout
+        pending = set(self.ports)
+        while pending:
+            for role in list(pending):
+                if self.processes[role].poll() is not None:
+                    raise RuntimeError(f"{role} exited, see {self.workdir}/{role}_output.log")
+                try:
+                    requests.get(f"http://127.0.0.1:{self.ports[role]}/", timeout=1)
+                    pending.discard(role)
+                except requests.exceptions.RequestException:
+                    pass
+            if pending and time.time() > deadline:
+                raise RuntimeError(f"Services not ready after {timeout}s: {sorted(pending)}")
+            time.sleep(0.2)
+        print(f"Local cluster ready in {self.workdir}: {self.ports}")
+
+    def stop(self):
+        for role, process in self.processes.items():
+            if process.poll() is None:
+                os.killpg(process.pid, signal.SIGTERM)
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+        self.processes = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the DB cluster as local processes")
+    parser.add_argument("--workdir", default=".local_cluster")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--proxies", type=int, default=1)
+    parser.add_argument("--base-port", type=int, default=5100)
+    parser.add_argument("--db", choices=["sqlite", "mysql"], default="sqlite",
+                        help="sqlite stand-in with a sakila subset, or local MySQL: each node gets "
+                             "a <prefix>_<node> database copied from the <prefix> database")
+    parser.add_argument("--mysql-db-prefix", default="sakila")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("up", help="start the cluster and keep it running")
+    bench = subparsers.add_parser("bench", help="start the cluster, run benchmark.py, stop")
+    bench.add_argument("benchmark_args", nargs=argparse.REMAINDER,
+                       help="arguments for benchmark.py, e.g. open-loop --rate 100")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cluster = LocalCluster(
+        args.workdir, args.workers, args.base_port, args.db, args.mysql_db_prefix, args.proxies
+    )
+    try:
+        cluster.start()
+        if args.command == "up":
+            print("Press Ctrl-C to stop")
+            while True:
+                time.sleep(1)
+        else:
+            benchmark_args = [a for a in args.benchmark_args if a != "--"]
+            result = subprocess.run([sys.executable, BENCHMARK_SCRIPT] + benchmark_args, cwd=cluster.workdir)
+            sys.exit(result.returncode)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
@@ -1,4 +1,9 @@
 from dataclasses import dataclass
+import argparse
+import collections
+import concurrent.futures
+import functools
+import hashlib
 import json
 import boto3
 from botocore.exceptions import ClientError
@@ -7,6 +12,15 @@ from scp import SCPClient
 import time
 from typing import Any
 import os
+import socket
+import threading
+import urllib.request
+
+from bootstrap import READINESS_PORT, user_data_script
+from bundle import build_bundle
+import sysbench_driver
+from topology import Topology
+from utils.cluster import PRIVATE_ADDRESSES_FILE, SAMPLER_PORT_OFFSET
 
 
 @dataclass
@@ -18,6 +32,148 @@ class EC2Instance:
         return f"{self.name}_{self.instance.id}"
 
 
+@dataclass
+class CommandResult:
+    instance: str
+    command: str | None  # None when the instance could not be reached
+    exit_status: int | None
+    output: str  # last lines of the combined stdout/stderr
+
+
+class CommandError(Exception):
+    def __init__(self, failures: list[CommandResult]):
+        self.failures = failures
+        super().__init__(
+            "; ".join(
+                f"{failure.instance}: {failure.command or 'ssh'} (exit status {failure.exit_status})"
+                for failure in failures
+            )
+        )
+
+
+# Files every role runs from its home directory, uploaded under their base name
+ROLE_FILES = {
+    "manager": [
+        "utils/manager.py",
+        "utils/cluster.py",
+        "utils/membership.py",
+        "utils/metrics.py",
+        "utils/tracing.py",
+        "utils/sampler.py",
+        "utils/statement_cache.py",
+        "private_ips.json",
+    ],
+    "worker": [
+        "utils/worker.py",
+        "utils/cluster.py",
+        "utils/metrics.py",
+        "utils/tracing.py",
+        "utils/sampler.py",
+        "utils/statement_cache.py",
+    ],
+    "proxy": [
+        "utils/proxy.py",
+        "utils/cluster.py",
+        "utils/membership.py",
+        "utils/metrics.py",
+        "utils/tracing.py",
+        "utils/sampler.py",
+        "private_ips.json",
+    ],
+    "trusted_host": [
+        "utils/trusted_host.py",
+        "utils/cluster.py",
+        "utils/membership.py",
+        "utils/metrics.py",
+        "utils/tracing.py",
+        "utils/sampler.py",
+        "private_ips.json",
+    ],
+    "gatekeeper": [
+        "utils/gatekeeper.py",
+        "utils/cluster.py",
+        "utils/membership.py",
+        "utils/metrics.py",
+        "utils/tracing.py",
+        "utils/sampler.py",
+        "private_ips.json",
+    ],
+}
+
+# Service code shipped in the offline bundle, private_ips.json is only known once instances run
+SERVICE_FILES = sorted(
+    {path for paths in ROLE_FILES.values() for path in paths if path.startswith("utils/")}
+)
+
+
+# Errors meaning a resource is still held by one AWS has not released yet
+RETRYABLE_TEARDOWN_ERRORS = ("DependencyViolation", "IncorrectState")
+
+
+def delete_with_backoff(delete, timeout=600):
+    """Call delete until AWS stops reporting the resource as in use."""
+    deadline = time.monotonic() + timeout
+    delay = 1
+    while True:
+        try:
+            delete()
+            return
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code.endswith("NotFound"):
+                return  # already gone
+            if code not in RETRYABLE_TEARDOWN_ERRORS or time.monotonic() > deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, 15)
+
+
+def run_teardown_steps(steps):
+    """
+    Run {name: (deletion, [names it depends on])} with every step starting
+    as soon as its dependencies are deleted. Steps whose dependency failed
+    are skipped. Returns ({name: seconds}, {name: error}).
+    """
+    timings, failures = {}, {}
+    pending = dict(steps)
+    running = {}
+
+    def timed(delete):
+        start = time.monotonic()
+        delete_with_backoff(delete)
+        return time.monotonic() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        while pending or running:
+            progressed = False
+            for name, (delete, dependencies) in list(pending.items()):
+                failed = [dependency for dependency in dependencies if dependency in failures]
+                if failed:
+                    failures[name] = f"skipped, {', '.join(failed)} failed"
+                elif all(dependency in timings for dependency in dependencies):
+                    running[executor.submit(timed, delete)] = name
+                else:
+                    continue
+                del pending[name]
+                progressed = True
+            if not running:
+                if progressed:
+                    continue  # only skips happened, look at what they unblocked
+                for name in pending:
+                    failures[name] = "skipped, unknown dependency"
+                break
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                except Exception as e:
+                    failures[name] = e
+    return timings, failures
+
+
 # Function to create an SSH client
 def create_ssh_client(host, user, key_path):
     ssh = paramiko.SSHClient()
@@ -26,24 +182,192 @@ def create_ssh_client(host, user, key_path):
     return ssh
 
 
+class SSHSessionCache:
+    """
+    One SSH connection per host, reused by every deployment phase for both
+    commands and SCP so key exchange is paid once per host. Connections
+    send keepalives and are re-opened when their transport has died.
+    """
+
+    def __init__(self, user: str, key_path: str, keepalive: int = 30):
+        self.user = user
+        self.key_path = key_path
+        self.keepalive = keepalive
+        self._sessions = {}
+        self._host_locks = collections.defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def get(self, host: str, reconnect: bool = False) -> paramiko.SSHClient:
+        with self._lock:
+            host_lock = self._host_locks[host]
+        # Hosts connect concurrently, each one only once
+        with host_lock:
+            ssh_client = self._sessions.get(host)
+            transport = ssh_client.get_transport() if ssh_client else None
+            if reconnect or transport is None or not transport.is_active():
+                if ssh_client:
+                    ssh_client.close()
+                ssh_client = create_ssh_client(host, self.user, self.key_path)
+                ssh_client.get_transport().set_keepalive(self.keepalive)
+                self._sessions[host] = ssh_client
+            return ssh_client
+
+    def exec_command(self, host: str, command: str):
+        """exec_command on the cached connection, reconnecting once if it went stale."""
+        try:
+            return self.get(host).exec_command(command)
+        except (paramiko.SSHException, EOFError, OSError):
+            return self.get(host, reconnect=True).exec_command(command)
+
+    def scp(self, host: str) -> SCPClient:
+        return SCPClient(self.get(host).get_transport())
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for ssh_client in sessions.values():
+            ssh_client.close()
+
+
+class DeploymentState:
+    """
+    Resources created by a deployment and the phases it completed, saved
+    to a JSON file after every change so an interrupted deployment can be
+    resumed instead of provisioned again. path=None keeps it in memory.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.resources = {}  # vpc_id, subnet_id, security group ids...
+        self.instances = {}  # role name -> instance id
+        self.phases = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.resources = data["resources"]
+            self.instances = data["instances"]
+            self.phases = data["phases"]
+
+    def exists(self) -> bool:
+        return bool(self.resources or self.instances)
+
+    def record(self, **resources) -> None:
+        with self._lock:
+            self.resources.update(resources)
+            self._save()
+
+    def record_instance(self, name: str, instance_id: str) -> None:
+        with self._lock:
+            self.instances[name] = instance_id
+            self._save()
+
+    def is_complete(self, phase: str) -> bool:
+        return phase in self.phases
+
+    def complete(self, phase: str) -> None:
+        with self._lock:
+            if phase not in self.phases:
+                self.phases.append(phase)
+            self._save()
+
+    def reset_from(self, phases: list[str], phase: str) -> None:
+        """Forget phase and every later one, so they run again."""
+        redo = set(phases[phases.index(phase):])
+        with self._lock:
+            self.phases = [done for done in self.phases if done not in redo]
+            self._save()
+
+    def delete(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        # Written aside then renamed, an interruption never leaves half a file
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(
+                {"resources": self.resources, "instances": self.instances, "phases": self.phases},
+                f,
+                indent=4,
+            )
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+# Attribute and state key -> (group name prefix, description) of each security group
+SECURITY_GROUPS = {
+    "cluster_security_group_id": ("common_sg", "Security group for manager and workers"),
+    "proxy_security_group_id": ("proxy_sg", "Proxy security group"),
+    "trusted_host_security_group_id": ("trusted_host_sg", "Trusted host security group"),
+    "gatekeeper_security_group_id": ("gatekeeper_sg", "Gatekeeper security group"),
+}
+
+
 class EC2Class:
-    def __init__(self):
+    def __init__(
+        self,
+        state: DeploymentState | None = None,
+        topology: Topology | None = None,
+        provision: bool = True,
+    ):
+        """
+        provision=False only attaches to the resources the state records and
+        creates none, for a teardown or a push to a running cluster.
+        """
         self.key_name = "key_pair_db_cluster"
-        
+        # Worker count, instance types and placement of the cluster
+        self.topology = topology or Topology()
+        # Every resource created is recorded, those already recorded are reused
+        self.state = state or DeploymentState()
+        resources = self.state.resources
+
         # Clients and resources
         self.ec2_client = boto3.client("ec2", region_name="us-east-1")
         self.ec2_resource = boto3.resource("ec2", region_name="us-east-1")
 
+        if provision:
+            self._provision_network()
+            # AMI_ID pins an image, e.g. one known to a local AWS stand-in such as moto
+            if "ami_id" not in resources:
+                self.state.record(ami_id=os.getenv("AMI_ID") or self._get_latest_ubuntu_ami())
+        else:
+            self.vpc_id = resources.get("vpc_id")
+            self.igw = {'InternetGatewayId': resources.get("internet_gateway_id")}
+            self.subnet = {'SubnetId': resources.get("subnet_id")}
+            self.route_table = {'RouteTableId': resources.get("route_table_id")}
+            for attribute in SECURITY_GROUPS:
+                setattr(self, attribute, resources.get(attribute))
+        self.ami_id = resources.get("ami_id")
+        self.ssh_key_path = os.path.expanduser(f"./{self.key_name}.pem")
+        # SSH connections shared by every deployment phase
+        self.ssh_sessions = SSHSessionCache("ubuntu", self.ssh_key_path)
+
+        # Initialize instance variables
+        self.manager_instance = None
+        self.worker_instances = []
+        self.proxy_instances = []
+        self.gatekeeper_instance = None
+        self.trusted_host_instance = None
+
+    def _provision_network(self):
+        """Create the VPC, gateway, subnet, route table and security groups not recorded yet."""
+        resources = self.state.resources
+
         # Create VPC
-        vpc = self.ec2_client.create_vpc(
-            CidrBlock='10.0.0.0/16',
-            TagSpecifications=[{
-                'ResourceType': 'vpc',
-                'Tags': [{'Key': 'Name', 'Value': 'cluster-vpc'}]
-            }]
-        )['Vpc']
-        self.vpc_id = vpc['VpcId']
-        
+        if "vpc_id" not in resources:
+            vpc = self.ec2_client.create_vpc(
+                CidrBlock='10.0.0.0/16',
+                TagSpecifications=[{
+                    'ResourceType': 'vpc',
+                    'Tags': [{'Key': 'Name', 'Value': 'cluster-vpc'}]
+                }]
+            )['Vpc']
+            # The topology is recorded with the first resource: a deployment
+            # that failed before creating anything leaves no state behind
+            self.state.record(vpc_id=vpc['VpcId'], topology=self.topology.to_dict())
+        self.vpc_id = resources["vpc_id"]
+
         # Wait for VPC to be available
         waiter = self.ec2_client.get_waiter('vpc_available')
         waiter.wait(VpcIds=[self.vpc_id])
@@ -55,51 +379,62 @@ class EC2Class:
         )
 
         # Create and attach internet gateway
-        self.igw = self.ec2_client.create_internet_gateway()['InternetGateway']
-        self.ec2_client.attach_internet_gateway(
-            InternetGatewayId=self.igw['InternetGatewayId'],
-            VpcId=self.vpc_id
-        )
+        if "internet_gateway_id" not in resources:
+            igw = self.ec2_client.create_internet_gateway()['InternetGateway']
+            self.ec2_client.attach_internet_gateway(
+                InternetGatewayId=igw['InternetGatewayId'],
+                VpcId=self.vpc_id
+            )
+            self.state.record(internet_gateway_id=igw['InternetGatewayId'])
+        self.igw = {'InternetGatewayId': resources["internet_gateway_id"]}
 
         # Create subnet
-        self.subnet = self.ec2_client.create_subnet(
-            VpcId=self.vpc_id,
-            CidrBlock='10.0.1.0/24',
-            AvailabilityZone='us-east-1a'
-        )['Subnet']
-        
-        self.ec2_client.modify_subnet_attribute(
-        SubnetId=self.subnet['SubnetId'],
-        MapPublicIpOnLaunch={'Value': True}
-        )
+        if "subnet_id" not in resources:
+            subnet = self.ec2_client.create_subnet(
+                VpcId=self.vpc_id,
+                CidrBlock='10.0.1.0/24',
+                AvailabilityZone=self.topology.availability_zone
+            )['Subnet']
+            self.ec2_client.modify_subnet_attribute(
+            SubnetId=subnet['SubnetId'],
+            MapPublicIpOnLaunch={'Value': True}
+            )
+            self.state.record(subnet_id=subnet['SubnetId'])
+        self.subnet = {'SubnetId': resources["subnet_id"]}
 
         # Configure route table
-        self.route_table = self.ec2_client.create_route_table(VpcId=self.vpc_id)['RouteTable']
-        self.ec2_client.create_route(
-            RouteTableId=self.route_table['RouteTableId'],
-            DestinationCidrBlock='0.0.0.0/0',
-            GatewayId=self.igw['InternetGatewayId']
-        )
-        self.ec2_client.associate_route_table(
-            RouteTableId=self.route_table['RouteTableId'],
-            SubnetId=self.subnet['SubnetId']
-        )
+        if "route_table_id" not in resources:
+            route_table = self.ec2_client.create_route_table(VpcId=self.vpc_id)['RouteTable']
+            self.ec2_client.create_route(
+                RouteTableId=route_table['RouteTableId'],
+                DestinationCidrBlock='0.0.0.0/0',
+                GatewayId=self.igw['InternetGatewayId']
+            )
+            self.ec2_client.associate_route_table(
+                RouteTableId=route_table['RouteTableId'],
+                SubnetId=self.subnet['SubnetId']
+            )
+            self.state.record(route_table_id=route_table['RouteTableId'])
+        self.route_table = {'RouteTableId': resources["route_table_id"]}
 
         # Create security groups with proper rules
         self._create_security_groups()
-        
-        self.ami_id = self._get_latest_ubuntu_ami()
-        self.ssh_key_path = os.path.expanduser(f"./{self.key_name}.pem")
-
-        # Initialize instance variables
-        self.manager_instance = None
-        self.worker_instances = []
-        self.proxy_instance = None
-        self.gatekeeper_instance = None
-        self.trusted_host_instance = None
 
     def create_key_pair(self) -> None:
-        """Create key pair and save the private key"""
+        """
+        Create key pair and save the private key. A key pair this machine
+        already holds the private key of is reused: running instances were
+        launched with it.
+        """
+        if os.path.exists(self.ssh_key_path):
+            try:
+                self.ec2_client.describe_key_pairs(KeyNames=[self.key_name])
+                return
+            except ClientError as e:
+                if 'InvalidKeyPair.NotFound' not in str(e):
+                    raise
+                os.chmod(self.ssh_key_path, 0o600)
+                os.remove(self.ssh_key_path)
         try:
             response = self.ec2_client.create_key_pair(KeyName=self.key_name)
             private_key = response["KeyMaterial"]
@@ -112,36 +447,26 @@ class EC2Class:
         
         except ClientError as e:
             if 'InvalidKeyPair.Duplicate' in str(e):
+                if self.state.instances:
+                    raise RuntimeError(
+                        f"Key pair {self.key_name} exists but {self.ssh_key_path} is missing, "
+                        "the recorded instances hold its public key"
+                    ) from e
                 self.ec2_client.delete_key_pair(KeyName=self.key_name)
                 self.create_key_pair()
             else:
                 raise e
     def _create_security_groups(self):
         timestamp = str(int(time.time()))
-    
-        self.cluster_security_group_id = self.ec2_client.create_security_group(
-            GroupName=f"common_sg_{timestamp}",
-            Description="Security group for manager and workers",
-            VpcId=self.vpc_id
-        )['GroupId']
-    
-        self.proxy_security_group_id = self.ec2_client.create_security_group(
-            GroupName=f"proxy_sg_{timestamp}",
-            Description="Proxy security group",
-            VpcId=self.vpc_id
-        )['GroupId']
-    
-        self.trusted_host_security_group_id = self.ec2_client.create_security_group(
-            GroupName=f"trusted_host_sg_{timestamp}",
-            Description="Trusted host security group",
-            VpcId=self.vpc_id
-        )['GroupId']
-    
-        self.gatekeeper_security_group_id = self.ec2_client.create_security_group(
-            GroupName=f"gatekeeper_sg_{timestamp}",
-            Description="Gatekeeper security group",
-            VpcId=self.vpc_id
-        )['GroupId']
+        for attribute, (name, description) in SECURITY_GROUPS.items():
+            if attribute not in self.state.resources:
+                group_id = self.ec2_client.create_security_group(
+                    GroupName=f"{name}_{timestamp}",
+                    Description=description,
+                    VpcId=self.vpc_id
+                )['GroupId']
+                self.state.record(**{attribute: group_id})
+            setattr(self, attribute, self.state.resources[attribute])
 
     def install_network_security(self):
         """Configure IPtables rules for the trusted host"""
@@ -165,21 +490,8 @@ class EC2Class:
         
         self.execute_commands(iptables_commands, [self.trusted_host_instance])
 
-    def get_cpu_utilization(self, instance_id, start_time, end_time):
-        cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
-        response = cloudwatch.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName='CPUUtilization',
-            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=60,
-            Statistics=['Average']
-        )
-        return response['Datapoints']
-
     def launch_instances(self):
-        """Launch instances in the created subnet"""
+        """Launch every instance in the created subnet at once"""
         common_args = {
             'SubnetId': self.subnet['SubnetId'],
             'ImageId': self.ami_id,
@@ -194,150 +506,175 @@ class EC2Class:
                 }
             }]
         }
-        # Launch worker instances
-        for i in range(2):
-            self.worker_instances.append(
-                EC2Instance(
-                    self.ec2_resource.create_instances(
-                        ImageId=self.ami_id,
-                        InstanceType="t2.micro",
+        if self.topology.placement_strategy:
+            if "placement_group_name" not in self.state.resources:
+                group_name = f"db-cluster-{self.vpc_id}"
+                self.ec2_client.create_placement_group(
+                    GroupName=group_name, Strategy=self.topology.placement_strategy
+                )
+                self.state.record(placement_group_name=group_name)
+            common_args['Placement'] = {'GroupName': self.state.resources["placement_group_name"]}
+
+        security_groups = {
+            "manager": self.cluster_security_group_id,
+            "worker": self.cluster_security_group_id,
+            "proxy": self.proxy_security_group_id,
+            "trusted_host": self.trusted_host_security_group_id,
+            "gatekeeper": self.gatekeeper_security_group_id,
+        }
+        # name -> (instance type, security group)
+        roles = {
+            name: (self.topology.instance_types[role], security_groups[role])
+            for name, role in self.topology.instances().items()
+        }
+
+        def launch(name, instance_type, security_group_id):
+            role = name.rstrip("0123456789")
+            if name in self.state.instances:
+                # Launched by an earlier, interrupted run
+                return EC2Instance(self.ec2_resource.Instance(self.state.instances[name]), name=name)
+            # The client is thread-safe, resources are not: build one per instance afterwards
+            for attempt in range(5):
+                try:
+                    response = self.ec2_client.run_instances(
+                        InstanceType=instance_type,
                         MinCount=1,
                         MaxCount=1,
-                        SecurityGroupIds=[self.cluster_security_group_id],
-                        KeyName=self.key_name,
-                        SubnetId=self.subnet['SubnetId'],
-                        Monitoring={'Enabled': True},
-                        BlockDeviceMappings=[
-                            {
-                                "DeviceName": "/dev/sda1",
-                                "Ebs": {
-                                    "VolumeSize": 16,
-                                    "VolumeType": "gp3",
-                                    "DeleteOnTermination": True,
-                                },
-                            }
-                        ],
-                    )[0],
-                    name=f"worker{i + 1}",
-                )
+                        SecurityGroupIds=[security_group_id],
+                        # The node installs and starts its service by itself while booting
+                        UserData=user_data_script(
+                            role,
+                            self.state.resources["bundle_path"],
+                            needs_addresses=PRIVATE_ADDRESSES_FILE in ROLE_FILES[role],
+                        ),
+                        TagSpecifications=[{
+                            'ResourceType': 'instance',
+                            'Tags': [{'Key': 'Name', 'Value': name}]
+                        }],
+                        **common_args,
+                    )
+                    break
+                except ClientError as e:
+                    # A key pair created a moment ago may not be visible yet
+                    if 'InvalidKeyPair.NotFound' not in str(e) or attempt == 4:
+                        raise
+                    time.sleep(2 ** attempt)
+            instance_id = response['Instances'][0]['InstanceId']
+            self.state.record_instance(name, instance_id)
+            return EC2Instance(self.ec2_resource.Instance(instance_id), name=name)
+
+        self.launch_started = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(roles)) as executor:
+            futures = {
+                name: executor.submit(launch, name, instance_type, security_group_id)
+                for name, (instance_type, security_group_id) in roles.items()
+            }
+            launched = {name: future.result() for name, future in futures.items()}
+        return self._assign_instances(launched)
+
+    def attach_instances(self):
+        """Instances recorded in the deployment state, without launching missing ones."""
+        return self._assign_instances({
+            name: EC2Instance(self.ec2_resource.Instance(instance_id), name=name)
+            for name, instance_id in self.state.instances.items()
+        })
+
+    def _assign_instances(self, instances):
+        def numbered(role):
+            # worker2 before worker10, a lone proxy has no number
+            names = sorted(
+                (name for name in instances if name.rstrip("0123456789") == role),
+                key=lambda name: int(name[len(role):] or 0),
             )
-
-        # Launch manager instance
-        self.manager_instance = EC2Instance(
-            self.ec2_resource.create_instances(
-                ImageId=self.ami_id,
-                InstanceType="t2.micro",
-                MinCount=1,
-                MaxCount=1,
-                SecurityGroupIds=[self.cluster_security_group_id],
-                KeyName=self.key_name,
-                SubnetId=self.subnet['SubnetId'],
-                Monitoring={'Enabled': True},
-                BlockDeviceMappings=[
-                    {
-                        "DeviceName": "/dev/sda1",
-                        "Ebs": {
-                            "VolumeSize": 16,
-                            "VolumeType": "gp3",
-                            "DeleteOnTermination": True,
-                        },
-                    }
-                ],
-            )[0],
-            name="manager",
+            return [instances[name] for name in names]
+
+        self.worker_instances = numbered("worker")
+        self.manager_instance = instances.get("manager")
+        self.proxy_instances = numbered("proxy")
+        self.trusted_host_instance = instances.get("trusted_host")
+        self.gatekeeper_instance = instances.get("gatekeeper")
+        assigned = (
+            self.worker_instances
+            + [self.manager_instance]
+            + self.proxy_instances
+            + [self.trusted_host_instance, self.gatekeeper_instance]
         )
+        return [i for i in assigned if i is not None]
 
-        # Launch proxy instance
-        self.proxy_instance = EC2Instance(
-            self.ec2_resource.create_instances(
-                ImageId=self.ami_id,
-                InstanceType="t2.large",
-                MinCount=1,
-                MaxCount=1,
-                SecurityGroupIds=[self.proxy_security_group_id],
-                KeyName=self.key_name,
-                SubnetId=self.subnet['SubnetId'],
-                Monitoring={'Enabled': True},
-                BlockDeviceMappings=[
-                    {
-                        "DeviceName": "/dev/sda1",
-                        "Ebs": {
-                            "VolumeSize": 16,
-                            "VolumeType": "gp3",
-                            "DeleteOnTermination": True,
-                        },
-                    }
-                ],
-            )[0],
-            name="proxy",
-        )
-
-        # Launch trusted host instance
-        self.trusted_host_instance = EC2Instance(
-            self.ec2_resource.create_instances(
-                ImageId=self.ami_id,
-                InstanceType="t2.large",
-                MinCount=1,
-                MaxCount=1,
-                SecurityGroupIds=[self.trusted_host_security_group_id],
-                KeyName=self.key_name,
-                SubnetId=self.subnet['SubnetId'],
-                Monitoring={'Enabled': True},
-                BlockDeviceMappings=[
-                    {
-                        "DeviceName": "/dev/sda1",
-                        "Ebs": {
-                            "VolumeSize": 16,
-                            "VolumeType": "gp3",
-                            "DeleteOnTermination": True,
-                        },
-                    }
-                ],
-            )[0],
-            name="trusted_host",
-        )
+    def _wait_for_ssh_port(self, host, deadline):
+        while True:
+            try:
+                with socket.create_connection((host, 22), timeout=5):
+                    return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"SSH port of {host} still closed")
+                time.sleep(2)
 
-        # Launch gatekeeper instance
-        self.gatekeeper_instance = EC2Instance(
-            self.ec2_resource.create_instances(
-                ImageId=self.ami_id,
-                InstanceType="t2.large",
-                MinCount=1,
-                MaxCount=1,
-                SecurityGroupIds=[self.gatekeeper_security_group_id],
-                KeyName=self.key_name,
-                SubnetId=self.subnet['SubnetId'],
-                Monitoring={'Enabled': True},
-                BlockDeviceMappings=[
-                    {
-                        "DeviceName": "/dev/sda1",
-                        "Ebs": {
-                            "VolumeSize": 16,
-                            "VolumeType": "gp3",
-                            "DeleteOnTermination": True,
-                        },
-                    }
-                ],
-            )[0],
-            name="gatekeeper",
+    def _wait_for_ssh_login(self, host, deadline):
+        while True:
+            try:
+                stdin, stdout, stderr = self.ssh_sessions.exec_command(host, "true")
+                if stdout.channel.recv_exit_status() == 0:
+                    return
+            except Exception:
+                # sshd accepts connections a little before it accepts logins
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"SSH login to {host} still refused")
+            time.sleep(2)
+
+    def wait_until_ready(self, instances, probe=True, timeout=900):
+        """
+        Wait for every instance to run with a single batched waiter, then
+        probe each one concurrently until it accepts SSH logins. Nodes are
+        still bootstrapping at this point, see wait_for_bootstrap. Prints
+        and returns seconds to ready per role, counted from launch.
+        probe=False stops at "running", for local AWS stand-ins such as moto
+        whose instances have no real host behind them.
+        """
+        started = getattr(self, "launch_started", time.monotonic())
+        deadline = time.monotonic() + timeout
+        self.ec2_client.get_waiter("instance_running").wait(
+            InstanceIds=[ec2_instance.instance.id for ec2_instance in instances],
+            WaiterConfig={"Delay": 5, "MaxAttempts": max(1, timeout // 5)},
         )
-        for instance in [self.manager_instance] + self.worker_instances + [self.proxy_instance, self.trusted_host_instance, self.gatekeeper_instance]:
-            instance.instance.reload()
-            print(f"Instance {instance.name} - VPC: {instance.instance.vpc_id}, Subnet: {instance.instance.subnet_id}")
-            print(f"Instance state: {instance.instance.state['Name']}")
-        return self.worker_instances + [
-            self.manager_instance,
-            self.proxy_instance,
-            self.trusted_host_instance,
-            self.gatekeeper_instance,
-        ]
+        running = time.monotonic() - started
+
+        def ready(ec2_instance):
+            ec2_instance.instance.reload()
+            if probe:
+                host = ec2_instance.instance.public_ip_address
+                self._wait_for_ssh_port(host, deadline)
+                self._wait_for_ssh_login(host, deadline)
+            return time.monotonic() - started
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(instances)) as executor:
+            futures = {
+                ec2_instance.name: executor.submit(ready, ec2_instance)
+                for ec2_instance in instances
+            }
+            time_to_ready = {name: future.result() for name, future in futures.items()}
+
+        print(f"All instances running after {running:.1f}s")
+        for name, seconds in sorted(time_to_ready.items(), key=lambda item: item[1]):
+            print(f"Instance {name} ready after {seconds:.1f}s")
+        return time_to_ready
+
+    def _authorize_ingress(self, **kwargs):
+        try:
+            self.ec2_client.authorize_security_group_ingress(**kwargs)
+        except ClientError as e:
+            # Already there when a resumed deployment runs this again
+            if 'InvalidPermission.Duplicate' not in str(e):
+                raise
 
     def add_inbound_rules(self):
         """
         Add inbound rules for security groups
         """
         # Allow SSH access to all instances
-        self.ec2_client.authorize_security_group_ingress(
+        self._authorize_ingress(
             GroupId=self.cluster_security_group_id,
             IpPermissions=[
                 {
@@ -354,18 +691,20 @@ class EC2Class:
                     "IpProtocol": "tcp",
                     "FromPort": 5000,
                     "ToPort": 5000,
-                    "IpRanges": [  # Allow access from the proxy, and from the manager (for the workers)
+                    "IpRanges": [  # Allow access from the proxies, and from the manager (for the workers), over the VPC
                         {
-                            "CidrIp": f"{self.manager_instance.instance.public_ip_address}/32"
+                            "CidrIp": f"{self.manager_instance.instance.private_ip_address}/32"
                         },
+                    ] + [
                         {
-                            "CidrIp": f"{self.proxy_instance.instance.public_ip_address}/32"
-                        },
+                            "CidrIp": f"{proxy_instance.instance.private_ip_address}/32"
+                        }
+                        for proxy_instance in self.proxy_instances
                     ],
                 },
             ],
         )
-        self.ec2_client.authorize_security_group_ingress(
+        self._authorize_ingress(
             GroupId=self.proxy_security_group_id,
             IpPermissions=[
                 {
@@ -380,13 +719,13 @@ class EC2Class:
                     "ToPort": 5000,
                     "IpRanges": [
                         {
-                            "CidrIp": f"{self.trusted_host_instance.instance.public_ip_address}/32"  # Allow access from the trusted host
+                            "CidrIp": f"{self.trusted_host_instance.instance.private_ip_address}/32"  # Allow access from the trusted host
                         }
                     ],
                 },
             ],
         )
-        self.ec2_client.authorize_security_group_ingress(
+        self._authorize_ingress(
             GroupId=self.trusted_host_security_group_id,
             IpPermissions=[
                 {
@@ -401,13 +740,13 @@ class EC2Class:
                     "ToPort": 5000,
                     "IpRanges": [
                         {
-                            "CidrIp": f"{self.gatekeeper_instance.instance.public_ip_address}/32"  # Allow access from the gatekeeper
+                            "CidrIp": f"{self.gatekeeper_instance.instance.private_ip_address}/32"  # Allow access from the gatekeeper
                         }
                     ],
                 },
             ],
         )
-        self.ec2_client.authorize_security_group_ingress(
+        self._authorize_ingress(
             GroupId=self.gatekeeper_security_group_id,
             IpPermissions=[
                 {
@@ -425,295 +764,445 @@ class EC2Class:
             ],
         )
 
+        # Resource samplers listen on the service port + 1000, and nodes
+        # report their bootstrap on READINESS_PORT: only the operator
+        # running the deployment and benchmark may poll them
+        operator_ip = (
+            urllib.request.urlopen("https://checkip.amazonaws.com", timeout=10)
+            .read()
+            .decode()
+            .strip()
+        )
+        for group_id in [
+            self.cluster_security_group_id,
+            self.proxy_security_group_id,
+            self.trusted_host_security_group_id,
+            self.gatekeeper_security_group_id,
+        ]:
+            self._authorize_ingress(
+                GroupId=group_id,
+                IpPermissions=[
+                    {
+                        "IpProtocol": "tcp",
+                        "FromPort": port,
+                        "ToPort": port,
+                        "IpRanges": [{"CidrIp": f"{operator_ip}/32"}],
+                    }
+                    for port in (5000 + SAMPLER_PORT_OFFSET, READINESS_PORT)
+                ],
+            )
+
     def execute_commands(
         self,
-        commands: list[str],
+        commands: list[str] | dict[str, list[str]],
         instances: list[EC2Instance],
         print_output: bool = True,
-    ) -> None:
+        fail_fast: bool = False,
+        max_workers: int = 8,
+    ) -> dict[str, list[CommandResult]]:
         """
         This function executes a list of commands on each instance.
         You can call this function to run any set of commands.
+
+        commands is either one list run on every instance, or a list per
+        instance name. Instances run concurrently (at most max_workers at a
+        time), each running its commands in order. Output lines are prefixed
+        with the instance name. With fail_fast, the first failure stops every
+        instance and raises CommandError. Returns the results of each
+        instance.
         """
-        try:
-            for ec2_instance in instances:
-                # Connect to the instance
-                ssh_client = create_ssh_client(
-                    ec2_instance.instance.public_ip_address, "ubuntu", self.ssh_key_path
-                )
+        failed = threading.Event()
+        print_lock = threading.Lock()
 
-                # Run the commands
-                for command in commands:
-                    print(
-                        f"Executing command: {command} on instance {ec2_instance.get_name()}"
-                    )
-                    stdin, stdout, stderr = ssh_client.exec_command(command)
+        def log(ec2_instance, line):
+            with print_lock:
+                print(f"[{ec2_instance.name}] {line}", end="" if line.endswith("\n") else "\n")
 
-                    # Process output in real-time
+        def run(ec2_instance):
+            instance_commands = (
+                commands[ec2_instance.name] if isinstance(commands, dict) else commands
+            )
+            host = ec2_instance.instance.public_ip_address
+            results = []
+            try:
+                # Connect to the instance, or reuse its open connection
+                self.ssh_sessions.get(host)
+            except Exception as e:
+                failed.set()
+                log(ec2_instance, f"Could not connect: {e}")
+                return [CommandResult(ec2_instance.name, None, None, str(e))]
+
+            try:
+                for command in instance_commands:
+                    if fail_fast and failed.is_set():
+                        break
+                    log(ec2_instance, f"Executing command: {command}")
+                    stdin, stdout, stderr = self.ssh_sessions.exec_command(host, command)
+                    # One stream, so a chatty stderr cannot block the command
+                    stdout.channel.set_combined_stderr(True)
+
+                    # Process output in real-time, keep the tail for errors
+                    tail = collections.deque(maxlen=20)
                     for line in iter(stdout.readline, ""):
+                        tail.append(line)
                         if print_output:
-                            print(line, end="")  # Print each line from stdout
-                    error_output = stderr.read().decode()  # Capture any error output
+                            log(ec2_instance, line)
 
                     # Wait for command to complete
                     exit_status = stdout.channel.recv_exit_status()
+                    results.append(
+                        CommandResult(ec2_instance.name, command, exit_status, "".join(tail))
+                    )
                     if exit_status != 0:
-                        print(
-                            f"Command '{command}' failed with exit status {exit_status}. Error:\n{error_output}"
+                        failed.set()
+                        log(
+                            ec2_instance,
+                            f"Command '{command}' failed with exit status {exit_status}. Output:\n{''.join(tail)}",
                         )
-                ssh_client.close()
-                time.sleep(2)
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-    def install_cluster_dependencies(self) -> None:
-        commands = [
-        "sudo apt-get update",
-        "sudo apt-get install -y mysql-server wget sysbench python3-pip",
-        "sudo pip3 install flask mysql-connector-python requests",
-        "sudo sed -i 's/bind-address.*/bind-address = 0.0.0.0/' /etc/mysql/mysql.conf.d/mysqld.cnf",
-        'sudo mysql -e \'ALTER USER "root"@"localhost" IDENTIFIED WITH mysql_native_password BY "root_password";\'',
-        "sudo systemctl restart mysql",
-        "sudo systemctl enable mysql",
-        'sudo mysql -u root -p"root_password" -e \'CREATE USER IF NOT EXISTS "root"@"%" IDENTIFIED BY "root_password";\'',
-        'sudo mysql -u root -p"root_password" -e "GRANT ALL PRIVILEGES ON *.* TO \'root\'@\'%\';"',
-        'sudo mysql -u root -p"root_password" -e "FLUSH PRIVILEGES;"',
-        "wget https://downloads.mysql.com/docs/sakila-db.tar.gz",
-        "tar -xzvf sakila-db.tar.gz",
-        'sudo mysql -u root -p"root_password" -e "CREATE DATABASE IF NOT EXISTS sakila;"',
-        'sudo mysql -u root -p"root_password" sakila -e "source sakila-db/sakila-schema.sql"',
-        'sudo mysql -u root -p"root_password" sakila -e "source sakila-db/sakila-data.sql"',
-        'sudo mysql -u root -p"root_password" -e "SHOW DATABASES;"',
-        'sudo mysql -u root -p"root_password" -e "USE sakila; SHOW TABLES;"',
-        'echo "MYSQL_USER=root" | sudo tee -a /etc/environment',
-        'echo "MYSQL_PASSWORD=root_password" | sudo tee -a /etc/environment',
-        'echo "MYSQL_DB=sakila" | sudo tee -a /etc/environment',
-        'echo "MYSQL_HOST=localhost" | sudo tee -a /etc/environment',
-        "source /etc/environment",
+                        if fail_fast:
+                            break
+            except Exception as e:
+                failed.set()
+                log(ec2_instance, f"An error occurred: {e}")
+                results.append(CommandResult(ec2_instance.name, None, None, str(e)))
+            return results
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                ec2_instance.name: executor.submit(run, ec2_instance)
+                for ec2_instance in instances
+            }
+            results = {name: future.result() for name, future in futures.items()}
+
+        failures = [
+            result for instance_results in results.values() for result in instance_results
+            if result.exit_status != 0
+        ]
+        for result in failures:
+            print(f"Failed on {result.instance}: {result.command or 'ssh'} (exit status {result.exit_status})")
+        if failures and fail_fast:
+            raise CommandError(failures)
+        return results
+
+    def _all_ec2_instances(self) -> list[EC2Instance]:
+        return [self.manager_instance] + self.worker_instances + self.proxy_instances + [
+            self.trusted_host_instance,
+            self.gatekeeper_instance,
         ]
 
-        self.execute_commands(commands, [self.manager_instance] + self.worker_instances, print_output=False)
+    def prepare_bundle(self) -> None:
+        """Build the offline bundle locally, before launch: the user-data of every node names it."""
+        self.state.record(bundle_path=build_bundle(SERVICE_FILES))
 
-    def install_network_instances_dependencies(self) -> None:
-        commands = [
-            "sudo apt-get update",
-            "sudo apt-get install -y python3-pip",
-            "sudo pip3 install flask requests",
-        ]
+    def push_bundle(self) -> None:
+        """
+        Push the offline bundle, and private_ips.json to the roles reading it,
+        to every node at once. Booting nodes wait for these files before
+        installing and starting their service. Nodes already holding them
+        are skipped.
+        """
+        bundle_path = self.state.resources["bundle_path"]
+        instance_files = {}
+        for ec2_instance in self._all_ec2_instances():
+            role = ec2_instance.name.rstrip("0123456789")
+            paths = [bundle_path] + [path for path in ROLE_FILES[role] if path == PRIVATE_ADDRESSES_FILE]
+            instance_files[ec2_instance.name] = (ec2_instance, paths)
+        self.upload_files(instance_files)
+
+    def push_addresses(self) -> None:
+        """
+        Push the local private_ips.json, as edited by the operator, to the
+        roles reading it. Their services swap in the new members within a
+        second, and removed ones drain.
+        """
+        with open(PRIVATE_ADDRESSES_FILE, "r") as f:
+            addresses = json.load(f)
+        self.upload_files({
+            ec2_instance.name: (ec2_instance, [PRIVATE_ADDRESSES_FILE])
+            for ec2_instance in self._all_ec2_instances()
+            if PRIVATE_ADDRESSES_FILE in ROLE_FILES[ec2_instance.name.rstrip("0123456789")]
+        })
+        # Later resumes write this membership again instead of the launched one
+        self.state.record(membership=addresses)
+
+    def wait_for_bootstrap(self, instances, timeout=1800) -> dict[str, float]:
+        """
+        Poll the readiness endpoint of every node concurrently until its
+        service is up. Raises with the failed step of each node whose
+        bootstrap failed. Prints and returns seconds to ready per role,
+        counted from launch.
+        """
+        started = getattr(self, "launch_started", time.monotonic())
+        deadline = time.monotonic() + timeout
 
-        # Liste des instances au lieu de les additionner
-        network_instances = [self.proxy_instance, self.trusted_host_instance, self.gatekeeper_instance]
-        self.execute_commands(commands, network_instances, print_output=False)
+        def fetch(host, path):
+            try:
+                with urllib.request.urlopen(f"http://{host}:{READINESS_PORT}/{path}", timeout=5) as response:
+                    return response.read().decode().strip()
+            except OSError:
+                # Not there yet (404), or the status server is not listening yet
+                return None
+
+        def ready(ec2_instance):
+            host = ec2_instance.instance.public_ip_address
+            while fetch(host, "ready") is None:
+                failed = fetch(host, "failed")
+                if failed is not None:
+                    raise RuntimeError(f"step {failed}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"still at step {fetch(host, 'step')}")
+                time.sleep(5)
+            return time.monotonic() - started
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(instances)) as executor:
+            futures = {
+                ec2_instance.name: executor.submit(ready, ec2_instance)
+                for ec2_instance in instances
+            }
+            time_to_ready, failures = {}, []
+            for name, future in futures.items():
+                try:
+                    time_to_ready[name] = future.result()
+                except Exception as e:
+                    failures.append(f"{name} ({e})")
+
+        for name, seconds in sorted(time_to_ready.items(), key=lambda item: item[1]):
+            print(f"Instance {name} bootstrapped after {seconds:.1f}s")
+        if failures:
+            raise RuntimeError(
+                f"Bootstrap failed on {', '.join(failures)}, see /var/log/cloud-init-output.log"
+            )
+        return time_to_ready
 
-    def run_sys_bench(self) -> None:
-        sysbench_commands = [
-            "sudo sysbench /usr/share/sysbench/oltp_read_only.lua --mysql-db=sakila --mysql-user='root' --mysql-password='root_password' prepare",
-            "sudo sysbench /usr/share/sysbench/oltp_read_only.lua --mysql-db=sakila --mysql-user='root' --mysql-password='root_password' run > sysbench_results.txt",
-        ]
-        # Execute commands
+    def run_sys_bench(
+        self,
+        scripts: list[str],
+        threads: list[int],
+        duration: int = 60,
+        tables: int = 3,
+        table_size: int = 10000,
+    ) -> list[dict]:
+        """
+        Run every sysbench script at every thread count on all database
+        nodes at once, one run after another on each node. Raw outputs are
+        kept in benchmark_sysbench/, the parsed records in
+        benchmark_sysbench/sysbench_results.json, and printed as a table.
+        """
+        db_instances = [self.manager_instance] + self.worker_instances
         self.execute_commands(
-            sysbench_commands,
-            [self.manager_instance] + self.worker_instances,
+            sysbench_driver.prepare_commands(tables, table_size),
+            db_instances,
             print_output=False,
+            fail_fast=True,
         )
 
-    def save_sys_bench_results(self) -> None:
-        try:
-            for ec2_instance in [self.manager_instance] + self.worker_instances:
-                # Connect to the instance
-                ssh_client = create_ssh_client(
-                    ec2_instance.instance.public_ip_address, "ubuntu", self.ssh_key_path
-                )
+        print_lock = threading.Lock()
 
-                # Download the sysbench results
-                scp = SCPClient(ssh_client.get_transport())
-                scp.get(
-                    "sysbench_results.txt",
-                    f"benchmark_sysbench/sysbench_results_{ec2_instance.get_name()}.txt",
-                )
-                print(
-                    f"Sysbench results downloaded to benchmark_sysbench/sysbench_results_{ec2_instance.get_name()}.txt"
-                )
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-        finally:
-            scp.close()
-            ssh_client.close()
+        def bench(ec2_instance):
+            host = ec2_instance.instance.public_ip_address
+            records = []
+            for script in scripts:
+                for thread_count in threads:
+                    command = sysbench_driver.run_command(script, thread_count, duration, tables, table_size)
+                    stdin, stdout, stderr = self.ssh_sessions.exec_command(host, command + " 2>&1")
+                    output = stdout.read().decode()
+                    exit_status = stdout.channel.recv_exit_status()
+                    with open(f"benchmark_sysbench/{ec2_instance.name}_{script}_{thread_count}.txt", "w") as f:
+                        f.write(output)
+                    if exit_status != 0:
+                        # The other runs of the sweep still tell something, keep going
+                        with print_lock:
+                            print(f"[{ec2_instance.name}] {script} x{thread_count} failed (exit status {exit_status}):")
+                            for line in output.splitlines()[-20:]:
+                                print(f"[{ec2_instance.name}] {line}")
+                        continue
+                    records.append(dict(
+                        sysbench_driver.parse_output(output),
+                        node=ec2_instance.name,
+                        script=script,
+                        threads=thread_count,
+                        duration_s=duration,
+                    ))
+                    with print_lock:
+                        print(f"[{ec2_instance.name}] {script} x{thread_count}: {records[-1]['tps']:.1f} tps")
+            return records
+
+        os.makedirs("benchmark_sysbench", exist_ok=True)
+        records = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(db_instances)) as executor:
+            futures = {
+                ec2_instance.name: executor.submit(bench, ec2_instance)
+                for ec2_instance in db_instances
+            }
+            for name, future in futures.items():
+                try:
+                    records += future.result()
+                except Exception as e:
+                    print(f"Sysbench failed on {name}: {e}")
 
-    def upload_flask_apps_to_instances(self):
-        try:
-            # Upload the Flask app to the manager instance
-            ssh_client = create_ssh_client(
-                self.manager_instance.instance.public_ip_address,
-                "ubuntu",
-                self.ssh_key_path,
-            )
-            scp = SCPClient(ssh_client.get_transport())
-            scp.put("utils/manager.py", "manager.py")
-            scp.put("public_ips.json", "public_ips.json")
+        self.execute_commands(
+            [sysbench_driver.cleanup_command(tables, table_size)], db_instances, print_output=False
+        )
+        with open("benchmark_sysbench/sysbench_results.json", "w") as f:
+            json.dump(records, f, indent=4)
+        sysbench_driver.print_table(records)
+        return records
 
-        except Exception as e:
-            print(f"An error occurred: {e}")
+    def upload_files(
+        self, instance_files: dict[str, tuple[EC2Instance, list[str]]], max_workers: int = 8
+    ) -> None:
+        """
+        Copy local files to the home directory of instances, all instances
+        at once. A file is only sent when the remote copy is missing or its
+        SHA-256 differs, so a redeploy only pushes what changed. Raises once
+        every instance is done if any of them failed.
+        """
+        print_lock = threading.Lock()
 
-        finally:
-            scp.close()
-            ssh_client.close()
+        def upload(name, ec2_instance, paths):
+            host = ec2_instance.instance.public_ip_address
+            remote_names = [os.path.basename(path) for path in paths]
 
-        # Upload worker script to worker instances
-        for worker in self.worker_instances:
-            try:
-                ssh_client = create_ssh_client(
-                    worker.instance.public_ip_address, "ubuntu", self.ssh_key_path
-                )
-                scp = SCPClient(ssh_client.get_transport())
-                scp.put("utils/worker.py", "worker.py")
-            except Exception as e:
+            # One round trip for every remote checksum, missing files are left out
+            stdin, stdout, stderr = self.ssh_sessions.exec_command(
+                host, "sha256sum " + " ".join(remote_names) + " 2>/dev/null"
+            )
+            remote_digests = {}
+            for line in stdout.read().decode().splitlines():
+                digest, _, remote_name = line.partition("  ")
+                remote_digests[remote_name] = digest
+
+            changed = []
+            for path, remote_name in zip(paths, remote_names):
+                with open(path, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() != remote_digests.get(remote_name):
+                        changed.append((path, remote_name))
+
+            if changed:
+                scp = self.ssh_sessions.scp(host)
+                try:
+                    for path, remote_name in changed:
+                        scp.put(path, remote_name)
+                finally:
+                    scp.close()
+            with print_lock:
                 print(
-                    f"Error uploading and starting worker script on {worker.get_name()}: {e}"
+                    f"[{name}] uploaded {len(changed)} file(s), "
+                    f"{len(paths) - len(changed)} unchanged"
                 )
-            finally:
-                scp.close()
-                ssh_client.close()
-
-        # Upload proxy script to proxy instance
-        try:
-            ssh_client = create_ssh_client(
-                self.proxy_instance.instance.public_ip_address,
-                "ubuntu",
-                self.ssh_key_path,
-            )
-            scp = SCPClient(ssh_client.get_transport())
-            scp.put("utils/proxy.py", "proxy.py")
-            scp.put("public_ips.json", "public_ips.json")
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-        finally:
-            scp.close()
-            ssh_client.close()
-
-        # Upload trusted host script to trusted host instance
-        try:
-            ssh_client = create_ssh_client(
-                self.trusted_host_instance.instance.public_ip_address,
-                "ubuntu",
-                self.ssh_key_path,
-            )
-            scp = SCPClient(ssh_client.get_transport())
-            scp.put("utils/trusted_host.py", "trusted_host.py")
-            scp.put("public_ips.json", "public_ips.json")
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-        finally:
-            scp.close()
-            ssh_client.close()
-
-        # Upload gatekeeper script to gatekeeper instance
-        try:
-            ssh_client = create_ssh_client(
-                self.gatekeeper_instance.instance.public_ip_address,
-                "ubuntu",
-                self.ssh_key_path,
-            )
-            scp = SCPClient(ssh_client.get_transport())
-            scp.put("utils/gatekeeper.py", "gatekeeper.py")
-            scp.put("public_ips.json", "public_ips.json")
 
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-        finally:
-            scp.close()
-            ssh_client.close()
-
-    def start_db_cluster_apps(self):
-        # Start the Flask app on the manager instance
-        commands = [
-            "nohup python3 manager.py > manager_output.log 2>&1 &",
-        ]
-        self.execute_commands(commands, [self.manager_instance])
-
-        # Start the Flask app on the worker instances
-        commands = [
-            "nohup python3 worker.py > worker_output.log 2>&1 &",
-        ]
-        self.execute_commands(commands, self.worker_instances)
-
-    def start_proxy_app(self) -> None:
-        # Start the Flask app on the proxy instance
-        commands = [
-            "nohup python3 proxy.py > proxy_output.log 2>&1 &",
-        ]
-        self.execute_commands(commands, [self.proxy_instance])
-
-    def start_trusted_host_app(self) -> None:
-        # Start the Flask app on the trusted host instance
-        commands = [
-            "nohup python3 trusted_host.py > trusted_host_output.log 2>&1 &",
-        ]
-        self.execute_commands(commands, [self.trusted_host_instance])
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                name: executor.submit(upload, name, ec2_instance, paths)
+                for name, (ec2_instance, paths) in instance_files.items()
+            }
+            failures = []
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error uploading files to {name}: {e}")
+                    failures.append(name)
+        if failures:
+            raise RuntimeError(f"Upload failed for {', '.join(failures)}")
 
-    def start_gatekeeper_app(self) -> None:
-        # Start the Flask app on the gatekeeper instance
-        commands = [
-            "nohup python3 gatekeeper.py > gatekeeper_output.log 2>&1 &",
+    def cleanup(self, all_instances):
+        """
+        Dependency-aware teardown of everything the state records, creating
+        nothing. Independent
+        deletions run concurrently, and deletions blocked by a resource
+        AWS has not released yet are retried with backoff instead of after
+        fixed sleeps. Resources already gone count as deleted. Prints and
+        returns seconds per deleted step and the error of each failed one.
+        """
+        self.ssh_sessions.close_all()
+        instance_ids = [i.instance.id for i in all_instances]
+        security_group_ids = [
+            getattr(self, attribute) for attribute in SECURITY_GROUPS if getattr(self, attribute)
         ]
-        self.execute_commands(commands, [self.gatekeeper_instance])
 
-    def cleanup(self, all_instances):
-        """Enhanced cleanup to remove all created resources"""
-        try:
-            # Terminate instances
-            instance_ids = [i.instance.id for i in all_instances]
+        def terminate_instances():
+            if not instance_ids:
+                return
             self.ec2_client.terminate_instances(InstanceIds=instance_ids)
-            
             waiter = self.ec2_client.get_waiter('instance_terminated')
-            waiter.wait(InstanceIds=instance_ids)
-            
-            # Delete security groups
-            for sg_id in [self.cluster_security_group_id, self.proxy_security_group_id,
-                         self.trusted_host_security_group_id, self.gatekeeper_security_group_id]:
-                self.ec2_client.delete_security_group(GroupId=sg_id)
-            
-            # Detach and delete internet gateway
-            self.ec2_client.detach_internet_gateway(
-                InternetGatewayId=self.igw['InternetGatewayId'],
-                VpcId=self.vpc_id
-            )
-            self.ec2_client.delete_internet_gateway(
-                InternetGatewayId=self.igw['InternetGatewayId']
+            waiter.wait(InstanceIds=instance_ids, WaiterConfig={"Delay": 5, "MaxAttempts": 120})
+
+        def delete_route_table():
+            route_table_id = self.route_table['RouteTableId']
+            route_tables = self.ec2_client.describe_route_tables(RouteTableIds=[route_table_id])
+            for association in route_tables['RouteTables'][0]['Associations']:
+                self.ec2_client.disassociate_route_table(
+                    AssociationId=association['RouteTableAssociationId']
+                )
+            self.ec2_client.delete_route_table(RouteTableId=route_table_id)
+
+        def delete_key_pair():
+            self.ec2_client.delete_key_pair(KeyName=self.key_name)
+            if os.path.exists(self.ssh_key_path):
+                os.remove(self.ssh_key_path)
+
+        # step -> (deletion, steps it has to wait for)
+        steps = {
+            "instances": (terminate_instances, []),
+            "key_pair": (delete_key_pair, []),
+            "route_table": (delete_route_table, []),
+            "internet_gateway_detach": (
+                lambda: self.ec2_client.detach_internet_gateway(
+                    InternetGatewayId=self.igw['InternetGatewayId'], VpcId=self.vpc_id
+                ),
+                ["instances"],
+            ),
+            "internet_gateway": (
+                lambda: self.ec2_client.delete_internet_gateway(
+                    InternetGatewayId=self.igw['InternetGatewayId']
+                ),
+                ["internet_gateway_detach"],
+            ),
+            "subnet": (
+                lambda: self.ec2_client.delete_subnet(SubnetId=self.subnet['SubnetId']),
+                ["instances", "route_table"],
+            ),
+        }
+        for security_group_id in security_group_ids:
+            steps[f"security_group {security_group_id}"] = (
+                functools.partial(self.ec2_client.delete_security_group, GroupId=security_group_id),
+                ["instances"],
             )
-            
-            time.sleep(60)
-            
-            # Delete route table
-            self.ec2_client.delete_route_table(
-                RouteTableId=self.route_table['RouteTableId']
+        if "placement_group_name" in self.state.resources:
+            steps["placement_group"] = (
+                lambda: self.ec2_client.delete_placement_group(
+                    GroupName=self.state.resources["placement_group_name"]
+                ),
+                ["instances"],
             )
-            
-            time.sleep(20)
-            # Delete subnet
-            self.ec2_client.delete_subnet(
-                SubnetId=self.subnet['SubnetId']
+        # A deployment interrupted early recorded only some of the network
+        recorded = {
+            "route_table": self.route_table['RouteTableId'],
+            "internet_gateway_detach": self.igw['InternetGatewayId'],
+            "internet_gateway": self.igw['InternetGatewayId'],
+            "subnet": self.subnet['SubnetId'],
+        }
+        for name, resource_id in recorded.items():
+            if not resource_id:
+                del steps[name]
+        if self.vpc_id:
+            steps["vpc"] = (
+                lambda: self.ec2_client.delete_vpc(VpcId=self.vpc_id),
+                [name for name in steps if name not in ("key_pair", "instances", "placement_group")],
             )
-            
-            time.sleep(20)
-            # Delete VPC
-            self.ec2_client.delete_vpc(VpcId=self.vpc_id)
-            
-            # Delete key pair
-            self.ec2_client.delete_key_pair(KeyName=self.key_name)
-            os.remove(self.ssh_key_path)
-            
-        except ClientError as e:
-            print(f"An error occurred during cleanup: {e}")
-            
+        steps = {
+            name: (delete, [dependency for dependency in dependencies if dependency in steps])
+            for name, (delete, dependencies) in steps.items()
+        }
+
+        timings, failures = run_teardown_steps(steps)
+        for name, seconds in timings.items():
+            print(f"Deleted {name} in {seconds:.1f}s")
+        for name, error in failures.items():
+            print(f"An error occurred during cleanup of {name}: {error}")
+        return timings, failures
+
     def _get_latest_ubuntu_ami(self):
         """
         Get the latest Ubuntu AMI ID.
@@ -739,89 +1228,194 @@ class EC2Class:
 # Main
 
 
-ec2_manager = EC2Class()
+# Deployment phases, in order. A resumed deployment skips the completed
+# ones, except those that only reattach or rewrite local files.
+PHASES = [
+    "key_pair",
+    "bundle",
+    "instances",
+    "ready",
+    "inbound_rules",
+    "ip_files",
+    "push",
+    "bootstrap",
+    "sysbench",
+    "benchmark",
+    "cleanup",
+]
+ALWAYS_RUN = {"instances", "ip_files"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deploy the DB cluster on EC2")
+    parser.add_argument("--state", default="deployment_state.json", help="deployment state file")
+    parser.add_argument("--topology", default="topologies/default.json",
+                        help="worker count, instance types and placement, for a new deployment")
+    parser.add_argument("--sysbench-scripts", nargs="+", choices=list(sysbench_driver.SCRIPTS),
+                        default=["read_only"], help="sysbench OLTP scripts run on every database node")
+    parser.add_argument("--sysbench-threads", nargs="+", type=int, default=[1, 4, 16],
+                        help="thread counts swept for every script")
+    parser.add_argument("--sysbench-time", type=int, default=60, help="seconds per sysbench run")
+    parser.set_defaults(keep=False, from_phase=None)
+    subparsers = parser.add_subparsers(dest="command")
+    deploy = subparsers.add_parser("deploy", help="provision a new cluster (default)")
+    deploy.add_argument("--keep", action="store_true", help="leave the cluster running, skip cleanup")
+    resume = subparsers.add_parser("resume", help="continue the deployment recorded in the state file")
+    resume.add_argument("--from", dest="from_phase", choices=PHASES, help="run this phase and later ones again")
+    resume.add_argument("--keep", action="store_true", help="leave the cluster running, skip cleanup")
+    subparsers.add_parser("cleanup", help="tear down the cluster recorded in the state file")
+    subparsers.add_parser("membership", help="push an edited private_ips.json to the running services")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    state = DeploymentState(args.state)
+
+    if args.command in (None, "deploy") and state.exists():
+        raise SystemExit(
+            f"{args.state} records an existing deployment, use 'resume' or 'cleanup'"
+        )
+    if args.command in ("resume", "cleanup", "membership") and not state.exists():
+        raise SystemExit(f"No deployment recorded in {args.state}")
+
+    # A recorded deployment keeps the topology it was launched with, a new
+    # one records it along with its first resource
+    if "topology" in state.resources:
+        topology = Topology(**state.resources["topology"])
+    else:
+        topology = Topology.load(args.topology)
+    # Tearing down or pushing to a cluster never creates anything
+    ec2_manager = EC2Class(state, topology, provision=args.command in (None, "deploy", "resume"))
+
+    if args.command == "cleanup":
+        timings, failures = ec2_manager.cleanup(ec2_manager.attach_instances())
+        if not failures:
+            state.delete()
+        return
+
+    if args.command == "membership":
+        ec2_manager.attach_instances()
+        ec2_manager.push_addresses()
+        return
+
+    if args.command == "resume" and args.from_phase:
+        # Running instances hold the key they were launched with and are only reattached
+        if state.instances and args.from_phase in ("key_pair", "instances"):
+            raise SystemExit(
+                f"Instances are running, resume --from {args.from_phase} would replace what they use; "
+                "run 'cleanup' and deploy again instead"
+            )
+        state.reset_from(PHASES, args.from_phase)
+
+    all_instances = []
+
+    def key_pair():
+        os.system("rm -rf benchmark_sysbench")
+        os.system("mkdir benchmark_sysbench")
+        ec2_manager.create_key_pair()
+
+    def bundle():
+        # Built before launch, the user-data of every node names its version
+        print("Building the dependency bundle...")
+        ec2_manager.prepare_bundle()
+
+    def instances():
+        # Launches only the roles not recorded yet, reattaches the others
+        all_instances[:] = ec2_manager.launch_instances()
+
+    def ready():
+        # Wait for instances to be reachable over SSH, they keep bootstrapping meanwhile
+        print("Waiting for instances to be ready...")
+        ec2_manager.wait_until_ready(all_instances)
+        print("All instances are ready.")
+
+    def ip_files():
+        # Save manager and worker ips to a JSON file
+        for ec2_instance in all_instances:
+            ec2_instance.instance.reload()
+        instance_data_ip = {}
+        for ec2_instance in all_instances:
+            instance_data_ip[ec2_instance.name] = ec2_instance.instance.public_ip_address
+        # Services call each other inside the VPC, the public addresses are for SSH and
+        # benchmarks. A membership pushed by the operator is kept over the launched one
+        private_ips = state.resources.get("membership") or {
+            ec2_instance.name: ec2_instance.instance.private_ip_address
+            for ec2_instance in all_instances
+        }
+        # Every instance, benchmark.py cloudwatch plots their metrics
+        instance_data = {
+            instance.name: {
+                "instance_id": instance.instance.id
+            }
+            for instance in all_instances
+        }
 
-os.system("rm -rf benchmark_sysbench")
-os.system("mkdir benchmark_sysbench")
+        with open("instance_info.json", "w") as f:
+            json.dump(instance_data, f, indent=4)
 
-ec2_manager.create_key_pair()
-time.sleep(5)
-all_instances = ec2_manager.launch_instances()
+        with open("public_ips.json", "w") as file:
+            json.dump(instance_data_ip, file, indent=4)
 
-# Wait for instances to be running
-print("Waiting for instances to be running...")
-for ec2_instance in all_instances:
-    ec2_instance.instance.wait_until_running()
-    ec2_instance.instance.reload()
-    print(f"Instance {ec2_instance.get_name()} is running.")
+        with open(PRIVATE_ADDRESSES_FILE, "w") as file:
+            json.dump(private_ips, file, indent=4)
 
-print("All instances are running.")
-time.sleep(10)
+    def push():
+        print("Pushing the dependency bundle and private_ips.json...")
+        ec2_manager.push_bundle()
 
-ec2_manager.add_inbound_rules()
+    def bootstrap():
+        # Nodes install and start their service from the user-data, only wait for them
+        print("Waiting for nodes to bootstrap...")
+        ec2_manager.wait_for_bootstrap(all_instances)
+        print("All nodes are serving.")
 
-# Save manager and worker ips to a JSON file
-instance_data_ip = {}
-for ec2_instance in all_instances:
-    instance_data_ip[ec2_instance.name] = ec2_instance.instance.public_ip_address
-sql_instances = []
-sql_instances.append(ec2_manager.manager_instance)
-sql_instances.extend(ec2_manager.worker_instances)
+    def sysbench():
+        print("Running sysbench...")
+        ec2_manager.run_sys_bench(args.sysbench_scripts, args.sysbench_threads, args.sysbench_time)
 
-instance_data = {
-    instance.name: {
-        "instance_id": instance.instance.id
+    def benchmark():
+        print("\nStarting benchmark tests...")
+        try:
+            print("Running benchmark.py...")
+            os.system("python benchmark.py")
+            print("Benchmark completed successfully.")
+        except Exception as e:
+            print(f"Error during benchmark: {e}")
+
+    def cleanup():
+        print("\nBenchmark completed. Starting cleanup...")
+        timings, failures = ec2_manager.cleanup(all_instances)
+        if failures:
+            raise RuntimeError(f"Cleanup failed for {', '.join(failures)}")
+        state.delete()
+        print("Cleanup complete.")
+
+    phases = {
+        "key_pair": key_pair,
+        "bundle": bundle,
+        "instances": instances,
+        "ready": ready,
+        "inbound_rules": ec2_manager.add_inbound_rules,
+        "ip_files": ip_files,
+        "push": push,
+        "bootstrap": bootstrap,
+        "sysbench": sysbench,
+        "benchmark": benchmark,
+        "cleanup": cleanup,
     }
-    for instance in sql_instances
-}
-
-with open("instance_info.json", "w") as f:
-    json.dump(instance_data, f, indent=4)
-
-with open("public_ips.json", "w") as file:
-    json.dump(instance_data_ip, file, indent=4)
-
-print("Installing cluster dependencies...")
-ec2_manager.install_cluster_dependencies()
-
-print("Installing proxy dependencies...")
-ec2_manager.install_network_instances_dependencies()
-
-print("Running sysbench...")
-ec2_manager.run_sys_bench()
-
-print("Saving sysbench results...")
-ec2_manager.save_sys_bench_results()
-
-print("Uploading Flask apps to instances...")
-ec2_manager.upload_flask_apps_to_instances()
-
-print("Starting Flask apps for the manager and workers...")
-ec2_manager.start_db_cluster_apps()
-
-print("Starting Flask app for the proxy...")
-ec2_manager.start_proxy_app()
-
-print("Starting Flask app for the trusted host...")
-ec2_manager.start_trusted_host_app()
-
-print("Starting Flask app for the gatekeeper...")
-ec2_manager.start_gatekeeper_app()
-
-# Benchmark
-print("\nStarting benchmark tests...")
-try:
-    print("Running benchmark.py...")
-    os.system("python benchmark.py")
-    print("Benchmark completed successfully.")
-except Exception as e:
-    print(f"Error during benchmark: {e}")
-
-print("\nBenchmark completed. Starting cleanup...")
-time.sleep(30)  
-
-
-# Cleanup
-
-ec2_manager.cleanup(all_instances)
-print("Cleanup complete.")
+    for name in PHASES:
+        if name == "cleanup" and args.keep:
+            print("Cluster left running, tear it down with: python main.py cleanup")
+            break
+        if state.is_complete(name) and name not in ALWAYS_RUN:
+            print(f"Phase {name} already done, skipping")
+            continue
+        print(f"Phase {name}...")
+        phases[name]()
+        if name != "cleanup":
+            state.complete(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import gc
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import requests
+from flask import Flask, jsonify, request
+
+UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils")
+
+MODES = ["DIRECT_HIT", "RANDOM", "CUSTOMIZED"]
+
+READ = {"query": "SELECT * FROM actor WHERE actor_id = %s;", "params": [1]}
+WRITE = {"query": "INSERT INTO actor (first_name, last_name) VALUES (%s, %s);", "params": ["Test", "User"]}
+
+# What the stubbed upstreams and database answer
+UPSTREAM_BODY = {"handled_by": "manager", "result": [[1, "PENELOPE", "GUINESS", "2006-02-15 04:34:33"]]}
+DB_ROWS = [[1, "PENELOPE", "GUINESS", "2006-02-15 04:34:33"]]
+
+PUBLIC_IPS = {
+    "gatekeeper": "127.0.0.1:5100",
+    "trusted_host": "127.0.0.1:5101",
+    "proxy": "127.0.0.1:5102",
+    "manager": "127.0.0.1:5103",
+    "worker1": "127.0.0.1:5104",
+    "worker2": "127.0.0.1:5105",
+}
+
+
+def stub_response(body=UPSTREAM_BODY, status=200):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def stub_requests():
+    """Stands in for the requests module of a service: every upstream answers at once."""
+    response = stub_response()
+
+    def post(url, **kwargs):
+        return response
+
+    def get(url, **kwargs):
+        return response
+
+    return types.SimpleNamespace(post=post, get=get, exceptions=requests.exceptions)
+
+
+class StubDB:
+    """Stands in for the connection pool, so only the hop itself is measured."""
+
+    def execute(self, query, params=()):
+        return None if query.lstrip().lower().startswith(("insert", "update", "delete")) else DB_ROWS
+
+    def stats(self):
+        return {}
+
+
+def load_service(name, workdir):
+    """Import utils/<name>.py in isolation, wired to stubbed upstreams and database."""
+    os.environ["DB_BACKEND"] = "sqlite"  # never connects, db is replaced below
+    os.environ["SQLITE_PATH"] = os.path.join(workdir, "unused.db")
+    module = importlib.import_module(name)
+    module.requests = stub_requests()
+    if hasattr(module, "db"):
+        module.db = StubDB()
+    return module
+
+
+def bare_app():
+    """A Flask app that only parses and echoes the body: the floor every hop pays."""
+    app = Flask("bare")
+
+    @app.route("/query", methods=["POST"])
+    def query():
+        return jsonify(request.json), 200
+
+    return types.SimpleNamespace(app=app)
+
+
+def measure(app, body, requests_count, warmup, repeat, headers=None):
+    """
+    Per in-process request: wall clock and CPU ns (best of `repeat` rounds),
+    memory blocks left allocated, and peak traced bytes while handling it.
+    CPU is the whole process's, so the replication, ping and broadcast work
+    services hand to their thread pools is counted with the request.
+    """
+    client = app.test_client()
+    for _ in range(warmup):
+        client.post("/query", json=body, headers=headers)
+
+    rounds = []
+    for _ in range(repeat):
+        # Collected before and after each round, so only what requests keep alive counts
+        gc.collect()
+        blocks_start = sys.getallocatedblocks()
+        wall_start = time.perf_counter_ns()
+        cpu_start = time.process_time_ns()
+        for _ in range(requests_count):
+            response = client.post("/query", json=body, headers=headers)
+        cpu_ns = time.process_time_ns() - cpu_start
+        wall_ns = time.perf_counter_ns() - wall_start
+        gc.collect()
+        rounds.append((wall_ns, cpu_ns, sys.getallocatedblocks() - blocks_start))
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Benchmark request failed: {response.status_code} {response.get_data(as_text=True)}"
+            )
+
+    # Separate pass, tracemalloc slows every allocation down
+    alloc_requests = max(1, requests_count // 10)
+    tracemalloc.start()
+    peak = 0
+    for _ in range(alloc_requests):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        client.post("/query", json=body, headers=headers)
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return {
+        "requests": requests_count,
+        "wall_ns": min(wall_ns for wall_ns, _, _ in rounds) / requests_count,
+        "cpu_ns": min(cpu_ns for _, cpu_ns, _ in rounds) / requests_count,
+        "retained_blocks": max(blocks for _, _, blocks in rounds) / requests_count,
+        "alloc_peak_bytes": peak / alloc_requests,
+    }
+
+
+def run_suite(services, modes, requests_count, warmup, repeat, timing):
+    headers = {"X-Request-Timing": "1"} if timing else None
+    workdir = tempfile.mkdtemp(prefix="microbench-")
+    with open(os.path.join(workdir, "public_ips.json"), "w") as f:
+        json.dump(PUBLIC_IPS, f)
+    os.chdir(workdir)  # services read public_ips.json from the working directory
+    sys.path.insert(0, UTILS_DIR)
+
+    # Keep the per-request INFO logs (their formatting is part of the cost) off the terminal
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"), force=True)
+
+    cases = [("flask (bare)", bare_app(), None)]
+    for name in services:
+        module = load_service(name, workdir)
+        if name == "proxy":
+            for mode in modes:
+                cases.append((f"proxy {mode}", module, mode))
+        else:
+            cases.append((name, module, None))
+
+    results = []
+    for label, module, mode in cases:
+        if mode is not None:
+            module.mode = mode
+        for kind, body in (("read", READ), ("write", WRITE)):
+            results.append(dict(
+                measure(module.app, body, requests_count, warmup, repeat, headers), hop=label, kind=kind,
+            ))
+
+    # Overhead of each hop over the bare Flask request handling
+    floor = {result["kind"]: result for result in results if result["hop"] == "flask (bare)"}
+    for result in results:
+        for name in ("wall_ns", "cpu_ns", "alloc_peak_bytes"):
+            result[f"overhead_{name}"] = result[name] - floor[result["kind"]][name]
+    return results
+
+
+def print_results(results):
+    print(f"{'hop':22s} {'kind':5s} {'ns/req':>9s} {'CPU ns/req':>11s} {'+ns/req':>9s} {'+CPU ns/req':>11s} "
+          f"{'peak B/req':>10s} {'+peak B/req':>11s} {'retained blocks/req':>19s}")
+    for result in results:
+        print(f"{result['hop']:22s} {result['kind']:5s} {result['wall_ns']:9.0f} {result['cpu_ns']:11.0f} "
+              f"{result['overhead_wall_ns']:9.0f} {result['overhead_cpu_ns']:11.0f} "
+              f"{result['alloc_peak_bytes']:10.0f} {result['overhead_alloc_peak_bytes']:11.0f} "
+              f"{result['retained_blocks']:19.2f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Per-hop overhead of each service, in process, with stubbed upstreams and database"
+    )
+    parser.add_argument("--services", nargs="+", default=["gatekeeper", "trusted_host", "proxy", "manager", "worker"],
+                        choices=["gatekeeper", "trusted_host", "proxy", "manager", "worker"])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="proxy modes")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per case")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per case, the fastest is kept")
+    parser.add_argument("--timing", action="store_true", help="ask for Server-Timing breakdowns, as benchmark traces do")
+    parser.add_argument("--output", default="microbench_results.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    results = run_suite(args.services, args.modes, args.requests, args.warmup, args.repeat, args.timing)
+    print_results(results)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
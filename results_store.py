@@ -0,0 +1,129 @@
+import datetime
+import json
+import os
+import subprocess
+import uuid
+
+import pandas as pd
+
+TABLES = ("runs", "histograms", "timeline", "resources")
+
+
+def git_revision():
+    """(commit, dirty) of the checkout benchmark.py runs from, or (None, None) outside git."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=repo, capture_output=True, text=True, check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def _flatten_sample(sample):
+    # Nested sources ("mysql": {...}) become mysql_<name> columns
+    row = {}
+    for name, value in sample.items():
+        if isinstance(value, dict):
+            for key, nested in value.items():
+                row[f"{name}_{key}"] = nested
+        else:
+            row[name] = value
+    return row
+
+
+class ResultStore:
+    """
+    Append-only Parquet store of benchmark runs. Every run writes one new
+    file per table and never touches earlier ones:
+
+        <root>/runs/<run_id>.parquet        one row per mode: config, git revision, summary
+        <root>/histograms/<run_id>.parquet  latency histogram buckets per mode and kind
+        <root>/timeline/<run_id>.parquet    per-second latency of open-loop runs
+        <root>/resources/<run_id>.parquet   node resource samples taken with --monitor
+
+    Run ids start with the UTC time of the run, so files sort chronologically.
+    """
+
+    def __init__(self, root="benchmark_store"):
+        self.root = root
+
+    def _path(self, table, run_id):
+        return os.path.join(self.root, table, f"{run_id}.parquet")
+
+    def record_run(self, command, config, results):
+        """Persist the per-mode reports of one benchmark invocation, return its run id."""
+        recorded_at = datetime.datetime.now(datetime.timezone.utc)
+        run_id = f"{recorded_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        commit, dirty = git_revision()
+
+        tables = {table: [] for table in TABLES}
+        for mode, report in results.items():
+            summary = {
+                key: value for key, value in report.items()
+                if key not in ("timeline", "resources")
+            }
+            if "resources" in report:
+                summary["resources"] = report["resources"]["summary"]
+            row = {
+                "run_id": run_id,
+                "recorded_at": recorded_at,
+                "command": command,
+                "mode": mode,
+                "git_revision": commit,
+                "git_dirty": dirty,
+                "config": json.dumps(config, sort_keys=True, default=str),
+            }
+            for kind in ("read", "write"):
+                if isinstance(report.get(kind), dict) and "histogram" in report[kind]:
+                    kind_report = summary[kind] = dict(report[kind])
+                    histogram = kind_report.pop("histogram")
+                    row[f"{kind}_throughput"] = kind_report["throughput"]
+                    row[f"{kind}_p99_ms"] = kind_report["latency"]["p99_ms"]
+                    row[f"{kind}_errors"] = sum(kind_report["errors"].values())
+                    tables["histograms"] += [
+                        {"run_id": run_id, "mode": mode, "kind": kind, "bucket": int(bucket),
+                         "count": count, "max_us": histogram["max_us"]}
+                        for bucket, count in histogram["counts"].items()
+                    ]
+            row["summary"] = json.dumps(summary, default=str)
+            tables["runs"].append(row)
+
+            for second in report.get("timeline", []):
+                tables["timeline"].append(dict(second, run_id=run_id, mode=mode))
+            for role, samples in report.get("resources", {}).get("samples", {}).items():
+                for sample in samples:
+                    tables["resources"].append(dict(_flatten_sample(sample), run_id=run_id, mode=mode, role=role))
+
+        for table, rows in tables.items():
+            if rows:
+                os.makedirs(os.path.join(self.root, table), exist_ok=True)
+                pd.DataFrame(rows).to_parquet(self._path(table, run_id), index=False)
+        return run_id
+
+    def runs(self):
+        """Every recorded (run, mode) row, oldest first."""
+        directory = os.path.join(self.root, "runs")
+        paths = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        if not paths:
+            return pd.DataFrame()
+        # Concatenated file by file, columns differ between commands
+        frames = [pd.read_parquet(os.path.join(directory, path)) for path in paths]
+        return pd.concat(frames, ignore_index=True).sort_values("recorded_at", kind="stable")
+
+    def load(self, table, run_id, mode=None):
+        """Rows of one table for a run (and mode), empty if the run has none."""
+        path = self._path(table, run_id)
+        if not os.path.exists(path):
+            if not os.path.exists(self._path("runs", run_id)):
+                raise KeyError(f"No run {run_id} in {self.root}")
+            return pd.DataFrame()
+        frame = pd.read_parquet(path)
+        if mode is not None:
+            frame = frame[frame["mode"] == mode]
+        return frame
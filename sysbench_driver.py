@@ -0,0 +1,105 @@
+import re
+
+# Name used on the command line -> sysbench OLTP script, all share the sbtest tables
+SCRIPTS = {
+    "read_only": "oltp_read_only",
+    "read_write": "oltp_read_write",
+    "point_select": "oltp_point_select",
+}
+
+MYSQL_OPTIONS = "--db-driver=mysql --mysql-user=root --mysql-password=root_password --mysql-db=sbtest"
+
+_NUMBER = r"([\d.]+)"
+# Summary lines of a sysbench 1.0 run -> record field
+_SUMMARY = {
+    rf"^\s*read:\s+{_NUMBER}": "reads",
+    rf"^\s*write:\s+{_NUMBER}": "writes",
+    rf"^\s*other:\s+{_NUMBER}": "other",
+    rf"^\s*transactions:\s+\d+\s+\({_NUMBER} per sec\.\)": "tps",
+    rf"^\s*queries:\s+\d+\s+\({_NUMBER} per sec\.\)": "qps",
+    rf"^\s*ignored errors:\s+\d+\s+\({_NUMBER} per sec\.\)": "errors_per_s",
+    rf"^\s*reconnects:\s+\d+\s+\({_NUMBER} per sec\.\)": "reconnects_per_s",
+    rf"^\s*total time:\s+{_NUMBER}s": "total_time_s",
+    rf"^\s*total number of events:\s+{_NUMBER}": "events",
+    rf"^\s*min:\s+{_NUMBER}": "min_ms",
+    rf"^\s*avg:\s+{_NUMBER}": "avg_ms",
+    rf"^\s*max:\s+{_NUMBER}": "max_ms",
+    rf"^\s*95th percentile:\s+{_NUMBER}": "p95_ms",
+}
+# "     12.984 |*****                                    1234"
+_HISTOGRAM_ROW = re.compile(rf"^\s*{_NUMBER}\s+\|\**\s+(\d+)\s*$")
+
+
+def table_options(tables, table_size):
+    return f"{MYSQL_OPTIONS} --tables={tables} --table-size={table_size}"
+
+
+def prepare_commands(tables, table_size):
+    """Create the sbtest tables every script runs against."""
+    return [
+        'sudo mysql -u root -p"root_password" -e "DROP DATABASE IF EXISTS sbtest; CREATE DATABASE sbtest;"',
+        f"sysbench {table_options(tables, table_size)} /usr/share/sysbench/oltp_read_write.lua prepare",
+    ]
+
+
+def run_command(script, threads, duration, tables, table_size):
+    # The histogram gives every percentile, --percentile only one
+    return (
+        f"sysbench {table_options(tables, table_size)} --threads={threads} --time={duration} "
+        f"--histogram=on --percentile=95 /usr/share/sysbench/{SCRIPTS[script]}.lua run"
+    )
+
+
+def cleanup_command(tables, table_size):
+    return f"sysbench {table_options(tables, table_size)} /usr/share/sysbench/oltp_read_write.lua cleanup"
+
+
+def _percentile(histogram, fraction):
+    total = sum(count for _, count in histogram)
+    seen = 0
+    for value, count in histogram:
+        seen += count
+        if seen >= fraction * total:
+            return value
+    return None
+
+
+def parse_output(text):
+    """
+    Throughput, query mix and latency of one `sysbench ... run` output. The
+    percentiles come from the --histogram rows, upper bounds in ms.
+    """
+    record = {}
+    histogram = []
+    for line in text.splitlines():
+        match = _HISTOGRAM_ROW.match(line)
+        if match:
+            histogram.append((float(match.group(1)), int(match.group(2))))
+            continue
+        for pattern, field in _SUMMARY.items():
+            match = re.match(pattern, line)
+            if match:
+                record[field] = float(match.group(1))
+                break
+    if "tps" not in record:
+        raise ValueError("Not a sysbench run output")
+    if histogram:
+        record["p50_ms"] = _percentile(histogram, 0.50)
+        record["p99_ms"] = _percentile(histogram, 0.99)
+    return record
+
+
+def _node_order(name):
+    """worker2 before worker10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def print_table(records):
+    """One row per node, script and thread count, nodes side by side for each setting."""
+    print(f"{'script':13s} {'threads':>7s} {'node':12s} {'tps':>9s} {'qps':>10s} "
+          f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'err/s':>7s}")
+    for record in sorted(records, key=lambda r: (r["script"], r["threads"], _node_order(r["node"]))):
+        print(f"{record['script']:13s} {record['threads']:7d} {record['node']:12s} "
+              f"{record['tps']:9.1f} {record['qps']:10.1f} {record.get('p50_ms') or float('nan'):8.2f} "
+              f"{record.get('p95_ms') or float('nan'):8.2f} {record.get('p99_ms') or float('nan'):8.2f} "
+              f"{record.get('errors_per_s', 0):7.2f}")
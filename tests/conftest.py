@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Deployment modules import from the repository root, services from utils/ as on the nodes
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
@@ -0,0 +1,252 @@
+import json
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+import benchmark
+from benchmark import (LatencyHistogram, compare_command, compare_runs, drive_open_loop, open_loop_report,
+                       run_async_benchmark, run_open_loop)
+from results_store import ResultStore
+from workload import Workload
+
+CONFIG = {"command": "open-loop", "rate": 100, "duration": 10, "workload": None, "arrival": "uniform",
+          "modes": ["RANDOM"], "store": "benchmark_store", "output": "out.json", "monitor": False}
+
+
+def open_loop_results(latency_ms, seed):
+    """Ten seconds of open-loop results, latencies scattered around latency_ms."""
+    rng = random.Random(seed)
+    stats = {kind: {"histogram": LatencyHistogram(), "errors": Counter(), "sent": 500} for kind in ("read", "write")}
+    for kind_stats in stats.values():
+        for _ in range(500):
+            kind_stats["histogram"].record(rng.uniform(0.8, 1.2) * latency_ms / 1000)
+    timeline = [{"ts": 1700000000 + second, "ok": 100, "errors": 0, "completed": 100 + rng.randint(-2, 2)}
+                for second in range(10)]
+    return {"RANDOM": open_loop_report(stats, 10.0, offered_rate=100, duration=10, timeline=timeline)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / "store"))
+
+
+def test_compare_flags_latency_regression(store):
+    baseline = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=1))
+    # Only where the output goes differs, that does not make the runs incomparable
+    candidate = store.record_run("open-loop", dict(CONFIG, output="other.json"), open_loop_results(10, seed=2))
+
+    findings = {finding["metric"]: finding for finding in compare_runs(store, baseline, candidate, resamples=200)}
+
+    assert findings["read_p99_ms"]["regression"]
+    assert findings["write_p50_ms"]["change"] == pytest.approx(1.0, abs=0.1)
+    assert findings["throughput"]["significant"] is not None
+    assert not findings["throughput"]["regression"]
+
+
+def test_compare_rejects_different_settings(store):
+    baseline = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=1))
+    candidate = store.record_run("open-loop", dict(CONFIG, rate=200), open_loop_results(5, seed=2))
+
+    with pytest.raises(ValueError, match=r"rate \(100 -> 200\)"):
+        compare_runs(store, baseline, candidate, resamples=200)
+    assert compare_runs(store, baseline, candidate, resamples=200, allow_mismatch=True)
+
+
+def test_compare_rejects_different_commands(store):
+    baseline = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=1))
+    candidate = store.record_run("replay", CONFIG, open_loop_results(5, seed=2))
+
+    with pytest.raises(ValueError, match="command"):
+        compare_runs(store, baseline, candidate, resamples=200)
+
+
+def test_compare_rejects_modes_missing_from_a_run(store):
+    baseline = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=1))
+    candidate = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=2))
+
+    with pytest.raises(ValueError, match="DIRECT_HIT"):
+        compare_runs(store, baseline, candidate, modes=["RANDOM", "DIRECT_HIT"], resamples=200)
+
+
+def test_compare_command_exit_status(store, capsys):
+    baseline = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=1))
+    regressed = store.record_run("open-loop", CONFIG, open_loop_results(10, seed=2))
+    other_workload = store.record_run("open-loop", dict(CONFIG, workload="zipf.json"), open_loop_results(5, seed=3))
+
+    def run(candidate, allow_mismatch=False):
+        return compare_command(SimpleNamespace(
+            store=store.root, baseline=baseline, candidate=candidate, modes=None, alpha=0.05,
+            min_change=0.05, resamples=200, allow_mismatch=allow_mismatch,
+        ))
+
+    assert run(regressed) == 1
+    assert run(other_workload) == 2
+    assert "workload (None -> 'zipf.json')" in capsys.readouterr().out
+    run(other_workload, allow_mismatch=True)
+    assert "Warning: runs differ in workload" in capsys.readouterr().out
+
+
+def test_recorded_config_round_trips(store):
+    run_id = store.record_run("open-loop", CONFIG, open_loop_results(5, seed=1))
+    row = store.runs().iloc[0]
+    assert row["run_id"] == run_id
+    assert json.loads(row["config"]) == CONFIG
+
+
+@pytest.mark.parametrize("cli, workload_think_time, expected", [
+    (None, None, 0),
+    (None, 0.05, 0.05),
+    (0.2, 0.05, 0.2),
+    (0, 0.05, 0),
+])
+def test_think_time_option_overrides_workload(monkeypatch, cli, workload_think_time, expected):
+    driver_args = []
+
+    class Pool:
+        def __init__(self, processes):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+        def map(self, function, args):
+            driver_args.extend(args)
+            empty = {"histogram": LatencyHistogram().to_dict(), "errors": {}}
+            return [{"read": empty, "write": empty} for _ in args]
+
+    monkeypatch.setattr(benchmark.multiprocessing, "Pool", Pool)
+    spec = dict(Workload.default(0.5).spec, think_time=workload_think_time)
+    report = run_async_benchmark("127.0.0.1:5000", users=4, processes=2, think_time=cli, workload=Workload(spec))
+
+    # (gatekeeper, users, ramp_up, steady_state, spec, think_time, ...) of every driver
+    assert [args[5] for args in driver_args] == [expected, expected]
+    assert report["think_time"] == expected
+
+
+def test_histogram_percentiles_of_known_samples():
+    histogram = LatencyHistogram()
+    for ms in range(100, 0, -1):
+        histogram.record(ms / 1000)
+
+    # Each percentile is the top of the bucket holding the sample: 32 us wide
+    # at 50 ms, 64 us at 90-100 ms, capped by the largest sample
+    assert histogram.summary() == {
+        "count": 100, "p50_ms": 50.015, "p90_ms": 90.047, "p99_ms": 99.007, "p99.9_ms": 100.0, "max_ms": 100.0,
+    }
+
+
+def test_histogram_is_exact_below_2048_us_and_within_0_1_percent_above():
+    for value_us in (0, 1, 999, 2047):
+        histogram = LatencyHistogram()
+        histogram.record(value_us / 1_000_000)
+        assert histogram.percentile(50) == value_us / 1000
+
+    rng = random.Random(0)
+    for _ in range(1000):
+        value_us = rng.randint(2048, 10 ** 8)
+        histogram = LatencyHistogram()
+        histogram.record(value_us / 1_000_000)
+        histogram.record(10 ** 9 / 1_000_000)  # keeps the max cap out of the way
+        bucket_top = histogram.percentile(50) * 1000
+        assert value_us <= bucket_top <= value_us * (1 + 2 ** -10)
+
+
+def test_histogram_merge_and_round_trip():
+    whole, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for ms in range(1, 201):
+        whole.record(ms / 1000)
+        (first if ms % 2 else second).record(ms / 1000)
+    first.merge(second)
+    assert first.summary() == whole.summary()
+    assert LatencyHistogram.from_dict(json.loads(json.dumps(whole.to_dict()))).summary() == whole.summary()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def time(self):
+        return 1_700_000_000 + self.now
+
+
+class InlineExecutor:
+    """Runs every submitted request at once, so the fake clock alone decides the timings."""
+
+    def __init__(self, max_workers):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def submit(self, function, *args):
+        function(*args)
+
+
+@pytest.fixture
+def fake_cluster(monkeypatch):
+    """Fake clock and a gatekeeper answering every query after service_time seconds."""
+    clock = FakeClock()
+    cluster = SimpleNamespace(clock=clock, service_time=0.0, sent=[])
+
+    class Response:
+        status_code = 200
+        headers = {}
+
+    def post(url, json, headers=None, timeout=None):
+        cluster.sent.append((clock.now, json["query"]))
+        clock.now += cluster.service_time
+        return Response()
+
+    monkeypatch.setattr(benchmark, "time", clock)
+    monkeypatch.setattr(benchmark.requests, "post", post)
+    monkeypatch.setattr(benchmark.concurrent.futures, "ThreadPoolExecutor", InlineExecutor)
+    return cluster
+
+
+def test_open_loop_measures_from_the_intended_send_time(fake_cluster):
+    # One request per ms for a cluster that takes 10 ms each, one at a time:
+    # every request waits for the previous ones and that wait counts
+    fake_cluster.service_time = 0.010
+    schedule = [(i / 1000, "read", "SELECT 1", []) for i in range(5)]
+    stats, start, timeline = drive_open_loop("127.0.0.1:5000", schedule)
+
+    assert [sent for sent, _ in fake_cluster.sent] == pytest.approx([0, 0.010, 0.020, 0.030, 0.040])
+    values, counts = stats["read"]["histogram"].buckets_ms()
+    assert list(counts) == [1] * 5
+    assert list(values) == pytest.approx([10, 19, 28, 37, 46], rel=1e-3)
+    assert stats["read"]["sent"] == 5
+    assert timeline[1_700_000_000]["completed"] == 5
+
+
+def test_uniform_schedule_sends_at_fixed_intervals(fake_cluster):
+    report = run_open_loop("127.0.0.1:5000", rate=100, duration=0.1, seed=1)
+
+    assert [sent for sent, _ in fake_cluster.sent] == pytest.approx([i / 100 for i in range(10)])
+    assert report["read"]["sent"] + report["write"]["sent"] == 10
+    assert report["elapsed"] == 0.1
+
+
+def test_poisson_schedule_is_reproducible_from_its_seed(fake_cluster):
+    run_open_loop("127.0.0.1:5000", rate=1000, duration=1, arrival="poisson", seed=7)
+    first = list(fake_cluster.sent)
+    fake_cluster.sent.clear()
+    fake_cluster.clock.now = 0.0
+    run_open_loop("127.0.0.1:5000", rate=1000, duration=1, arrival="poisson", seed=7)
+
+    assert fake_cluster.sent == first
+    gaps = [b - a for (a, _), (b, _) in zip(first, first[1:])]
+    assert sum(gaps) / len(gaps) == pytest.approx(1 / 1000, rel=0.1)
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+import bundle
+
+
+def fake_pip(monkeypatch, wheels):
+    """pip download that saves `wheels` into --dest and prints nothing."""
+
+    def run(command, **kwargs):
+        dest = command[command.index("--dest") + 1]
+        for name in wheels:
+            open(os.path.join(dest, name), "w").close()
+
+    monkeypatch.setattr(bundle.subprocess, "run", run)
+
+
+def test_download_wheels_returns_only_this_resolution(tmp_path, monkeypatch):
+    open(tmp_path / "flask-2.0.0-py3-none-any.whl", "w").close()  # left by an older build
+    fake_pip(monkeypatch, ["flask-3.0.3-py3-none-any.whl", "Jinja2-3.1.6-py3-none-any.whl",
+                           "mysql_connector_python-9.0.0-py2.py3-none-any.whl"])
+
+    wheels = bundle.download_wheels(str(tmp_path), ["flask", "mysql-connector-python"])
+
+    assert [os.path.basename(path) for path in wheels] == [
+        "Jinja2-3.1.6-py3-none-any.whl",
+        "flask-3.0.3-py3-none-any.whl",
+        "mysql_connector_python-9.0.0-py2.py3-none-any.whl",
+    ]
+    assert all(os.path.exists(path) for path in wheels)
+
+
+def test_download_wheels_raises_when_a_package_is_not_resolved(tmp_path, monkeypatch):
+    fake_pip(monkeypatch, ["flask-3.0.3-py3-none-any.whl"])
+    with pytest.raises(RuntimeError, match="requests"):
+        bundle.download_wheels(str(tmp_path), ["flask", "requests"])
+
+    fake_pip(monkeypatch, [])
+    with pytest.raises(RuntimeError, match="flask"):
+        bundle.download_wheels(str(tmp_path), ["flask"])
@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+import boto3  # noqa: E402
+
+import cloudwatch  # noqa: E402
+from cloudwatch import METRICS, MetricCollector  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        yield boto3.client("cloudwatch", region_name="us-east-1")
+
+
+def put(client, instance_id, metric, moment, value):
+    client.put_metric_data(
+        Namespace="AWS/EC2",
+        MetricData=[{
+            "MetricName": metric,
+            "Dimensions": [{"Name": "InstanceId", "Value": instance_id}],
+            "Timestamp": moment,
+            "Value": value,
+        }],
+    )
+
+
+def test_collect_batches_queries_and_splits_them_per_instance(client, tmp_path, monkeypatch):
+    # 3 instances x 5 metrics = 15 queries, sent 4 at a time
+    monkeypatch.setattr(cloudwatch, "MAX_QUERIES", 4)
+    calls = []
+    client.meta.events.register(
+        "before-parameter-build.cloudwatch.GetMetricData",
+        lambda params, **kwargs: calls.append(len(params["MetricDataQueries"])),
+    )
+
+    # Two hours back, so the window has settled and gets cached
+    now = datetime.datetime.now(datetime.timezone.utc)
+    minute = (now - datetime.timedelta(hours=2)).replace(minute=10, second=0, microsecond=0)
+    instances = {"manager": "i-0000000000000001", "worker1": "i-0000000000000002", "worker2": "i-0000000000000003"}
+    for index, instance_id in enumerate(instances.values()):
+        for metric in METRICS:
+            put(client, instance_id, metric, minute, 10 * (index + 1))
+            put(client, instance_id, metric, minute + datetime.timedelta(seconds=20), 10 * (index + 1) + 2)
+
+    collector = MetricCollector(cache_dir=str(tmp_path), client=client)
+    start, end = minute - datetime.timedelta(minutes=5), minute + datetime.timedelta(minutes=5)
+    series = collector.collect(instances, start, end)
+
+    assert calls == [4, 4, 4, 3]
+    assert set(series) == set(instances)
+    for index, name in enumerate(instances):
+        expected = 10 * (index + 1)
+        assert series[name]["CPUUtilization"] == [(minute, expected + 1)]  # Average
+        assert series[name]["NetworkIn"] == [(minute, 2 * expected + 2)]  # Sum
+
+    # Settled windows come from the cache, without any request
+    calls.clear()
+    assert collector.collect(instances, start, end) == series
+    assert calls == []
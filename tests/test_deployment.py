@@ -0,0 +1,107 @@
+import glob
+import os
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+import main  # noqa: E402
+from topology import Topology  # noqa: E402
+
+TOPOLOGIES = sorted(glob.glob(os.path.join(main.__file__.rpartition(os.sep)[0], "topologies", "*.json")))
+
+
+@pytest.fixture
+def aws(tmp_path, monkeypatch):
+    """A moto account, with the key pair and state files kept out of the tree."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AMI_ID", "ami-12c6146b")  # an image moto knows
+    with moto.mock_aws():
+        yield
+
+
+@pytest.mark.parametrize("path", TOPOLOGIES, ids=os.path.basename)
+def test_launch_ready_cleanup_leaves_nothing(aws, path):
+    topology = Topology.load(path)
+    state = main.DeploymentState("deployment_state.json")
+    ec2 = main.EC2Class(state, topology)
+    # The user-data only names the bundle, it is never read here
+    state.record(bundle_path="build/cluster-bundle-0123456789ab.tar.gz")
+    ec2.create_key_pair()
+
+    instances = ec2.launch_instances()
+    assert sorted(i.name for i in instances) == sorted(topology.instances())
+    time_to_ready = ec2.wait_until_ready(instances, probe=False)
+    assert set(time_to_ready) == {i.name for i in instances}
+
+    timings, failures = ec2.cleanup(instances)
+    assert failures == {}
+
+    client = ec2.ec2_client
+    states = [
+        instance["State"]["Name"]
+        for reservation in client.describe_instances()["Reservations"]
+        for instance in reservation["Instances"]
+    ]
+    assert set(states) == {"terminated"}
+    assert client.describe_vpcs(Filters=[{"Name": "vpc-id", "Values": [ec2.vpc_id]}])["Vpcs"] == []
+    assert client.describe_subnets(Filters=[{"Name": "vpc-id", "Values": [ec2.vpc_id]}])["Subnets"] == []
+    assert client.describe_internet_gateways(
+        Filters=[{"Name": "internet-gateway-id", "Values": [ec2.igw["InternetGatewayId"]]}]
+    )["InternetGateways"] == []
+    assert client.describe_key_pairs()["KeyPairs"] == []
+    assert [
+        group for group in client.describe_security_groups()["SecurityGroups"]
+        if group["GroupName"] != "default"
+    ] == []
+
+
+def test_cleanup_of_a_partial_deployment_creates_nothing(aws):
+    # Interrupted right after the VPC: nothing else was recorded
+    state = main.DeploymentState("deployment_state.json")
+    client = main.boto3.client("ec2", region_name="us-east-1")
+    vpc_id = client.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    state.record(vpc_id=vpc_id, topology=Topology().to_dict())
+    vpcs_before = len(client.describe_vpcs()["Vpcs"])
+    groups_before = len(client.describe_security_groups()["SecurityGroups"])
+
+    ec2 = main.EC2Class(main.DeploymentState("deployment_state.json"), provision=False)
+    timings, failures = ec2.cleanup(ec2.attach_instances())
+
+    assert failures == {}
+    assert set(timings) == {"instances", "key_pair", "vpc"}
+    assert len(client.describe_vpcs()["Vpcs"]) == vpcs_before - 1
+    assert len(client.describe_security_groups()["SecurityGroups"]) < groups_before
+    assert client.describe_internet_gateways()["InternetGateways"] == []
+
+
+def test_failed_provisioning_records_nothing(aws, monkeypatch):
+    state = main.DeploymentState("deployment_state.json")
+
+    def refuse(*args, **kwargs):
+        raise main.ClientError({"Error": {"Code": "VpcLimitExceeded", "Message": ""}}, "CreateVpc")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(main.boto3, "client", lambda *a, **k: type("C", (), {"create_vpc": refuse})())
+        with pytest.raises(main.ClientError):
+            main.EC2Class(state)
+
+    assert not state.exists()
+    assert not main.DeploymentState("deployment_state.json").exists()
+
+
+def test_key_pair_phase_again_reuses_the_key(aws):
+    ec2 = main.EC2Class(main.DeploymentState("deployment_state.json"))
+    ec2.create_key_pair()
+    fingerprint = ec2.ec2_client.describe_key_pairs()["KeyPairs"][0]["KeyFingerprint"]
+    with open(ec2.ssh_key_path) as f:
+        private_key = f.read()
+
+    ec2.create_key_pair()
+
+    assert ec2.ec2_client.describe_key_pairs()["KeyPairs"][0]["KeyFingerprint"] == fingerprint
+    with open(ec2.ssh_key_path) as f:
+        assert f.read() == private_key
@@ -0,0 +1,59 @@
+import socket
+import sqlite3
+import time
+
+import pytest
+import requests
+
+from local_cluster import LocalCluster
+
+
+def free_base_port(count):
+    """First of count consecutive ports nobody listens on."""
+    for _ in range(20):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            base = sock.getsockname()[1]
+        if base + count < 65536 and all(_free(port) for port in range(base, base + count)):
+            return base
+    pytest.skip("no free port range")
+
+
+def _free(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(("127.0.0.1", port)) != 0
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    cluster = LocalCluster(str(tmp_path), workers=1, base_port=free_base_port(5))
+    try:
+        cluster.start(timeout=60)
+        yield cluster
+    finally:
+        cluster.stop()
+
+
+def test_read_and_write_through_the_gatekeeper(cluster):
+    url = f"http://127.0.0.1:{cluster.ports['gatekeeper']}/query"
+
+    read = requests.post(url, json={"query": "SELECT first_name FROM actor WHERE actor_id = %s", "params": [1]},
+                         timeout=10)
+    assert read.status_code == 200
+    assert len(read.json()["result"]) == 1
+
+    write = requests.post(url, json={"query": "INSERT INTO actor (first_name, last_name) VALUES (%s, %s)",
+                                     "params": ["SMOKE", "TEST"]}, timeout=10)
+    assert write.status_code == 200
+
+    # The manager replicates to the workers in the background
+    deadline = time.time() + 10
+    for role in ("manager", "worker1"):
+        while True:
+            conn = sqlite3.connect(f"{cluster.workdir}/{role}.db")
+            rows = conn.execute("SELECT COUNT(*) FROM actor WHERE first_name = 'SMOKE'").fetchone()[0]
+            conn.close()
+            if rows or time.time() > deadline:
+                break
+            time.sleep(0.1)
+        assert rows == 1, role
@@ -0,0 +1,26 @@
+import threading
+
+from metrics import Metrics
+
+
+def test_concurrent_threads_spread_across_stripes():
+    metrics = Metrics("test", stripes=16)
+    barrier = threading.Barrier(32)
+    used = set()
+    lock = threading.Lock()
+
+    def record():
+        # Every thread is alive at once, so none of them reuses another's ident
+        barrier.wait()
+        metrics.inc("http_requests_total", {"route": "/"})
+        with lock:
+            used.add(id(metrics._stripe()))
+
+    threads = [threading.Thread(target=record) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(used) == 16
+    assert 'http_requests_total{service="test",route="/"} 32' in metrics.render()
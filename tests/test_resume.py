@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+import main
+
+
+class FakeEC2:
+    """Records the phases main() runs, the push fails while `fail_push` is set."""
+
+    calls = []
+    fail_push = False
+
+    def __init__(self, state, topology, provision=True):
+        self.state = state
+        if provision and "vpc_id" not in state.resources:
+            state.record(vpc_id="vpc-1", topology=topology.to_dict())
+
+    def __getattr__(self, name):
+        def phase(*args, **kwargs):
+            FakeEC2.calls.append(name)
+            return []
+        return phase
+
+    def launch_instances(self):
+        FakeEC2.calls.append("launch_instances")
+        self.state.record_instance("manager", "i-1")
+        return []
+
+    def push_bundle(self):
+        FakeEC2.calls.append("push_bundle")
+        if FakeEC2.fail_push:
+            raise RuntimeError("Upload failed for manager")
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "EC2Class", FakeEC2)
+    monkeypatch.setattr(main.os, "system", lambda command: 0)
+    FakeEC2.calls = []
+
+    def run(*argv):
+        topology = os.path.join(os.path.dirname(main.__file__), "topologies", "default.json")
+        monkeypatch.setattr(sys, "argv", ["main.py", "--topology", topology, *argv])
+        main.main()
+
+    return run
+
+
+def test_resume_after_a_failed_phase_runs_only_what_is_left(run):
+    FakeEC2.fail_push = True
+    with pytest.raises(RuntimeError):
+        run("deploy", "--keep")
+    state = main.DeploymentState("deployment_state.json")
+    assert state.phases == ["key_pair", "bundle", "instances", "ready", "inbound_rules", "ip_files"]
+
+    FakeEC2.fail_push = False
+    FakeEC2.calls = []
+    run("resume", "--keep")
+    assert FakeEC2.calls == [
+        "launch_instances", "push_bundle", "wait_for_bootstrap", "run_sys_bench",
+    ]
+    assert main.DeploymentState("deployment_state.json").phases[-1] == "benchmark"
+
+    # A second deploy is refused, the state records a live deployment
+    with pytest.raises(SystemExit):
+        run("deploy")
+
+
+def test_resume_from_key_pair_is_refused_while_instances_run(run):
+    FakeEC2.fail_push = False
+    run("deploy", "--keep")
+    with pytest.raises(SystemExit, match="key_pair"):
+        run("resume", "--from", "key_pair")
+    with pytest.raises(SystemExit, match="instances"):
+        run("resume", "--from", "instances")
+    FakeEC2.calls = []
+    run("resume", "--from", "push", "--keep")
+    assert FakeEC2.calls[:2] == ["launch_instances", "push_bundle"]
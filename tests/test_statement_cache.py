@@ -0,0 +1,78 @@
+import mysql.connector
+from mysql.connector import errorcode
+
+import statement_cache
+from statement_cache import PreparedConnections, StatementCache
+
+
+class FakeCursor:
+    def __init__(self, conn, prepared):
+        self.conn = conn
+        self.prepared = prepared
+        self.closed = False
+        self.with_rows = True
+
+    def execute(self, query, params=None):
+        if self.prepared:
+            self.conn.prepares.append(query)
+            if query.startswith("SHOW"):
+                raise mysql.connector.ProgrammingError(errno=errorcode.ER_UNSUPPORTED_PS)
+        else:
+            self.conn.text_queries.append(query)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, **config):
+        self.prepares = []
+        self.text_queries = []
+        self.autocommit = False
+
+    def cursor(self, prepared=False):
+        return FakeCursor(self, prepared)
+
+
+def test_least_recently_used_statement_is_evicted_and_closed():
+    cache = StatementCache(FakeConnection(), capacity=2)
+    first, _ = cache.get("SELECT 1")
+    cache.get("SELECT 2")
+    cache.get("SELECT 1")  # now the most recently used
+    cache.get("SELECT 3")
+
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert not first.closed
+    assert cache.get("SELECT 1")[0] is first
+    cache.get("SELECT 2")  # was evicted, prepared again
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_pool_counts_hits_and_misses(monkeypatch):
+    monkeypatch.setattr(statement_cache.mysql.connector, "connect", FakeConnection)
+    pool = PreparedConnections({}, capacity=8)
+    for _ in range(3):
+        pool.execute("SELECT * FROM actor WHERE actor_id = %s", [1])
+    pool.execute("SELECT * FROM film WHERE film_id = %s", [1])
+
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 0)
+    assert stats["hit_rate"] == 0.5
+    assert stats["connections"] == 1
+    assert stats["cached_statements"] == 2
+
+
+def test_unsupported_statement_is_not_prepared_again(monkeypatch):
+    monkeypatch.setattr(statement_cache.mysql.connector, "connect", FakeConnection)
+    pool = PreparedConnections({}, capacity=8)
+    for _ in range(3):
+        assert pool.execute("SHOW TABLES") == [(1,)]
+
+    conn = pool._caches[0].conn
+    assert conn.prepares == ["SHOW TABLES"]
+    assert conn.text_queries == ["SHOW TABLES"] * 3
+    assert conn.autocommit
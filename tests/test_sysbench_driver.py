@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from sysbench_driver import parse_output, print_table
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_print_table_orders_nodes_naturally(capsys):
+    print_table([
+        {"script": "read_only", "threads": 4, "node": node, "tps": 100.0, "qps": 1600.0}
+        for node in ("worker10", "worker2", "manager", "worker1")
+    ])
+    rows = capsys.readouterr().out.splitlines()[1:]
+    assert [row.split()[2] for row in rows] == ["manager", "worker1", "worker2", "worker10"]
+
+
+def test_parse_output_reads_summary_and_histogram():
+    record = parse_output((FIXTURES / "oltp_read_only.txt").read_text())
+    assert record["tps"] == 166.61
+    assert record["qps"] == 2665.76
+    assert (record["reads"], record["writes"], record["other"]) == (140000, 0, 20000)
+    assert record["errors_per_s"] == 0.0
+    assert record["total_time_s"] == 60.0185
+    assert record["events"] == 10000
+    assert (record["min_ms"], record["avg_ms"], record["max_ms"]) == (4.21, 5.64, 9.87)
+    assert record["p95_ms"] == 6.09
+    # 10000 samples: the 5000th falls in the 5.567 row, the 9900th in the 7.559 row
+    assert record["p50_ms"] == 5.567
+    assert record["p99_ms"] == 7.559
+
+
+def test_parse_output_rejects_other_output():
+    with pytest.raises(ValueError):
+        parse_output("sysbench 1.0.18 (using system LuaJIT 2.1.0-beta3)\nFATAL: Cannot connect\n")
@@ -0,0 +1,25 @@
+import pytest
+
+from topology import Topology
+
+
+def test_instances_number_workers_and_several_proxies():
+    assert list(Topology(workers=2, proxies=2).instances()) == [
+        "worker1", "worker2", "manager", "proxy1", "proxy2", "trusted_host", "gatekeeper",
+    ]
+    assert "proxy" in Topology().instances()
+
+
+def test_cluster_placement_rejects_t2_instances():
+    with pytest.raises(ValueError, match="t2"):
+        Topology(placement_strategy="cluster")
+    Topology(
+        placement_strategy="cluster",
+        instance_types={role: "c5.large" for role in ("manager", "worker", "proxy", "trusted_host", "gatekeeper")},
+    )
+
+
+def test_spread_placement_is_limited_to_seven_instances():
+    Topology(workers=3, placement_strategy="spread")
+    with pytest.raises(ValueError, match="at most 7"):
+        Topology(workers=4, placement_strategy="spread")
@@ -0,0 +1,69 @@
+from flask import Flask
+
+import benchmark
+from benchmark import SpanCollector, drive_open_loop
+from tracing import SERVER_TIMING_HEADER, Tracer
+
+UPSTREAM_TIMING = 'worker1-execute;dur=1.500;desc="db", worker1-total;dur=2.000'
+
+
+def traced_app():
+    app = Flask("proxy")
+    tracer = Tracer("proxy")
+    tracer.instrument(app)
+
+    class Upstream:
+        headers = {SERVER_TIMING_HEADER: UPSTREAM_TIMING}
+
+    @app.route("/query", methods=["POST"])
+    def query():
+        with tracer.span("upstream", desc="worker1"):
+            tracer.add_upstream_timing(Upstream())
+        return "ok"
+
+    return app
+
+
+def test_server_timing_parses_into_spans():
+    response = traced_app().test_client().post("/query", headers={"X-Request-Timing": "1"})
+    collector = SpanCollector()
+    collector.add(response.headers[SERVER_TIMING_HEADER])
+    collector.add(response.headers[SERVER_TIMING_HEADER])
+
+    assert set(collector.spans) == {"proxy-upstream[worker1]", "proxy-total", "worker1-execute[db]", "worker1-total"}
+    assert collector.spans["worker1-execute[db]"] == [1.5, 1.5]
+    summary = collector.summary()
+    assert summary["worker1-total"]["count"] == 2
+    assert summary["worker1-total"]["p99_ms"] == 2.0
+
+
+def test_server_timing_is_only_sent_on_request():
+    response = traced_app().test_client().post("/query")
+    assert SERVER_TIMING_HEADER not in response.headers
+
+
+def test_merge_adds_spans_of_other_drivers():
+    collector = SpanCollector()
+    collector.add("proxy-total;dur=3")
+    collector.merge({"proxy-total": [5.0], "worker1-total": [1.0]})
+    assert collector.spans == {"proxy-total": [3.0, 5.0], "worker1-total": [1.0]}
+
+
+def test_open_loop_collects_spans(monkeypatch):
+    sent_headers = []
+
+    class Response:
+        status_code = 200
+        headers = {SERVER_TIMING_HEADER: UPSTREAM_TIMING}
+
+    def post(url, json, headers=None, timeout=None):
+        sent_headers.append(headers)
+        return Response()
+
+    monkeypatch.setattr(benchmark.requests, "post", post)
+    collector = SpanCollector()
+    schedule = [(0, "read", "SELECT 1", []), (0, "write", "INSERT 1", [])]
+    drive_open_loop("127.0.0.1:5000", schedule, max_in_flight=2, span_collector=collector)
+
+    assert sent_headers == [{"X-Request-Timing": "1"}] * 2
+    assert collector.spans["worker1-execute[db]"] == [1.5, 1.5]
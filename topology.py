@@ -0,0 +1,94 @@
+import json
+from dataclasses import dataclass, field
+
+ROLES = ("manager", "worker", "proxy", "trusted_host", "gatekeeper")
+
+DEFAULT_INSTANCE_TYPES = {
+    "manager": "t2.micro",
+    "worker": "t2.micro",
+    "proxy": "t2.large",
+    "trusted_host": "t2.large",
+    "gatekeeper": "t2.large",
+}
+
+PLACEMENT_STRATEGIES = ("cluster", "spread", "partition")
+
+# A spread placement group holds at most 7 running instances per availability zone
+SPREAD_LIMIT = 7
+
+# Instance families a cluster placement group does not accept
+NO_CLUSTER_PLACEMENT = ("t2.",)
+
+
+@dataclass
+class Topology:
+    """
+    Shape of the cluster, loaded from a JSON topology file:
+
+        {
+            "workers": 8,
+            "proxies": 2,    # optional, replicas the trusted host balances across
+            "instance_types": {"worker": "t2.micro", "proxy": "t2.large"},  # others keep their default
+            "availability_zone": "us-east-1a",
+            "placement_strategy": "partition"   # optional, no placement group when left out
+        }
+    """
+
+    workers: int = 2
+    proxies: int = 1
+    instance_types: dict[str, str] = field(default_factory=lambda: dict(DEFAULT_INSTANCE_TYPES))
+    availability_zone: str = "us-east-1a"
+    placement_strategy: str | None = None
+
+    def __post_init__(self):
+        if self.workers < 1:
+            raise ValueError("A topology needs at least one worker")
+        if self.proxies < 1:
+            raise ValueError("A topology needs at least one proxy")
+        unknown = set(self.instance_types) - set(ROLES)
+        if unknown:
+            raise ValueError(f"Unknown roles in instance_types: {', '.join(sorted(unknown))}")
+        self.instance_types = {**DEFAULT_INSTANCE_TYPES, **self.instance_types}
+        if self.placement_strategy not in (None, *PLACEMENT_STRATEGIES):
+            raise ValueError(f"Unknown placement strategy: {self.placement_strategy}")
+        if self.placement_strategy == "cluster":
+            burstable = sorted(
+                role for role, instance_type in self.instance_types.items()
+                if instance_type.startswith(NO_CLUSTER_PLACEMENT)
+            )
+            if burstable:
+                raise ValueError(
+                    f"A cluster placement group does not accept t2 instances, used by {', '.join(burstable)}"
+                )
+        if self.placement_strategy == "spread" and len(self.instances()) > SPREAD_LIMIT:
+            raise ValueError(
+                f"A spread placement group holds at most {SPREAD_LIMIT} instances, "
+                f"this topology has {len(self.instances())}"
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+    def instances(self):
+        """
+        Instance name -> role: worker1..workerN, manager, the proxy (proxy1..proxyN
+        when there are several), trusted_host and gatekeeper.
+        """
+        names = {f"worker{i + 1}": "worker" for i in range(self.workers)}
+        for role in ROLES:
+            if role == "proxy" and self.proxies > 1:
+                names.update({f"proxy{i + 1}": "proxy" for i in range(self.proxies)})
+            elif role != "worker":
+                names[role] = role
+        return names
+
+    def to_dict(self):
+        return {
+            "workers": self.workers,
+            "proxies": self.proxies,
+            "instance_types": self.instance_types,
+            "availability_zone": self.availability_zone,
+            "placement_strategy": self.placement_strategy,
+        }
@@ -0,0 +1,38 @@
+import os
+
+# Port every service listens on when an address carries no explicit port
+DEFAULT_PORT = 5000
+
+
+def service_url(address, path=""):
+    """
+    Build the URL of a cluster service. Addresses are either a bare host
+    (EC2 deployment, port 5000) or "host:port" (local cluster harness, one
+    port per service).
+    """
+    if ":" not in address:
+        address = f"{address}:{DEFAULT_PORT}"
+    return f"http://{address}{path}"
+
+
+# The resource sampler of a service listens on its port + SAMPLER_PORT_OFFSET
+SAMPLER_PORT_OFFSET = 1000
+
+# Role -> address files written by the deployment. Services call each other on
+# the VPC addresses; the public ones are for the operator (SSH, benchmarks)
+PRIVATE_ADDRESSES_FILE = "private_ips.json"
+PUBLIC_ADDRESSES_FILE = "public_ips.json"
+
+
+def addresses_path():
+    """
+    The role -> address file services call each other with: the private
+    addresses of an EC2 deployment, or the public_ips.json of the local
+    cluster harness, whose services all run on this host.
+    """
+    return PRIVATE_ADDRESSES_FILE if os.path.exists(PRIVATE_ADDRESSES_FILE) else PUBLIC_ADDRESSES_FILE
+
+
+# Routing mode the trusted host forwards each query with, so that every proxy
+# replica routes it the same way whatever mode it was started or left in
+MODE_HEADER = "X-Routing-Mode"
@@ -1,18 +1,48 @@
+import os
+import threading
+import time
 import requests
 import json
 from flask import Flask, request, jsonify
 import logging
 
+from cluster import SAMPLER_PORT_OFFSET, service_url
+from membership import Membership
+from metrics import Metrics
+from sampler import ResourceSampler
+from tracing import Tracer
+
 app = Flask(__name__)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# read "public_ips.json" file to get the public IPs of the workers
-with open("public_ips.json", "r") as f:
-    public_ips = json.load(f)
+# Request, latency and upstream metrics, served on GET /metrics
+metrics = Metrics("gatekeeper")
+metrics.instrument(app)
+
+# Trace id propagation and per-hop span timings
+tracer = Tracer("gatekeeper", metrics)
+tracer.instrument(app)
+
+# Sub-second CPU, memory, context switch and network samples for benchmarks
+sampler = ResourceSampler()
+
+# Address of the trusted host, private inside the VPC. Follows the address
+# file only: the gatekeeper is public, it serves no PUT /membership
+membership = Membership(select=lambda role: role == "trusted_host")
 
-trusted_host_ip = public_ips["trusted_host"]
+# Optional JSON lines log of incoming queries, replayable with "benchmark.py replay"
+query_log = (
+    open(os.environ["QUERY_LOG"], "a", buffering=1) if os.getenv("QUERY_LOG") else None
+)
+query_log_lock = threading.Lock()
+
+
+def log_query(query, params):
+    line = json.dumps({"ts": time.time(), "query": query, "params": params})
+    with query_log_lock:
+        query_log.write(line + "\n")
 
 
 @app.route("/", methods=["GET"])
@@ -23,15 +53,31 @@ def home():
 @app.route("/query", methods=["POST"])
 def query():
     try:
-        data = request.json
-        query = data.get("query")
+        with tracer.span("receive"):
+            data = request.json
+            query = data.get("query")
+            params = data.get("params", [])
 
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
-        url = f"http://{trusted_host_ip}:5000/query"
-        response = requests.post(url, json={"query": query})
-        return jsonify(response.json()), response.status_code
+        if query_log:
+            log_query(query, params)
+
+        url = service_url(membership.addresses["trusted_host"], "/query")
+        with tracer.span("upstream", desc="trusted_host"):
+            response = metrics.call_upstream(
+                "trusted_host",
+                requests.post,
+                url,
+                json={"query": query, "params": params},
+                headers=tracer.headers(),
+            )
+        tracer.add_upstream_timing(response)
+
+        with tracer.span("serialize"):
+            body = jsonify(response.json())
+        return body, response.status_code
 
     except Exception as e:
         app.logger.error(f"Error executing query: {e}")
@@ -40,8 +86,10 @@ def query():
 
 @app.route("/mode", methods=["GET"])
 def get_mode():
-    url = f"http://{trusted_host_ip}:5000/mode"
-    response = requests.get(url)
+    url = service_url(membership.addresses["trusted_host"], "/mode")
+    response = metrics.call_upstream(
+        "trusted_host", requests.get, url, headers=tracer.headers()
+    )
     return jsonify(response.json()), response.status_code
 
 
@@ -49,10 +97,21 @@ def get_mode():
 def set_mode():
     data = request.json
     mode = data.get("mode")
-    url = f"http://{trusted_host_ip}:5000/mode"
-    response = requests.post(url, json={"mode": mode})
+    url = service_url(membership.addresses["trusted_host"], "/mode")
+    response = metrics.call_upstream(
+        "trusted_host",
+        requests.post,
+        url,
+        json={"mode": mode},
+        headers=tracer.headers(),
+    )
     return jsonify(response.json()), response.status_code
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    port = int(os.getenv("PORT", "5000"))
+    # The debug reloader runs this file twice, only the serving child samples
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        sampler.start(port=port + SAMPLER_PORT_OFFSET)
+        membership.watch()
+    app.run(host="0.0.0.0", port=port, debug=True)
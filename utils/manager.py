@@ -1,10 +1,17 @@
+import concurrent.futures
 import os
-import mysql.connector
+import time
 import requests
-import json
 from flask import Flask, request, jsonify
 import logging
 
+from cluster import SAMPLER_PORT_OFFSET, service_url
+from membership import Membership
+from metrics import Metrics
+from sampler import ResourceSampler
+from statement_cache import PreparedConnections
+from tracing import Tracer
+
 app = Flask(__name__)
 
 # MySQL configurations (using environment variables for security)
@@ -16,9 +23,48 @@ app.config["MYSQL_DATABASE_HOST"] = os.getenv("MYSQL_HOST", "localhost")
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# read "public_ips.json" file to get the public IPs of the workers
-with open("public_ips.json", "r") as f:
-    public_ips = json.load(f)
+# Request, latency and upstream metrics, served on GET /metrics
+metrics = Metrics("manager")
+metrics.instrument(app)
+
+# Trace id propagation and per-hop span timings
+tracer = Tracer("manager", metrics)
+tracer.instrument(app)
+
+# Sub-second CPU, memory, context switch and network samples for benchmarks
+sampler = ResourceSampler()
+
+if os.getenv("DB_BACKEND") == "sqlite":
+    # Local cluster harness: SQLite stand-in loaded with a sakila subset
+    from sqlite_backend import SQLiteConnections
+
+    db = SQLiteConnections(os.getenv("SQLITE_PATH", "sakila.db"))
+else:
+    # Pooled persistent connections, each caching its server-side prepared statements
+    db = PreparedConnections(
+        {
+            "user": app.config["MYSQL_DATABASE_USER"],
+            "password": app.config["MYSQL_DATABASE_PASSWORD"],
+            "host": app.config["MYSQL_DATABASE_HOST"],
+            "database": app.config["MYSQL_DATABASE_DB"],
+        },
+        capacity=int(os.getenv("STATEMENT_CACHE_SIZE", "128")),
+    )
+    sampler.add_source("mysql", db.server_status)
+db.register_metrics(metrics)
+metrics.describe(
+    "db_query_duration_seconds", "histogram", "Time spent executing SQL, by kind."
+)
+
+# Addresses of the workers writes are replicated to, private ones inside the
+# VPC. Swapped live from the address file or PUT /membership, removed workers drain
+membership = Membership(select=lambda role: role.startswith("worker"))
+membership.instrument(app, metrics)
+
+# Writes reach every worker at once, write latency does not grow with the worker count
+replication_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=32, thread_name_prefix="replicate"
+)
 
 
 @app.route("/", methods=["GET"])
@@ -26,79 +72,101 @@ def home():
     return "Manager instance"
 
 
+def replicate(name, ip, payload, headers):
+    """Send a write to one worker, counted in flight until it answers."""
+    with membership.use(name, ip):
+        return metrics.call_upstream(
+            name,
+            requests.post,
+            service_url(ip, "/query"),
+            json=payload,
+            headers=headers,
+        )
+
+
 @app.route("/query", methods=["POST"])
 def query():
     try:
-        data = request.json
-        query = data.get("query")
+        with tracer.span("receive"):
+            data = request.json
+            query = data.get("query")
+            params = data.get("params") or []
 
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
+        if not isinstance(params, list):
+            return jsonify({"error": "params must be a list"}), 400
+
         # Check if the query is a read or write query
         is_write_query = (
             query.strip().lower().startswith(("insert", "update", "delete"))
         )
 
-        # Open a new database connection using mysql-connector-python
-        conn = mysql.connector.connect(
-            user=app.config["MYSQL_DATABASE_USER"],
-            password=app.config["MYSQL_DATABASE_PASSWORD"],
-            host=app.config["MYSQL_DATABASE_HOST"],
-            database=app.config["MYSQL_DATABASE_DB"],
+        start_time = time.perf_counter()
+        with tracer.span("db"):
+            result = db.execute(query, params)
+        metrics.observe(
+            "db_query_duration_seconds",
+            {"kind": "write" if is_write_query else "read"},
+            time.perf_counter() - start_time,
         )
-        cursor = conn.cursor()
 
         if is_write_query:
-            # For write queries, execute and commit the transaction
-            cursor.execute(query)
-            conn.commit()
-
             app.logger.info(
                 "Write query executed successfully by manager (replicated on workers)"
             )
 
-            # Contact the workers with the write query
-            for (
-                name,
-                ip,
-            ) in public_ips.items():  # Access both key (worker name) and value (IP)
-                if not name.startswith("worker"):
-                    continue
-                response = requests.post(
-                    f"http://{ip}:5000/query",
-                    json={"query": query},
-                )
+            # Contact the workers with the write query, all at once. The tracer
+            # lives in the request context, so it is only used from this thread
+            workers = membership.addresses
+            headers = tracer.headers()
+            with tracer.span("upstream", desc="workers"):
+                futures = {
+                    name: replication_pool.submit(
+                        replicate,
+                        name,
+                        ip,
+                        {"query": query, "params": params},
+                        headers,
+                    )
+                    for name, ip in workers.items()
+                }
+                responses = {name: future.result() for name, future in futures.items()}
+            for name, response in responses.items():
+                tracer.add_upstream_timing(response)
                 app.logger.info(
-                    f"Response from worker {name} ({ip}): {response.json()}"
+                    f"Response from worker {name} ({workers[name]}): {response.json()}"
                 )
 
-            return (
-                jsonify(
+            with tracer.span("serialize"):
+                body = jsonify(
                     {
                         "message": "Write query executed successfully by manager (replicated on workers)",
                     }
-                ),
-                200,
-            )
+                )
+            return body, 200
         else:
-            # For read queries, execute and fetch the result
-            cursor.execute(query)
-            result = cursor.fetchall()
-
             app.logger.info("Read query executed successfully by manager")
 
-            return jsonify(result), 200
+            with tracer.span("serialize"):
+                body = jsonify(result)
+            return body, 200
 
     except Exception as e:
         app.logger.error(f"Error executing query: {e}")
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()  # Ensure the connection is closed
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({"statement_cache": db.stats()}), 200
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    port = int(os.getenv("PORT", "5000"))
+    # The debug reloader runs this file twice, only the serving child samples
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        sampler.start(port=port + SAMPLER_PORT_OFFSET)
+        membership.watch()
+    app.run(host="0.0.0.0", port=port, debug=True)
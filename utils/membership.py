@@ -0,0 +1,159 @@
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import jsonify, request
+
+from cluster import addresses_path
+
+logger = logging.getLogger(__name__)
+
+
+class Membership:
+    """
+    Role -> address of the services this one calls, kept to the roles
+    `select` accepts. The mapping is never mutated: an update builds a new
+    one and swaps it in, so a request that read `addresses` once keeps a
+    consistent view while members come and go.
+
+    Updates come from the address file, re-read when it changes, or from
+    PUT /membership. A member that is removed (or moved to another
+    address) stops receiving new calls at once and is reported as
+    draining until the calls already sent to it through `use` return.
+    """
+
+    def __init__(self, select=lambda role: True, path=None):
+        self.select = select
+        self.path = path or addresses_path()
+        self.lock = threading.Lock()
+        self.in_flight = collections.Counter()  # (role, address) -> calls in progress
+        self.draining = set()  # (role, address) removed with calls still in progress
+        self.failed_until = {}  # (role, address) -> monotonic time until which it is avoided
+        self._turn = 0
+        self._file_version = None
+        self.addresses = {}
+        self.reload()
+
+    def update(self, addresses):
+        """Swap in a new member set, return the (role, address) pairs now draining."""
+        addresses = {role: address for role, address in addresses.items() if self.select(role)}
+        with self.lock:
+            removed = set(self.addresses.items()) - set(addresses.items())
+            self.draining |= {member for member in removed if self.in_flight[member]}
+            self.draining -= set(addresses.items())  # added back before it drained
+            self.addresses = addresses
+        if removed:
+            logger.info(f"Membership: removed {sorted(removed)}, {len(self.draining)} draining")
+        return removed
+
+    def reload(self):
+        """Re-read the address file if it changed since the last read."""
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+            if version == self._file_version:
+                return False
+            with open(self.path, "r") as f:
+                addresses = json.load(f)
+        except ValueError:
+            # Caught while being rewritten, the next poll sees the whole file
+            return False
+        self.update(addresses)
+        self._file_version = version
+        return True
+
+    def watch(self, interval=1.0):
+        """Poll the address file in the background, applying every change."""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except OSError as e:
+                    logger.warning(f"Membership: cannot read {self.path}: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def ranked(self, addresses):
+        """
+        The (role, address) pairs of addresses in the order to try them:
+        fewest calls in flight first, ties taken in turn, members that
+        recently failed last.
+        """
+        members = list(addresses.items())
+        now = time.monotonic()
+        with self.lock:
+            self._turn += 1
+            shift = self._turn % len(members) if members else 0
+            members = members[shift:] + members[:shift]
+            return sorted(
+                members,
+                key=lambda member: (self.failed_until.get(member, 0) > now, self.in_flight[member]),
+            )
+
+    def mark_failed(self, role, address, seconds=5.0):
+        """Try this member last for a while, it could not be reached."""
+        with self.lock:
+            self.failed_until[(role, address)] = time.monotonic() + seconds
+        logger.warning(f"Membership: {role} ({address}) unreachable, avoided for {seconds}s")
+
+    @contextlib.contextmanager
+    def use(self, role, address):
+        """Count a call to a member as in flight while it runs."""
+        member = (role, address)
+        with self.lock:
+            self.in_flight[member] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight[member] -= 1
+                if not self.in_flight[member]:
+                    del self.in_flight[member]
+                    if member in self.draining:
+                        self.draining.discard(member)
+                        logger.info(f"Membership: {role} ({address}) drained")
+
+    def status(self):
+        with self.lock:
+            return {
+                "members": self.addresses,
+                "draining": [
+                    {"role": role, "address": address, "in_flight": self.in_flight[(role, address)]}
+                    for role, address in sorted(self.draining)
+                ],
+            }
+
+    def instrument(self, app, metrics=None):
+        """Serve the member set on GET /membership and replace it on PUT /membership."""
+
+        @app.route("/membership", methods=["GET"])
+        def get_membership():
+            return jsonify(self.status()), 200
+
+        @app.route("/membership", methods=["PUT"])
+        def put_membership():
+            addresses = request.json
+            if not isinstance(addresses, dict) or not all(
+                isinstance(address, str) for address in addresses.values()
+            ):
+                return jsonify({"error": "Expected a JSON object of role -> address"}), 400
+            self.update(addresses)
+            return jsonify(self.status()), 200
+
+        if metrics is not None:
+            metrics.describe("membership_members", "gauge", "Services this one currently calls.")
+            metrics.describe(
+                "membership_draining", "gauge", "Removed members with calls still in flight."
+            )
+            metrics.add_collector(
+                lambda: [
+                    ("membership_members", {}, len(self.addresses)),
+                    ("membership_draining", {}, len(self.draining)),
+                ]
+            )
@@ -0,0 +1,239 @@
+import itertools
+import threading
+import time
+
+from flask import Response, g, request
+
+# Latency buckets in seconds, from sub-millisecond hops up to slow queries
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class _Stripe:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+
+class Metrics:
+    """
+    Prometheus-style counters, gauges and histograms for one service.
+
+    Updates go to one of several independently locked stripes, handed out
+    in turn to threads the first time they record something, so concurrent
+    requests rarely wait on each other. Stripes are only summed when
+    /metrics is scraped.
+    """
+
+    def __init__(self, service, stripes=16):
+        self.service = service
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._next_stripe = itertools.count()
+        self._local = threading.local()
+        self._meta = {}  # name -> (type, help)
+        self._collectors = []
+
+        self.describe(
+            "http_requests_total",
+            "counter",
+            "HTTP requests handled, by route and status.",
+        )
+        self.describe(
+            "http_request_errors_total",
+            "counter",
+            "HTTP requests that raised or returned a 5xx.",
+        )
+        self.describe(
+            "http_requests_in_flight", "gauge", "HTTP requests currently being handled."
+        )
+        self.describe(
+            "http_request_duration_seconds",
+            "histogram",
+            "Time spent handling a request, by route.",
+        )
+        self.describe(
+            "upstream_requests_total",
+            "counter",
+            "Calls to upstream services, by upstream and status.",
+        )
+        self.describe(
+            "upstream_errors_total",
+            "counter",
+            "Upstream calls that raised or returned a 5xx.",
+        )
+        self.describe(
+            "upstream_request_duration_seconds",
+            "histogram",
+            "Time spent waiting on an upstream, by upstream.",
+        )
+
+    def describe(self, name, metric_type, help_text):
+        self._meta[name] = (metric_type, help_text)
+
+    def add_collector(self, collector):
+        """Register a callable returning (name, labels dict, value) samples at scrape time."""
+        self._collectors.append(collector)
+
+    def _stripe(self):
+        # Thread idents are page aligned on Linux, a modulo of them always picks the same stripe
+        stripe = getattr(self._local, "stripe", None)
+        if stripe is None:
+            stripe = self._local.stripe = self._stripes[next(self._next_stripe) % len(self._stripes)]
+        return stripe
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        stripe = self._stripe()
+        with stripe.lock:
+            stripe.values[key] = stripe.values.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, tuple(sorted(labels.items())))
+        stripe = self._stripe()
+        with stripe.lock:
+            histogram = stripe.histograms.get(key)
+            if histogram is None:
+                histogram = stripe.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def call_upstream(self, upstream, fn, *args, **kwargs):
+        """Call fn (e.g. requests.post) and record its latency and outcome under upstream."""
+        start = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+        except Exception:
+            self.observe(
+                "upstream_request_duration_seconds",
+                {"upstream": upstream},
+                time.perf_counter() - start,
+            )
+            self.inc(
+                "upstream_requests_total", {"upstream": upstream, "status": "error"}
+            )
+            self.inc("upstream_errors_total", {"upstream": upstream})
+            raise
+        self.observe(
+            "upstream_request_duration_seconds",
+            {"upstream": upstream},
+            time.perf_counter() - start,
+        )
+        self.inc(
+            "upstream_requests_total",
+            {"upstream": upstream, "status": str(response.status_code)},
+        )
+        if response.status_code >= 500:
+            self.inc("upstream_errors_total", {"upstream": upstream})
+        return response
+
+    def instrument(self, app):
+        """Record request metrics for every route of app and serve them on GET /metrics."""
+
+        @app.before_request
+        def _start_request_timer():
+            g._metrics_start = time.perf_counter()
+            self.inc("http_requests_in_flight")
+
+        @app.after_request
+        def _record_status(response):
+            g._metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def _record_request(exc):
+            start = g.pop("_metrics_start", None)
+            if start is None:
+                return
+            self.inc("http_requests_in_flight", value=-1)
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            status = 500 if exc is not None else g.pop("_metrics_status", 500)
+            self.observe(
+                "http_request_duration_seconds",
+                {"route": route},
+                time.perf_counter() - start,
+            )
+            self.inc(
+                "http_requests_total",
+                {"route": route, "method": request.method, "status": str(status)},
+            )
+            if status >= 500:
+                self.inc("http_request_errors_total", {"route": route})
+
+        @app.route("/metrics", methods=["GET"])
+        def metrics():
+            return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    def _snapshot(self):
+        values = {}
+        histograms = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key, value in stripe.values.items():
+                    values[key] = values.get(key, 0) + value
+                for key, histogram in stripe.histograms.items():
+                    total = histograms.get(key)
+                    if total is None:
+                        histograms[key] = list(histogram)
+                    else:
+                        for i, count in enumerate(histogram):
+                            total[i] += count
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                values[(name, tuple(sorted(labels.items())))] = value
+        return values, histograms
+
+    def _labels(self, labels, extra=()):
+        pairs = (("service", self.service),) + tuple(labels) + tuple(extra)
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render(self):
+        values, histograms = self._snapshot()
+        lines = []
+        described = set()
+
+        def header(name):
+            if name in described:
+                return
+            described.add(name)
+            metric_type, help_text = self._meta.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(values.items()):
+            header(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}"
+                )
+            lines.append(
+                f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram[-1]}"
+            )
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+
+        return "\n".join(lines) + "\n"
@@ -1,11 +1,18 @@
+import concurrent.futures
+import os
 import time
 import requests
-import json
 from flask import Flask, request, jsonify
 import logging
 import random
 
-# "DIRECT_HIT", "RANDOM", "CUSTOMIZED"
+from cluster import MODE_HEADER, SAMPLER_PORT_OFFSET, service_url
+from membership import Membership
+from metrics import Metrics
+from sampler import ResourceSampler
+from tracing import Tracer
+
+MODES = ["DIRECT_HIT", "RANDOM", "CUSTOMIZED"]
 mode = "DIRECT_HIT"
 
 app = Flask(__name__)
@@ -13,16 +20,25 @@ app = Flask(__name__)
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# read "public_ips.json" file to get the public IPs of the workers
-with open("public_ips.json", "r") as f:
-    public_ips = json.load(f)
+# Request, latency and upstream metrics, served on GET /metrics
+metrics = Metrics("proxy")
+metrics.instrument(app)
+
+# Trace id propagation and per-hop span timings
+tracer = Tracer("proxy", metrics)
+tracer.instrument(app)
+
+# Sub-second CPU, memory, context switch and network samples for benchmarks
+sampler = ResourceSampler()
+
+# Addresses of the workers and manager, private ones inside the VPC. Swapped
+# live from the address file or PUT /membership, removed backends drain
+membership = Membership(select=lambda role: role.startswith(("worker", "manager")))
+membership.instrument(app, metrics)
 
-# filter out the ones that are not workers or manager
-public_ips = {
-    key: value
-    for key, value in public_ips.items()
-    if key.startswith(("worker", "manager"))
-}
+
+# CUSTOMIZED mode pings every candidate at once, not one after another
+ping_pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="ping")
 
 
 @app.route("/", methods=["GET"])
@@ -30,69 +46,91 @@ def home():
     return "Proxy instance"
 
 
+def ping_target(key, ip):
+    """Round trip time to a service, infinite when it does not answer."""
+    try:
+        start_time = time.time()
+        metrics.call_upstream(
+            f"{key}_ping",
+            requests.get,
+            service_url(ip, "/"),
+            timeout=2,
+        )
+        return time.time() - start_time
+    except requests.exceptions.RequestException:
+        return float("inf")
+
+
+def forward_query(target, address, query, params, **extra):
+    """Send the query to target and wrap its answer with routing details."""
+    url = service_url(address, "/query")
+    with tracer.span("upstream", desc=target), membership.use(target, address):
+        response = metrics.call_upstream(
+            target,
+            requests.post,
+            url,
+            json={"query": query, "params": params},
+            headers=tracer.headers(),
+        )
+    tracer.add_upstream_timing(response)
+
+    with tracer.span("serialize"):
+        response_data = {}
+        response_data["handled_by"] = target
+        response_data["result"] = response.json()
+        response_data.update(extra)
+        body = jsonify(response_data)
+    return body, response.status_code
+
+
 @app.route("/query", methods=["POST"])
 def query():
     try:
-        data = request.json
-        query = data.get("query")
+        with tracer.span("receive"):
+            data = request.json
+            query = data.get("query")
+            params = data.get("params", [])
 
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
+        # One view of the backends for the whole request, even if they change meanwhile
+        addresses = membership.addresses
+
         is_write_query = (
             query.strip().lower().startswith(("insert", "update", "delete"))
         )
 
         if is_write_query:
-            url = f"http://{public_ips['manager']}:5000/query"
-            response = requests.post(url, json={"query": query})
-            response_data = {}
-            response_data["handled_by"] = "manager"
-            response_data["result"] = response.json()
-            return jsonify(response_data), response.status_code
+            return forward_query("manager", addresses["manager"], query, params)
 
         else:
             global mode
-
-            if mode == "DIRECT_HIT":
-                url = f"http://{public_ips['manager']}:5000/query"
-                response = requests.post(url, json={"query": query})
-                response_data = {}
-                response_data["handled_by"] = "manager"
-                response_data["result"] = response.json()
-                return jsonify(response_data), response.status_code
-
-            elif mode == "RANDOM":
-                target = random.choice(list(public_ips))
-                ip = public_ips[target]
-                url = f"http://{ip}:5000/query"
-                response = requests.post(url, json={"query": query})
-                response_data = {}
-                response_data["handled_by"] = target
-                response_data["result"] = response.json()
-                return jsonify(response_data), response.status_code
-
-            elif mode == "CUSTOMIZED":
-                ping = {}
-                for key, ip in public_ips.items():
-                    if key.startswith("proxy"):
-                        continue
-                    try:
-                        start_time = time.time()
-                        requests.get(f"http://{ip}:5000/", timeout=2)
-                        ping[key] = time.time() - start_time
-                    except requests.exceptions.RequestException:
-                        ping[key] = float("inf")
+            # Queries from the trusted host carry its mode, the same on every proxy replica
+            routing = request.headers.get(MODE_HEADER)
+            if routing not in MODES:
+                routing = mode
+
+            if routing == "DIRECT_HIT":
+                return forward_query("manager", addresses["manager"], query, params)
+
+            elif routing == "RANDOM":
+                target = random.choice(list(addresses))
+                return forward_query(target, addresses[target], query, params)
+
+            elif routing == "CUSTOMIZED":
+                with tracer.span("ping"):
+                    futures = {
+                        key: ping_pool.submit(ping_target, key, ip)
+                        for key, ip in addresses.items()
+                        if not key.startswith("proxy")
+                    }
+                    ping = {key: future.result() for key, future in futures.items()}
 
                 worker_name = min(ping, key=ping.get)
-                ip = public_ips[worker_name]
-                url = f"http://{ip}:5000/query"
-                response = requests.post(url, json={"query": query})
-                response_data = {}
-                response_data["handled_by"] = worker_name
-                response_data["result"] = response.json()
-                response_data["pings"] = ping
-                return jsonify(response_data), response.status_code
+                return forward_query(
+                    worker_name, addresses[worker_name], query, params, pings=ping
+                )
 
     except Exception as e:
         app.logger.error(f"Error executing query: {e}")
@@ -111,7 +149,7 @@ def set_mode():
     try:
         data = request.json
         new_mode = data.get("mode")
-        if new_mode not in ["DIRECT_HIT", "RANDOM", "CUSTOMIZED"]:
+        if new_mode not in MODES:
             return jsonify({"error": "Invalid mode"}), 400
         mode = new_mode
         return jsonify({"mode": mode}), 200
@@ -121,4 +159,9 @@ def set_mode():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    port = int(os.getenv("PORT", "5000"))
+    # The debug reloader runs this file twice, only the serving child samples
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        sampler.start(port=port + SAMPLER_PORT_OFFSET)
+        membership.watch()
+    app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,135 @@
+import collections
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def read_node_cpu():
+    """(busy, total) jiffies of the whole node from /proc/stat."""
+    with open("/proc/stat", "r") as f:
+        fields = [int(value) for value in f.readline().split()[1:9]]
+    idle = fields[3] + fields[4]  # idle + iowait
+    total = sum(fields)
+    return total - idle, total
+
+
+def read_process_cpu():
+    """User + system CPU seconds used by this process."""
+    with open("/proc/self/stat", "r") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def read_process_status():
+    status = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key == "VmRSS":
+                status["rss_bytes"] = int(value.split()[0]) * 1024
+            elif key == "voluntary_ctxt_switches":
+                status["ctx_switches_voluntary"] = int(value)
+            elif key == "nonvoluntary_ctxt_switches":
+                status["ctx_switches_involuntary"] = int(value)
+    return status
+
+
+def read_network_bytes():
+    rx = tx = 0
+    with open("/proc/net/dev", "r") as f:
+        for line in f.readlines()[2:]:
+            interface, _, counters = line.partition(":")
+            if interface.strip() == "lo":
+                continue
+            fields = counters.split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+    return {"net_rx_bytes": rx, "net_tx_bytes": tx}
+
+
+class ResourceSampler:
+    """
+    Samples node and process resources at sub-second resolution into a ring
+    buffer, and serves them on GET /samples?since=<epoch seconds> from a
+    small HTTP server on its own port, so the benchmark driver can stream
+    them without going through the query path.
+
+    Counters (context switches, network bytes, MySQL status) are cumulative;
+    CPU is reported as a percentage over the last interval.
+    """
+
+    def __init__(self, interval=0.25, history=14400):
+        self.interval = interval
+        self.samples = collections.deque(maxlen=history)
+        self.sources = {}
+        self.lock = threading.Lock()
+
+    def add_source(self, name, source):
+        """Add a callable returning a dict of extra values for every sample."""
+        self.sources[name] = source
+
+    def start(self, port=None):
+        threading.Thread(target=self._run, daemon=True).start()
+        if port is not None:
+            threading.Thread(target=self._serve, args=(port,), daemon=True).start()
+
+    def _run(self):
+        last_node = read_node_cpu()
+        last_process = read_process_cpu()
+        last_time = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            node = read_node_cpu()
+            process = read_process_cpu()
+            now = time.monotonic()
+
+            node_busy = node[0] - last_node[0]
+            node_total = max(1, node[1] - last_node[1])
+            process_share = (process - last_process) / (now - last_time)
+            sample = {
+                "ts": time.time(),
+                "cpu_percent": 100 * node_busy / node_total,
+                "process_cpu_percent": 100 * process_share,
+            }
+            sample.update(read_process_status())
+            sample.update(read_network_bytes())
+            for name, source in self.sources.items():
+                try:
+                    sample[name] = source()
+                except Exception as e:
+                    sample[name] = {"error": str(e)}
+
+            with self.lock:
+                self.samples.append(sample)
+            last_node, last_process, last_time = node, process, now
+
+    def samples_since(self, since):
+        with self.lock:
+            return [sample for sample in self.samples if sample["ts"] > since]
+
+    def _serve(self, port):
+        sampler = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/samples":
+                    self.send_error(404)
+                    return
+                since = float(parse_qs(url.query).get("since", ["0"])[0])
+                body = json.dumps(sampler.samples_since(since)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # polled several times a second, keep the service log readable
+
+        ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
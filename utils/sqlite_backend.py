@@ -0,0 +1,66 @@
+import queue
+import sqlite3
+import threading
+
+
+class SQLiteConnections:
+    """
+    Lightweight stand-in for PreparedConnections backed by a local SQLite
+    file, used by the local cluster harness instead of MySQL. sqlite3 keeps
+    its own per-connection cache of compiled statements.
+    """
+
+    def __init__(self, path, pool_size=16):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._executed = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock:
+            self._connections += 1
+        return conn
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._lock:
+                self._connections -= 1
+
+    def execute(self, query, params=()):
+        """Execute a query and return its rows, or None if it has no result set."""
+        conn = self._acquire()
+        try:
+            # MySQL-style placeholders, so the same queries run on both backends
+            cursor = conn.execute(query.replace("%s", "?"), tuple(params))
+            rows = cursor.fetchall() if cursor.description is not None else None
+        finally:
+            self._release(conn)
+        with self._lock:
+            self._executed += 1
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "connections": self._connections,
+                "executed": self._executed,
+            }
+
+    def register_metrics(self, metrics):
+        metrics.describe("db_connections", "gauge", "Open pooled SQLite connections.")
+        metrics.add_collector(
+            lambda: [("db_connections", {}, self.stats()["connections"])]
+        )
@@ -0,0 +1,243 @@
+import queue
+import threading
+from collections import OrderedDict
+
+import mysql.connector
+from mysql.connector import errorcode
+
+# SHOW GLOBAL STATUS counters recorded by the resource sampler
+MYSQL_STATUS_COUNTERS = (
+    "Threads_running",
+    "Threads_connected",
+    "Questions",
+    "Innodb_rows_read",
+    "Innodb_rows_inserted",
+    "Innodb_rows_updated",
+    "Com_stmt_prepare",
+    "Com_stmt_execute",
+)
+
+
+class StatementCache:
+    """LRU cache of server-side prepared statements bound to one MySQL connection."""
+
+    def __init__(self, conn, capacity):
+        self.conn = conn
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # query text -> (prepared cursor, the exact query object it was prepared with)
+        self._entries = OrderedDict()
+        # query texts the server refused to prepare, least recently seen first
+        self._unsupported = OrderedDict()
+
+    def get(self, query):
+        entry = self._entries.get(query)
+        if entry is not None:
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        # mysql-connector only re-prepares when it sees a different query object,
+        # so we keep the first one around and always execute with it
+        entry = (self.conn.cursor(prepared=True), query)
+        self._entries[query] = entry
+        if len(self._entries) > self.capacity:
+            _, (cursor, _) = self._entries.popitem(last=False)
+            cursor.close()  # deallocates the statement on the server
+            self.evictions += 1
+        return entry
+
+    def is_unsupported(self, query):
+        if query in self._unsupported:
+            self._unsupported.move_to_end(query)
+            return True
+        return False
+
+    def mark_unsupported(self, query):
+        """Drop the statement and run it as plain text from now on."""
+        self.discard(query)
+        self._unsupported[query] = None
+        if len(self._unsupported) > self.capacity:
+            self._unsupported.popitem(last=False)
+
+    def discard(self, query):
+        entry = self._entries.pop(query, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except mysql.connector.Error:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        for cursor, _ in self._entries.values():
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+        self._entries.clear()
+
+
+class PreparedConnections:
+    """
+    Pool of persistent MySQL connections, each with its own statement cache,
+    so repeated queries are parsed once per connection instead of per request.
+    """
+
+    def __init__(self, config, capacity=128, pool_size=16):
+        self.config = config
+        self.capacity = capacity
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._caches = []
+        self._caches_lock = threading.Lock()
+        self._retired = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        conn = mysql.connector.connect(**self.config)
+        # Reads must not be pinned to a stale REPEATABLE READ snapshot, and
+        # writes commit as they run, without a separate COMMIT round trip
+        conn.autocommit = True
+        cache = StatementCache(conn, self.capacity)
+        with self._caches_lock:
+            self._caches.append(cache)
+        return cache
+
+    def _release(self, cache):
+        try:
+            self._idle.put_nowait(cache)
+        except queue.Full:
+            self._discard(cache)
+
+    def _discard(self, cache):
+        with self._caches_lock:
+            self._caches.remove(cache)
+            self._retired["hits"] += cache.hits
+            self._retired["misses"] += cache.misses
+            self._retired["evictions"] += cache.evictions
+        try:
+            cache.clear()
+            cache.conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def _execute_text(self, cache, query, params):
+        cursor = cache.conn.cursor()
+        try:
+            cursor.execute(query, tuple(params) or None)
+            return cursor.fetchall() if cursor.with_rows else None
+        finally:
+            cursor.close()
+
+    def execute(self, query, params=()):
+        """Execute a query and return its rows, or None if it has no result set."""
+        cache = self._acquire()
+        try:
+            if cache.is_unsupported(query):
+                rows = self._execute_text(cache, query, params)
+            else:
+                try:
+                    cursor, prepared_query = cache.get(query)
+                    cursor.execute(prepared_query, tuple(params))
+                    rows = cursor.fetchall() if cursor.with_rows else None
+                except mysql.connector.ProgrammingError as e:
+                    if e.errno != errorcode.ER_UNSUPPORTED_PS:
+                        raise
+                    # Some statements cannot be prepared, they are not tried again
+                    cache.mark_unsupported(query)
+                    rows = self._execute_text(cache, query, params)
+
+        except (mysql.connector.InterfaceError, mysql.connector.OperationalError):
+            # The connection is gone, drop it so the next request reconnects
+            self._discard(cache)
+            raise
+
+        except Exception:
+            self._release(cache)
+            raise
+
+        self._release(cache)
+        return rows
+
+    def server_status(self, names=MYSQL_STATUS_COUNTERS):
+        """Current values of SHOW GLOBAL STATUS counters, bypassing the statement cache."""
+        cache = self._acquire()
+        try:
+            cursor = cache.conn.cursor()
+            try:
+                placeholders = ", ".join(["%s"] * len(names))
+                cursor.execute(
+                    f"SHOW GLOBAL STATUS WHERE Variable_name IN ({placeholders})",
+                    tuple(names),
+                )
+                status = {name: int(value) for name, value in cursor.fetchall()}
+            finally:
+                cursor.close()
+
+        except (mysql.connector.InterfaceError, mysql.connector.OperationalError):
+            self._discard(cache)
+            raise
+
+        except Exception:
+            self._release(cache)
+            raise
+
+        self._release(cache)
+        return status
+
+    def stats(self):
+        with self._caches_lock:
+            caches = list(self._caches)
+            totals = dict(self._retired)
+        for cache in caches:
+            totals["hits"] += cache.hits
+            totals["misses"] += cache.misses
+            totals["evictions"] += cache.evictions
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+        totals["connections"] = len(caches)
+        totals["cached_statements"] = sum(len(cache) for cache in caches)
+        totals["capacity_per_connection"] = self.capacity
+        return totals
+
+    def register_metrics(self, metrics):
+        """Export the statement cache counters through a Metrics registry."""
+        metrics.describe(
+            "statement_cache_hits_total", "counter", "Prepared statement cache hits."
+        )
+        metrics.describe(
+            "statement_cache_misses_total",
+            "counter",
+            "Prepared statement cache misses (statement prepared).",
+        )
+        metrics.describe(
+            "statement_cache_evictions_total",
+            "counter",
+            "Prepared statements evicted by the LRU.",
+        )
+        metrics.describe(
+            "statement_cache_hit_ratio",
+            "gauge",
+            "Share of lookups served from the cache.",
+        )
+        metrics.describe("db_connections", "gauge", "Open pooled MySQL connections.")
+
+        def collect():
+            stats = self.stats()
+            return [
+                ("statement_cache_hits_total", {}, stats["hits"]),
+                ("statement_cache_misses_total", {}, stats["misses"]),
+                ("statement_cache_evictions_total", {}, stats["evictions"]),
+                ("statement_cache_hit_ratio", {}, stats["hit_rate"]),
+                ("db_connections", {}, stats["connections"]),
+            ]
+
+        metrics.add_collector(collect)
@@ -0,0 +1,83 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, request
+
+# Trace id shared by every hop of one query
+TRACE_HEADER = "X-Trace-Id"
+# Clients send "X-Request-Timing: 1" to get a Server-Timing breakdown back
+TIMING_REQUEST_HEADER = "X-Request-Timing"
+SERVER_TIMING_HEADER = "Server-Timing"
+
+
+class Tracer:
+    """
+    Propagates a trace id across hops and records how long each phase of a
+    request takes (receive, upstream wait, DB execute, serialize).
+
+    When the client asks for it, the spans of this service and of every
+    upstream hop are returned in a Server-Timing header, each entry named
+    "<service>-<span>".
+    """
+
+    def __init__(self, service, metrics=None):
+        self.service = service
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe(
+                "span_duration_seconds",
+                "histogram",
+                "Time spent in each traced phase of a request.",
+            )
+
+    def instrument(self, app):
+        @app.before_request
+        def _start_trace():
+            g.trace_id = request.headers.get(TRACE_HEADER) or uuid.uuid4().hex
+            g.trace_timing = request.headers.get(TIMING_REQUEST_HEADER) == "1"
+            g.trace_spans = []
+            g.trace_upstream_timing = []
+            g.trace_start = time.perf_counter()
+
+        @app.after_request
+        def _finish_trace(response):
+            if "trace_id" not in g:
+                return response
+            self._record("total", time.perf_counter() - g.trace_start)
+            response.headers[TRACE_HEADER] = g.trace_id
+            if g.trace_timing:
+                entries = [
+                    f"{self.service}-{name};dur={seconds * 1000:.3f}"
+                    + (f';desc="{desc}"' if desc else "")
+                    for name, desc, seconds in g.trace_spans
+                ]
+                entries.extend(g.trace_upstream_timing)
+                response.headers[SERVER_TIMING_HEADER] = ", ".join(entries)
+            return response
+
+    @contextmanager
+    def span(self, name, desc=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start, desc)
+
+    def _record(self, name, seconds, desc=None):
+        g.trace_spans.append((name, desc, seconds))
+        if self.metrics is not None:
+            self.metrics.observe("span_duration_seconds", {"span": name}, seconds)
+
+    def headers(self):
+        """Headers to send upstream so the next hop joins the same trace."""
+        headers = {TRACE_HEADER: g.trace_id}
+        if g.trace_timing:
+            headers[TIMING_REQUEST_HEADER] = "1"
+        return headers
+
+    def add_upstream_timing(self, response):
+        """Pass the upstream's Server-Timing entries back to our caller."""
+        timing = response.headers.get(SERVER_TIMING_HEADER)
+        if timing and g.trace_timing:
+            g.trace_upstream_timing.append(timing)
@@ -1,18 +1,45 @@
+import concurrent.futures
+import os
 import requests
-import json
+import urllib3
 from flask import Flask, request, jsonify
 import logging
 
+from cluster import MODE_HEADER, SAMPLER_PORT_OFFSET, service_url
+from membership import Membership
+from metrics import Metrics
+from sampler import ResourceSampler
+from tracing import Tracer
+
 app = Flask(__name__)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# read "public_ips.json" file to get the public IPs of the workers
-with open("public_ips.json", "r") as f:
-    public_ips = json.load(f)
+# Request, latency and upstream metrics, served on GET /metrics
+metrics = Metrics("trusted_host")
+metrics.instrument(app)
+
+# Trace id propagation and per-hop span timings
+tracer = Tracer("trusted_host", metrics)
+tracer.instrument(app)
+
+# Sub-second CPU, memory, context switch and network samples for benchmarks
+sampler = ResourceSampler()
+
+# Addresses of the proxy replicas, private ones inside the VPC, swapped live on change
+membership = Membership(select=lambda role: role.startswith("proxy"))
+membership.instrument(app, metrics)
+
+# Routing mode every proxy applies to the queries forwarded from here, None
+# until set: each proxy then routes with its own mode
+mode = None
 
-proxy_ip = public_ips["proxy"]
+# Mode changes reach every proxy at once
+broadcast_pool = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="broadcast")
+
+# Seconds to wait for a proxy to accept the connection before trying another one
+CONNECT_TIMEOUT = 2
 
 
 @app.route("/", methods=["GET"])
@@ -20,41 +47,138 @@ def home():
     return "Trusted host instance"
 
 
+def never_sent(error):
+    """True when the proxy refused or never accepted the connection, so it never saw the query."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
 @app.route("/query", methods=["POST"])
 def query():
     try:
-        data = request.json
-        query = data.get("query")
+        with tracer.span("receive"):
+            data = request.json
+            query = data.get("query")
+            params = data.get("params", [])
 
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
-        url = f"http://{proxy_ip}:5000/query"
-        response = requests.post(url, json={"query": query})
-        return jsonify(response.json()), response.status_code
+        is_write_query = (
+            query.strip().lower().startswith(("insert", "update", "delete"))
+        )
+
+        headers = tracer.headers()
+        if mode is not None:
+            headers[MODE_HEADER] = mode
+
+        # The least busy proxy, the next one if it cannot be reached. A write
+        # is only retried when it never left, so it is never applied twice
+        candidates = membership.ranked(membership.addresses)
+        if not candidates:
+            return jsonify({"error": "No proxy available"}), 503
+        for attempt, (name, ip) in enumerate(candidates):
+            try:
+                with tracer.span("upstream", desc=name), membership.use(name, ip):
+                    response = metrics.call_upstream(
+                        name,
+                        requests.post,
+                        service_url(ip, "/query"),
+                        json={"query": query, "params": params},
+                        headers=headers,
+                        timeout=(CONNECT_TIMEOUT, None),
+                    )
+                break
+            except requests.exceptions.ConnectionError as e:
+                if (is_write_query and not never_sent(e)) or attempt == len(candidates) - 1:
+                    raise
+                membership.mark_failed(name, ip)
+        tracer.add_upstream_timing(response)
+
+        with tracer.span("serialize"):
+            body = jsonify(response.json())
+        return body, response.status_code
 
     except Exception as e:
         app.logger.error(f"Error executing query: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def call_proxies(method, path, **kwargs):
+    """name -> response of every proxy at once, the exception for those that failed."""
+    futures = {
+        name: broadcast_pool.submit(
+            metrics.call_upstream,
+            name,
+            method,
+            service_url(ip, path),
+            timeout=(CONNECT_TIMEOUT, None),
+            **kwargs,
+        )
+        for name, ip in membership.addresses.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except requests.exceptions.RequestException as e:
+            results[name] = e
+    return results
+
+
 @app.route("/mode", methods=["GET"])
 def get_mode():
-    # call proxy to get the mode
-    url = f"http://{proxy_ip}:5000/mode"
-    response = requests.get(url)
-    return jsonify(response.json()), response.status_code
+    if mode is not None:
+        return jsonify({"mode": mode}), 200
+    # Not set through here yet, report the proxies' own modes
+    results = call_proxies(requests.get, "/mode", headers=tracer.headers())
+    modes = {
+        name: result.json().get("mode")
+        for name, result in results.items()
+        if not isinstance(result, Exception) and result.status_code == 200
+    }
+    if not modes:
+        return jsonify({"error": "No proxy answered"}), 502
+    if len(set(modes.values())) > 1:
+        return jsonify({"error": "Proxies disagree on the mode", "proxies": modes}), 409
+    return jsonify({"mode": next(iter(modes.values()))}), 200
 
 
 @app.route("/mode", methods=["POST"])
 def set_mode():
-    # call proxy to set the mode
+    # Every proxy validates and keeps the mode, the queries sent from here carry it
+    global mode
     data = request.json
-    mode = data.get("mode")
-    url = f"http://{proxy_ip}:5000/mode"
-    response = requests.post(url, json={"mode": mode})
-    return jsonify(response.json()), response.status_code
+    new_mode = data.get("mode")
+    results = call_proxies(requests.post, "/mode", json={"mode": new_mode}, headers=tracer.headers())
+    if not results:
+        return jsonify({"error": "No proxy available"}), 503
+    rejected = {
+        name: result.json()
+        for name, result in results.items()
+        if not isinstance(result, Exception) and result.status_code == 400
+    }
+    if rejected:
+        return jsonify(next(iter(rejected.values()))), 400
+    mode = new_mode
+    unreachable = {
+        name: str(result) if isinstance(result, Exception) else result.status_code
+        for name, result in results.items()
+        if isinstance(result, Exception) or result.status_code != 200
+    }
+    if unreachable:
+        # Still applied to their queries through the header, reported all the same
+        app.logger.warning(f"Mode {mode} not stored by {sorted(unreachable)}")
+        return jsonify({"mode": mode, "not_stored": unreachable}), 200
+    return jsonify({"mode": mode}), 200
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    port = int(os.getenv("PORT", "5000"))
+    # The debug reloader runs this file twice, only the serving child samples
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        sampler.start(port=port + SAMPLER_PORT_OFFSET)
+        membership.watch()
+    app.run(host="0.0.0.0", port=port, debug=True)
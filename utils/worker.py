@@ -1,8 +1,14 @@
 import os
-import mysql.connector
+import time
 from flask import Flask, request, jsonify
 import logging
 
+from cluster import SAMPLER_PORT_OFFSET
+from metrics import Metrics
+from sampler import ResourceSampler
+from statement_cache import PreparedConnections
+from tracing import Tracer
+
 app = Flask(__name__)
 
 # MySQL configurations (using environment variables for security)
@@ -14,6 +20,39 @@ app.config["MYSQL_DATABASE_HOST"] = os.getenv("MYSQL_HOST", "localhost")
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+# Request, latency and upstream metrics, served on GET /metrics
+metrics = Metrics("worker")
+metrics.instrument(app)
+
+# Trace id propagation and per-hop span timings
+tracer = Tracer("worker", metrics)
+tracer.instrument(app)
+
+# Sub-second CPU, memory, context switch and network samples for benchmarks
+sampler = ResourceSampler()
+
+if os.getenv("DB_BACKEND") == "sqlite":
+    # Local cluster harness: SQLite stand-in loaded with a sakila subset
+    from sqlite_backend import SQLiteConnections
+
+    db = SQLiteConnections(os.getenv("SQLITE_PATH", "sakila.db"))
+else:
+    # Pooled persistent connections, each caching its server-side prepared statements
+    db = PreparedConnections(
+        {
+            "user": app.config["MYSQL_DATABASE_USER"],
+            "password": app.config["MYSQL_DATABASE_PASSWORD"],
+            "host": app.config["MYSQL_DATABASE_HOST"],
+            "database": app.config["MYSQL_DATABASE_DB"],
+        },
+        capacity=int(os.getenv("STATEMENT_CACHE_SIZE", "128")),
+    )
+    sampler.add_source("mysql", db.server_status)
+db.register_metrics(metrics)
+metrics.describe(
+    "db_query_duration_seconds", "histogram", "Time spent executing SQL, by kind."
+)
+
 
 @app.route("/", methods=["GET"])
 def home():
@@ -23,51 +62,57 @@ def home():
 @app.route("/query", methods=["POST"])
 def query():
     try:
-        data = request.json
-        query = data.get("query")
+        with tracer.span("receive"):
+            data = request.json
+            query = data.get("query")
+            params = data.get("params") or []
 
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
+        if not isinstance(params, list):
+            return jsonify({"error": "params must be a list"}), 400
+
         # Check if the query is a read or write query
         is_write_query = (
             query.strip().lower().startswith(("insert", "update", "delete"))
         )
 
-        # Open a new database connection using mysql-connector-python
-        conn = mysql.connector.connect(
-            user=app.config["MYSQL_DATABASE_USER"],
-            password=app.config["MYSQL_DATABASE_PASSWORD"],
-            host=app.config["MYSQL_DATABASE_HOST"],
-            database=app.config["MYSQL_DATABASE_DB"],
+        start_time = time.perf_counter()
+        with tracer.span("db"):
+            result = db.execute(query, params)
+        metrics.observe(
+            "db_query_duration_seconds",
+            {"kind": "write" if is_write_query else "read"},
+            time.perf_counter() - start_time,
         )
-        cursor = conn.cursor()
 
         if is_write_query:
-            # For write queries, execute and commit the transaction
-            cursor.execute(query)
-            conn.commit()
-
             app.logger.info("Write query executed successfully")
 
-            return jsonify({"message": "Write query executed successfully"}), 200
+            with tracer.span("serialize"):
+                body = jsonify({"message": "Write query executed successfully"})
+            return body, 200
         else:
-            # For read queries, execute and fetch the result
-            cursor.execute(query)
-            result = cursor.fetchall()
             app.logger.info("Read query executed successfully")
 
-            return jsonify(result), 200
+            with tracer.span("serialize"):
+                body = jsonify(result)
+            return body, 200
 
     except Exception as e:
         app.logger.error(f"Error executing query: {e}")
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()  # Ensure the connection is closed
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({"statement_cache": db.stats()}), 200
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    port = int(os.getenv("PORT", "5000"))
+    # The debug reloader runs this file twice, only the serving child samples
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        sampler.start(port=port + SAMPLER_PORT_OFFSET)
+    app.run(host="0.0.0.0", port=port, debug=True)
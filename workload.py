@@ -0,0 +1,174 @@
+import bisect
+import datetime
+import itertools
+import json
+import random
+
+WRITE_PREFIXES = ("insert", "update", "delete")
+
+
+def is_write_query(query):
+    return query.strip().lower().startswith(WRITE_PREFIXES)
+
+
+class KeyDistribution:
+    """
+    Draws integer keys in [min, max].
+
+    - uniform: every key equally likely
+    - zipfian: key min + k - 1 has weight 1 / k^theta, so low ids are hot
+    - hotspot: hot_probability of draws land in the first hot_fraction of keys
+    """
+
+    def __init__(self, distribution="uniform", min=1, max=1000, theta=0.99,
+                 hot_fraction=0.2, hot_probability=0.8):
+        if distribution not in ("uniform", "zipfian", "hotspot"):
+            raise ValueError(f"Unknown key distribution: {distribution}")
+        self.distribution = distribution
+        self.min = min
+        self.max = max
+        self.hot_fraction = hot_fraction
+        self.hot_probability = hot_probability
+        if distribution == "zipfian":
+            weights = (1 / rank ** theta for rank in range(1, max - min + 2))
+            self._cumulative = list(itertools.accumulate(weights))
+
+    def sample(self, rng):
+        if self.distribution == "zipfian":
+            rank = bisect.bisect_left(self._cumulative, rng.random() * self._cumulative[-1])
+            return self.min + rank
+        if self.distribution == "hotspot":
+            hot_max = self.min + max(1, int((self.max - self.min + 1) * self.hot_fraction)) - 1
+            if rng.random() < self.hot_probability or hot_max >= self.max:
+                return rng.randint(self.min, hot_max)
+            return rng.randint(hot_max + 1, self.max)
+        return rng.randint(self.min, self.max)
+
+
+class Workload:
+    """
+    Weighted query templates loaded from a JSON workload file:
+
+        {
+            "name": "...",
+            "read_ratio": 0.8,          # optional, otherwise template weights decide
+            "think_time": 0.05,         # optional mean pause between a user's requests, --think-time overrides it
+            "keys": {"film_id": {"distribution": "zipfian", "min": 1, "max": 1000}},
+            "queries": [
+                {"name": "film_lookup", "weight": 5,
+                 "sql": "SELECT title FROM film WHERE film_id = %s",
+                 "params": ["$film_id"]}
+            ]
+        }
+
+    Parameters starting with "$" are drawn from the named key distribution,
+    anything else is sent as is. Reads and writes are told apart the same way
+    the proxy does, by the statement's first keyword.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.get("name", "workload")
+        self.read_ratio = spec.get("read_ratio")
+        self.think_time = spec.get("think_time")
+        self.keys = {name: KeyDistribution(**options) for name, options in spec.get("keys", {}).items()}
+
+        self.templates = {"read": [], "write": []}
+        for template in spec["queries"]:
+            for param in template.get("params", []):
+                if isinstance(param, str) and param.startswith("$") and param[1:] not in self.keys:
+                    raise ValueError(f"Query {template['name']} uses undefined key {param}")
+            kind = "write" if is_write_query(template["sql"]) else "read"
+            self.templates[kind].append(template)
+
+        self._choices = {
+            kind: (templates, list(itertools.accumulate(t.get("weight", 1) for t in templates)))
+            for kind, templates in self.templates.items()
+            if templates
+        }
+        if self.read_ratio is None:
+            all_templates = self.templates["read"] + self.templates["write"]
+            self._choices["any"] = (
+                all_templates, list(itertools.accumulate(t.get("weight", 1) for t in all_templates))
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def default(cls, read_ratio=0.5):
+        """The original benchmark: one actor lookup and one actor insert."""
+        return cls({
+            "name": "actor",
+            "read_ratio": read_ratio,
+            "queries": [
+                {"name": "actor_lookup", "sql": "SELECT * FROM actor LIMIT 1;"},
+                {"name": "actor_insert",
+                 "sql": "INSERT INTO actor (first_name, last_name) VALUES (%s, %s);",
+                 "params": ["Test", "User"]},
+            ],
+        })
+
+    def _pick(self, choice, rng):
+        templates, cumulative = self._choices[choice]
+        return templates[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+    def next_query(self, rng):
+        """Return (kind, template name, sql, params) for the next request."""
+        if self.read_ratio is None:
+            template = self._pick("any", rng)
+        else:
+            kind = "read" if rng.random() < self.read_ratio else "write"
+            if kind not in self._choices:
+                kind = "write" if kind == "read" else "read"
+            template = self._pick(kind, rng)
+
+        params = [
+            self.keys[param[1:]].sample(rng) if isinstance(param, str) and param.startswith("$") else param
+            for param in template.get("params", [])
+        ]
+        kind = "write" if is_write_query(template["sql"]) else "read"
+        return kind, template["name"], template["sql"], params
+
+
+def _timestamp(entry):
+    value = entry.get("ts", entry.get("timestamp"))
+    if value is None:
+        raise ValueError(f"Query log entry has no ts/timestamp: {entry}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def load_query_log(path):
+    """
+    Read a JSON lines query log ({"ts": ..., "query": ..., "params": [...]}
+    per line, ts in epoch seconds or ISO 8601) as (offset seconds, kind,
+    query, params) tuples ordered by time.
+    """
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries.append((_timestamp(entry), entry["query"], entry.get("params") or []))
+    entries.sort(key=lambda entry: entry[0])
+    if not entries:
+        return []
+    first = entries[0][0]
+    return [
+        (ts - first, "write" if is_write_query(query) else "read", query, params)
+        for ts, query, params in entries
+    ]
+
+
+if __name__ == "__main__":
+    # Print a few draws of a workload file to check it before a run
+    import sys
+
+    workload = Workload.load(sys.argv[1])
+    rng = random.Random(0)
+    for _ in range(int(sys.argv[2]) if len(sys.argv) > 2 else 10):
+        print(workload.next_query(rng))